@@ -0,0 +1,273 @@
+"""Benchmark suite for hfsm
+
+Description:
+    Measures event dispatch throughput against the number of states and
+    transitions, the hierarchy depth with propagate=True and the length of
+    guarded transition chains, as well as construction time for a large
+    machine and memory per StateMachine instance. Results are written as
+    JSON and can be compared against a stored baseline:
+
+        python benchmarks/run.py --output results.json
+        python benchmarks/run.py --baseline benchmarks/baseline.json
+
+    The script exits with status 1 if any result is worse than the
+    baseline by more than the tolerance.
+
+License:
+    Copyright 2020 Debby Nirwan
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import timeit
+import tracemalloc
+from typing import Any, Callable, Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from hfsm import State, Event, StateMachine, NormalTransition  # noqa: E402
+
+HIGHER_IS_BETTER = {"events/s": True, "s": False, "bytes": False}
+
+
+def build_ring(states: int, events: int) -> Tuple[StateMachine, List[Event]]:
+    state_machine = StateMachine("ring")
+    ring = [State(f"state{index}") for index in range(states)]
+    triggers = [Event(f"event{index}") for index in range(events)]
+    state_machine.add_state(ring[0], initial_state=True)
+    for state in ring[1:]:
+        state_machine.add_state(state)
+    for event in triggers:
+        state_machine.add_event(event)
+    for index, state in enumerate(ring):
+        for offset, event in enumerate(triggers):
+            state_machine.add_transition(
+                state, ring[(index + offset + 1) % states], event)
+    return state_machine, triggers
+
+
+def build_ring_bulk(states: int, events: int) -> StateMachine:
+    state_machine = StateMachine("ring")
+    ring = [State(f"state{index}") for index in range(states)]
+    triggers = [Event(f"event{index}") for index in range(events)]
+    state_machine.add_states(ring, initial_state=ring[0])
+    state_machine.add_events(triggers)
+    state_machine.add_transitions(
+        (state, ring[(index + offset + 1) % states], event)
+        for index, state in enumerate(ring)
+        for offset, event in enumerate(triggers))
+    return state_machine
+
+
+def build_deep(depth: int) -> Tuple[StateMachine, Event]:
+    event = Event("toggle")
+    child_sm = None
+    for level in range(depth):
+        state_machine = StateMachine(f"level{level}")
+        first = State(f"first{level}", child_sm)
+        second = State(f"second{level}")
+        state_machine.add_state(first, initial_state=True)
+        state_machine.add_state(second)
+        state_machine.add_event(event)
+        if child_sm is None:
+            state_machine.add_transition(first, second, event)
+            state_machine.add_transition(second, first, event)
+        child_sm = state_machine
+    return child_sm, event
+
+
+def build_guarded(guards: int) -> Tuple[StateMachine, Event]:
+    state_machine = StateMachine("guarded")
+    initial_state = State("initial_state")
+    event = Event("event")
+    state_machine.add_state(initial_state, initial_state=True)
+    state_machine.add_event(event)
+    for index in range(guards):
+        transition = state_machine.add_self_transition(initial_state, event)
+        limit = guards - index - 1
+        transition.add_condition(lambda data, limit=limit: data >= limit)
+    return state_machine, event
+
+
+def throughput(trigger: Callable[[], Any], number: int,
+               repeat: int) -> float:
+    return number / min(timeit.repeat(trigger, number=number,
+                                      repeat=repeat))
+
+
+def bench_states(number: int, repeat: int) -> Dict[str, float]:
+    results = {}
+    for states in (10, 100, 1000):
+        for compiled in (False, True):
+            state_machine, events = build_ring(states, 10)
+            if compiled:
+                state_machine.compile()
+            state_machine.start(None)
+            name = "compiled" if compiled else "dispatch"
+            results[f"{name}/states={states}"] = throughput(
+                lambda: state_machine.trigger_event(events[3]),
+                number, repeat)
+    return results
+
+
+def bench_transitions(number: int, repeat: int) -> Dict[str, float]:
+    results = {}
+    for events in (1, 10, 100):
+        state_machine, triggers = build_ring(100, events)
+        state_machine.start(None)
+        results[f"dispatch/transitions={100 * events}"] = throughput(
+            lambda: state_machine.trigger_event(triggers[-1]),
+            number, repeat)
+    return results
+
+
+def bench_depth(number: int, repeat: int) -> Dict[str, float]:
+    results = {}
+    for depth in (1, 4, 16):
+        state_machine, event = build_deep(depth)
+        state_machine.start(None)
+        results[f"propagate/depth={depth}"] = throughput(
+            lambda: state_machine.trigger_event(event, None, True),
+            number, repeat)
+    return results
+
+
+def bench_guards(number: int, repeat: int) -> Dict[str, float]:
+    results = {}
+    for guards in (1, 8, 32):
+        state_machine, event = build_guarded(guards)
+        state_machine.start(0)
+        results[f"guards/chain={guards}"] = throughput(
+            lambda: state_machine.trigger_event(event, 0), number, repeat)
+    return results
+
+
+def bench_construction(repeat: int) -> Dict[str, float]:
+    return {
+        "construction/states=1000,transitions=10000": min(
+            timeit.repeat(lambda: build_ring(1000, 10), number=1,
+                          repeat=repeat)),
+        "construction_bulk/states=1000,transitions=10000": min(
+            timeit.repeat(lambda: build_ring_bulk(1000, 10), number=1,
+                          repeat=repeat)),
+    }
+
+
+def allocated(factory: Callable[[int], Any], count: int) -> float:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = [factory(index) for index in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objects
+    return (after - before) / count
+
+
+def bench_memory() -> Dict[str, float]:
+    state, event = State("state"), Event("event")
+    return {
+        "memory/states=4,transitions=8": allocated(
+            lambda index: build_ring(4, 2)[0], 1000),
+        "memory/states=1000,transitions=10000": allocated(
+            lambda index: build_ring(1000, 10)[0], 3),
+        "memory/state": allocated(lambda index: State(f"state{index}"),
+                                  10000),
+        "memory/event": allocated(lambda index: Event(f"event{index}"),
+                                  10000),
+        "memory/transition": allocated(
+            lambda index: NormalTransition(state, state, event), 10000),
+    }
+
+
+def units(name: str) -> str:
+    if name.startswith("construction"):
+        return "s"
+    if name.startswith("memory/"):
+        return "bytes"
+    return "events/s"
+
+
+def run(number: int, repeat: int) -> Dict[str, Any]:
+    values: Dict[str, float] = {}
+    values.update(bench_states(number, repeat))
+    values.update(bench_transitions(number, repeat))
+    values.update(bench_depth(number, repeat))
+    values.update(bench_guards(number, repeat))
+    values.update(bench_construction(repeat))
+    values.update(bench_memory())
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "results": {name: {"value": value, "unit": units(name)}
+                    for name, value in values.items()},
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any],
+            tolerance: float) -> List[str]:
+    regressions = []
+    for name, result in current["results"].items():
+        reference = baseline["results"].get(name)
+        if reference is None or not reference["value"] or \
+                reference["unit"] != result["unit"]:
+            continue
+        change = result["value"] / reference["value"] - 1.0
+        if not HIGHER_IS_BETTER[result["unit"]]:
+            change = -change
+        result["baseline"] = reference["value"]
+        result["change"] = change
+        if change < -tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="hfsm benchmark suite")
+    parser.add_argument("--output", help="write JSON results to this file")
+    parser.add_argument("--baseline",
+                        help="compare against this JSON results file")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed relative regression (default 0.2)")
+    parser.add_argument("--number", type=int, default=20000,
+                        help="events per timing run (default 20000)")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="timing runs per benchmark (default 5)")
+    args = parser.parse_args(argv)
+
+    current = run(args.number, args.repeat)
+    regressions: List[str] = []
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as fh:
+            regressions = compare(current, json.load(fh), args.tolerance)
+    current["regressions"] = regressions
+
+    text = json.dumps(current, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            fh.write(text + "\n")
+    else:
+        print(text)
+    for name in regressions:
+        print(f"regression: {name}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
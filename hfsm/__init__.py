@@ -1 +1,13 @@
 from .hfsm import * # noqa
+from .blueprint import * # noqa
+from .population import * # noqa
+from .async_hfsm import * # noqa
+from .scheduler import * # noqa
+from .sharding import * # noqa
+from .metrics import * # noqa
+from .loader import * # noqa
+from .timing import * # noqa
+from .analysis import * # noqa
+from .codegen import * # noqa
+from .journal import * # noqa
+from .replay import * # noqa
@@ -0,0 +1,112 @@
+"""Command line tools
+
+Description:
+    python -m hfsm journal <path> [--names PATH] [--last N] [--json]
+        decode a transition journal file written by TransitionJournal
+
+    python -m hfsm replay <log> <definition> [--registry MODULE:NAME]
+                          [--instances N] [--speed X] [--propagate] [--json]
+        replay an event log into machines loaded from a definition file and
+        print the throughput and the final state distribution
+
+License:
+    Copyright 2020 Debby Nirwan
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+import argparse
+import importlib
+import json
+import sys
+
+from .journal import read_journal
+from .loader import compile_definition, load_artifact
+from .replay import read_records, replay_records
+
+
+def journal(args) -> int:
+    entries = read_journal(args.path, args.names)
+    if args.last is not None:
+        entries = entries[-args.last:] if args.last else []
+    for entry in entries:
+        if args.json:
+            print(json.dumps(entry))
+        else:
+            print(f"{entry['timestamp']:.6f} {entry['machine']}: "
+                  f"{entry['source']} -> {entry['destination']} "
+                  f"on {entry['event']}")
+    return 0
+
+
+def replay(args) -> int:
+    registry = {}
+    if args.registry:
+        module, _, name = args.registry.partition(":")
+        registry = getattr(importlib.import_module(module), name)
+    with open(args.definition, "r", encoding="utf-8") as fh:
+        artifact = compile_definition(json.load(fh))
+    machines = {}
+    for instance in range(args.instances):
+        machine = load_artifact(artifact, registry)
+        machine.start(None)
+        machines[str(instance)] = machine
+    report = replay_records(read_records(args.log), machines, args.speed,
+                            args.propagate, args.batch_size)
+    print(json.dumps(report.as_dict()) if args.json else report)
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m hfsm",
+                                     description="hfsm tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+    parser_journal = commands.add_parser(
+        "journal", help="decode a transition journal file")
+    parser_journal.add_argument("path", help="journal file")
+    parser_journal.add_argument("--names",
+                                help="names file (default <path>.names)")
+    parser_journal.add_argument("--last", type=int,
+                                help="print only the last N transitions")
+    parser_journal.add_argument("--json", action="store_true",
+                                help="print one JSON object per line")
+    parser_journal.set_defaults(handler=journal)
+    parser_replay = commands.add_parser(
+        "replay", help="replay an event log into state machines")
+    parser_replay.add_argument("log", help="JSON-lines event log (.gz ok)")
+    parser_replay.add_argument("definition",
+                               help="JSON state machine definition")
+    parser_replay.add_argument("--registry",
+                               help="callback registry as MODULE:NAME")
+    parser_replay.add_argument("--instances", type=int, default=1,
+                               help="machines to replay into, keyed '0', "
+                                    "'1', ... (default 1)")
+    parser_replay.add_argument("--speed", type=float,
+                               help="replay in real time scaled by this "
+                                    "factor (default: as fast as possible)")
+    parser_replay.add_argument("--propagate", action="store_true",
+                               help="propagate events to child machines")
+    parser_replay.add_argument("--batch-size", type=int, default=1024,
+                               help="records per batch (default 1024)")
+    parser_replay.add_argument("--json", action="store_true",
+                               help="print the report as JSON")
+    parser_replay.set_defaults(handler=replay)
+    args = parser.parse_args(argv)
+    try:
+        return args.handler(args)
+    except (OSError, ValueError) as error:
+        print(f"error: {error}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,188 @@
+"""Static reachability analysis of state machines
+
+Description:
+    analyze() walks a StateMachine and every machine nested in it through
+    child_sm or regions, and reports for each machine:
+
+        * unreachable states: states that no chain of transitions leads to
+          from the initial state, or all states of a machine whose owning
+          state is itself unreachable
+        * dead events: registered events that no reachable state of the
+          machine has a transition for
+        * trapped states: reachable states from which no chain of
+          transitions leads to an exit state
+
+    The analysis is static: every condition is assumed to be able to pass,
+    timeout transitions count as ordinary transitions, and the built-in
+    NormalExitState is never reported as unreachable. The report also holds
+    accepting_states() of the analysed machine, which maps every event to
+    the states that accept it anywhere in the hierarchy.
+
+License:
+    Copyright 2020 Debby Nirwan
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+from typing import Any, Dict, FrozenSet, List, Set, Tuple
+
+from .hfsm import State, ExitState, Event, StateMachine
+
+
+class MachineReport(object):
+
+    def __init__(self, machine: StateMachine, path: str,
+                 unreachable_states: Tuple[State, ...],
+                 dead_events: Tuple[Event, ...],
+                 trapped_states: Tuple[State, ...]):
+        self._machine = machine
+        self._path = path
+        self._unreachable_states = unreachable_states
+        self._dead_events = dead_events
+        self._trapped_states = trapped_states
+
+    def __repr__(self):
+        return f"MachineReport={self._path}"
+
+    @property
+    def clean(self) -> bool:
+        return not (self._unreachable_states or self._dead_events or
+                    self._trapped_states)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"machine": self._path,
+                "unreachable_states": [state.name for state in
+                                       self._unreachable_states],
+                "dead_events": [event.name for event in self._dead_events],
+                "trapped_states": [state.name for state in
+                                   self._trapped_states]}
+
+    @property
+    def machine(self):
+        return self._machine
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def unreachable_states(self):
+        return self._unreachable_states
+
+    @property
+    def dead_events(self):
+        return self._dead_events
+
+    @property
+    def trapped_states(self):
+        return self._trapped_states
+
+
+class ReachabilityReport(object):
+
+    def __init__(self, machines: List[MachineReport],
+                 acceptors: Dict[Event, FrozenSet[State]]):
+        self._machines = tuple(machines)
+        self._acceptors = acceptors
+
+    def __iter__(self):
+        return iter(self._machines)
+
+    def __str__(self):
+        lines = []
+        for report in self._machines:
+            problems = (("unreachable state", report.unreachable_states),
+                        ("dead event", report.dead_events),
+                        ("cannot reach exit", report.trapped_states))
+            for title, items in problems:
+                lines.extend(f"{report.path}: {title} {item.name}"
+                             for item in items)
+        return "\n".join(lines)
+
+    @property
+    def clean(self) -> bool:
+        return all(report.clean for report in self._machines)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"machines": [report.as_dict() for report in self._machines],
+                "acceptors": {event.name: sorted(state.name for state in
+                                                 states)
+                              for event, states in self._acceptors.items()}}
+
+    @property
+    def machines(self):
+        return self._machines
+
+    @property
+    def acceptors(self):
+        return self._acceptors
+
+
+def _successors(machine: StateMachine) -> Dict[State, Set[State]]:
+    successors: Dict[State, Set[State]] = {
+        state: set() for state in machine._states}
+    for (src, _), chain in machine._transition_index.items():
+        successors.setdefault(src, set()).update(
+            transition.destination_state for transition in chain)
+    return successors
+
+
+def _closure(start: List[State],
+             edges: Dict[State, Set[State]]) -> Set[State]:
+    seen = set(start)
+    pending = list(start)
+    while pending:
+        for state in edges.get(pending.pop(), ()):
+            if state not in seen:
+                seen.add(state)
+                pending.append(state)
+    return seen
+
+
+def _analyze_machine(machine: StateMachine, path: str, entered: bool,
+                     reports: List[MachineReport]):
+    successors = _successors(machine)
+    reachable: Set[State] = set()
+    if entered and machine.initial_state is not None:
+        reachable = _closure([machine.initial_state], successors)
+    states = machine._states
+    unreachable = tuple(state for state in states
+                        if state not in reachable and
+                        state is not machine.exit_state)
+
+    accepted = set(evt for src, evt in machine._transition_index
+                   if src in reachable)
+    dead = tuple(event for event in machine._events
+                 if event not in accepted)
+
+    predecessors: Dict[State, Set[State]] = {}
+    for src, destinations in successors.items():
+        for dst in destinations:
+            predecessors.setdefault(dst, set()).add(src)
+    exits = [state for state in states if isinstance(state, ExitState)]
+    escaping = _closure(exits, predecessors)
+    trapped = tuple(state for state in states
+                    if state in reachable and state not in escaping)
+
+    reports.append(MachineReport(machine, path, unreachable, dead, trapped))
+    for state in states:
+        children = (state.child_sm,) if state.has_child_sm() else \
+            state.regions
+        for child in children:
+            _analyze_machine(child, f"{path}/{child.name}",
+                             state in reachable, reports)
+
+
+def analyze(machine: StateMachine) -> ReachabilityReport:
+    reports: List[MachineReport] = []
+    _analyze_machine(machine, str(machine.name), True, reports)
+    return ReachabilityReport(reports, machine.accepting_states())
@@ -0,0 +1,387 @@
+"""Hierarchical Finite State Machine for asyncio
+
+Description:
+    Async variants of State, Transition and StateMachine. Entry and exit
+    callbacks, conditions, actions and the exit callback may be plain
+    functions or coroutine functions; awaitable results are awaited.
+    Each machine processes its events run-to-completion, while any number of
+    independent machines make progress concurrently on one event loop.
+    Tasks calling one machine concurrently take turns on a per-machine
+    lock, so every caller awaits its own events and gets their exceptions.
+    Calls made from callbacks of the running dispatch, found through a
+    context variable that gathered tasks inherit, are queued instead.
+
+License:
+    Copyright 2020 Debby Nirwan
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+import asyncio
+import inspect
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, FrozenSet, Iterable, \
+    Optional, Set, Tuple
+
+from .hfsm import State, ExitState, Event, Transition, NormalTransition, \
+    SelfTransition, NullTransition, StateMachine, get_tracer
+
+_dispatch_scope: "ContextVar[FrozenSet[object]]" = \
+    ContextVar("hfsm_dispatch_scope", default=frozenset())
+
+
+async def _resolve(result: Any) -> Any:
+    if inspect.isawaitable(result):
+        return await result
+    return result
+
+
+class AsyncState(State):
+    __slots__ = ()
+
+    def set_child_sm(self, child_sm):
+        if not isinstance(child_sm, AsyncStateMachine):
+            raise TypeError("child_sm must be the type of AsyncStateMachine")
+        super().set_child_sm(child_sm)
+
+    def add_region(self, region):
+        if not isinstance(region, AsyncStateMachine):
+            raise TypeError("region must be the type of AsyncStateMachine")
+        super().add_region(region)
+
+    async def start(self, data: Any):
+        tracer = get_tracer()
+        if tracer is not None:
+            tracer.on_entry(self, data)
+        for callback in self._entry_callbacks:
+            await _resolve(callback(data))
+        if self._timeouts:
+            self._arm_timeouts(data)
+        if self._child_state_machine is not None:
+            await self._child_state_machine.start(data)
+        elif self._regions is not None:
+            await asyncio.gather(*(region.start(data)
+                                   for region in self._regions.machines))
+
+    async def stop(self, data: Any):
+        if self._timers:
+            self._cancel_timeouts()
+        tracer = get_tracer()
+        if tracer is not None:
+            tracer.on_exit(self, data)
+        for callback in self._exit_callbacks:
+            await _resolve(callback(data))
+        if self._child_state_machine is not None:
+            await self._child_state_machine.stop(data)
+        elif self._regions is not None:
+            await asyncio.gather(*(region.stop(data)
+                                   for region in self._regions.machines))
+
+
+class AsyncExitState(ExitState, AsyncState):
+    __slots__ = ()
+
+
+class AsyncTransition(Transition):
+    __slots__ = ()
+
+    async def __call__(self, data: Any) -> bool:
+        if self._condition and not await _resolve(self._condition(data)):
+            return False
+        await self.execute(data)
+        return True
+
+    async def _run_action(self, data: Any):
+        tracer = get_tracer()
+        if tracer is not None:
+            tracer.on_transition(self, data)
+        if self._action:
+            await _resolve(self._action(data))
+
+
+class AsyncNormalTransition(AsyncTransition, NormalTransition):
+    __slots__ = ()
+
+    async def execute(self, data: Any):
+        await self._run_action(data)
+        await self._source_state.stop(data)
+        await self._destination_state.start(data)
+
+
+class AsyncSelfTransition(AsyncTransition, SelfTransition):
+    __slots__ = ()
+
+    async def execute(self, data: Any):
+        await self._run_action(data)
+        await self._source_state.stop(data)
+        await self._source_state.start(data)
+
+
+class AsyncNullTransition(AsyncTransition, NullTransition):
+    __slots__ = ()
+
+    async def execute(self, data: Any):
+        await self._run_action(data)
+
+
+class AsyncStateMachine(StateMachine):
+    _exit_state_type = AsyncExitState
+    _normal_transition_type = AsyncNormalTransition
+    _self_transition_type = AsyncSelfTransition
+    _null_transition_type = AsyncNullTransition
+
+    def __init__(self, name):
+        super().__init__(name)
+        self._timeout_tasks: Set[asyncio.Future] = set()
+        self._lock: Optional[asyncio.Lock] = None
+        self._dispatch_token: Optional[object] = None
+
+    async def start(self, data: Any):
+        if not self._initial_state:
+            raise ValueError("initial state is not set")
+        await self._guard(self._start, data)
+
+    async def _start(self, data: Any):
+        self._current_state = self._initial_state
+        if self._table is not None:
+            self._current_id = self._table.state_id(self._initial_state)
+        self._exited = False
+        if self._metrics is not None:
+            self._metrics.on_start()
+        await self._current_state.start(data)
+        self._update_active_leaf()
+
+    async def stop(self, data: Any):
+        if not self._initial_state:
+            raise ValueError("initial state is not set")
+        if self._current_state is None:
+            raise ValueError("state machine has not been started")
+        await self._guard(self._stop, data)
+
+    async def _stop(self, data: Any):
+        if self._metrics is not None:
+            self._metrics.on_stop(self._current_state)
+        await self._current_state.stop(data)
+        self._current_state = self._exit_state
+        if self._table is not None:
+            self._current_id = self._table.state_id(self._exit_state)
+        self._exited = True
+        self._update_active_leaf()
+
+    async def _guard(self, callback: Callable[[Any], Awaitable[None]],
+                     data: Any):
+        if self._reentrant():
+            await callback(data)
+            return
+        async with self._exclusive():
+            self._dispatching = True
+            try:
+                await callback(data)
+            except BaseException:
+                self._event_queue.clear()
+                raise
+            finally:
+                self._dispatching = False
+            if self._event_queue:
+                await self._run_to_completion(())
+
+    def _reentrant(self) -> bool:
+        token = self._dispatch_token
+        return token is not None and token in _dispatch_scope.get()
+
+    @asynccontextmanager
+    async def _exclusive(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            token = object()
+            scope = _dispatch_scope.set(_dispatch_scope.get() | {token})
+            self._dispatch_token = token
+            try:
+                yield
+            finally:
+                self._dispatch_token = None
+                _dispatch_scope.reset(scope)
+
+    def _on_timeout(self, evt: Event, data: Any):
+        root = self
+        while root._parent_sm is not None:
+            root = root._parent_sm
+        task = asyncio.ensure_future(root.trigger_event(evt, data, True))
+        self._timeout_tasks.add(task)
+        task.add_done_callback(self._timeout_tasks.discard)
+
+    def _on_coalescing_window(self, evt: Event):
+        task = asyncio.ensure_future(self.flush_coalesced(evt))
+        self._timeout_tasks.add(task)
+        task.add_done_callback(self._timeout_tasks.discard)
+
+    async def flush_coalesced(self, evt: Any = None):
+        for event, data, propagate in self._release_coalesced(evt):
+            await self.trigger_event(event, data, propagate)
+
+    def add_state(self, state: State, initial_state: bool = False):
+        self._check_state_type(state)
+        super().add_state(state, initial_state)
+
+    def add_states(self, states: Iterable[State],
+                   initial_state: Optional[State] = None):
+        states = list(states)
+        for state in states:
+            self._check_state_type(state)
+        super().add_states(states, initial_state)
+
+    @staticmethod
+    def _check_state_type(state: State):
+        if not isinstance(state, AsyncState):
+            raise TypeError("state must be the type of AsyncState")
+        if state.has_child_sm() and \
+                not isinstance(state.child_sm, AsyncStateMachine):
+            raise TypeError("child_sm must be the type of AsyncStateMachine")
+
+    async def trigger_event(self, evt: Any, data: Any = None,
+                            propagate: bool = False):
+        if not self._initial_state:
+            raise ValueError("initial state is not set")
+
+        if self._current_state is None:
+            raise ValueError("state machine has not been started")
+
+        if self._reentrant():
+            self._queue_event(evt, data, propagate)
+            return
+        async with self._exclusive():
+            self._queue_event(evt, data, propagate)
+            await self._run_to_completion(())
+
+    def _queue_event(self, evt: Any, data: Any, propagate: bool):
+        if self._coalescing is None:
+            self._event_queue.append((self.get_event(evt), data, propagate))
+        else:
+            self._enqueue(evt, data, propagate)
+
+    async def dispatch_many(self, events: Iterable[Tuple[Any, Any]],
+                            propagate: bool = False):
+        if not self._initial_state:
+            raise ValueError("initial state is not set")
+
+        if self._current_state is None:
+            raise ValueError("state machine has not been started")
+
+        if self._coalescing is not None:
+            events = self._coalesced(events)
+        if self._reentrant():
+            self._event_queue.extend([(self.get_event(evt), data, propagate)
+                                      for evt, data in events])
+            return
+        async with self._exclusive():
+            await self._run_to_completion(events, propagate)
+
+    async def _run_to_completion(self, events: Iterable[Tuple[Event, Any]],
+                                 propagate: bool = False):
+        queue = self._event_queue
+        self._dispatching = True
+        try:
+            while queue:
+                await self._process_event(*queue.popleft())
+            for evt, data in events:
+                await self._process_event(evt, data, propagate)
+                while queue:
+                    await self._process_event(*queue.popleft())
+        except BaseException:
+            queue.clear()
+            raise
+        finally:
+            self._dispatching = False
+
+    async def _process_event(self, evt: Any, data: Any, propagate: bool):
+        if not isinstance(evt, Event):
+            evt = self.get_event(evt)
+        if self._coalescing is not None and \
+                not self._admit(evt, data, propagate):
+            return
+        acceptors = self._acceptors
+        if acceptors is not None and \
+                not self._accepts(acceptors.get(evt, ()), propagate):
+            handled = False
+        elif propagate:
+            handled = await self._dispatch_tree(evt, data)
+        else:
+            handled = await self._handle_event(evt, data)
+        if not handled:
+            tracer = get_tracer()
+            if tracer is not None:
+                leaf = self._active_leaf if propagate else self
+                tracer.on_unhandled(leaf, leaf.current_state, evt)
+
+    async def _dispatch_tree(self, evt: Event, data: Any) -> bool:
+        leaf = self._active_leaf
+        regions = leaf.current_state._regions
+        if regions is not None:
+            machines = regions.accepting(evt)
+            if machines and any(await asyncio.gather(
+                    *(region._dispatch_tree(evt, data)
+                      for region in machines))):
+                return True
+        machine = leaf
+        while machine is not self:
+            if await machine._dispatch_local(evt, data):
+                return True
+            machine = machine._parent_sm
+        return await self._dispatch_local(evt, data)
+
+    async def _dispatch_local(self, evt: Event, data: Any) -> bool:
+        if self._reentrant():
+            return await self._handle_event(evt, data)
+        async with self._exclusive():
+            queue = self._event_queue
+            self._dispatching = True
+            try:
+                handled = await self._handle_event(evt, data)
+                while queue:
+                    await self._process_event(*queue.popleft())
+            except BaseException:
+                queue.clear()
+                raise
+            finally:
+                self._dispatching = False
+        return handled
+
+    async def _handle_event(self, evt: Event, data: Any) -> bool:
+        transitions, next_ids = self._lookup_transitions(evt)
+        for position, transition in enumerate(transitions):
+            if not transition.condition or \
+                    await _resolve(transition.condition(data)):
+                break
+        else:
+            return False
+
+        if self._journal is not None:
+            self._journal.record_transition(self, transition)
+        self._current_state = transition.destination_state
+        if self._table is not None:
+            next_id = next_ids[position]
+            self._current_id = next_id
+            exiting = self._table.is_exit(next_id)
+        else:
+            exiting = isinstance(self._current_state, ExitState)
+        if self._metrics is not None:
+            self._metrics.record(transition)
+        await transition.execute(data)
+        if self._active_leaf is not self or \
+                self._current_state.has_child_sm():
+            self._update_active_leaf()
+        if exiting and self._exit_callback and not self._exited:
+            self._exited = True
+            await _resolve(self._exit_callback(self._current_state, data))
+        return True
@@ -0,0 +1,195 @@
+"""Shared machine definitions with lightweight per-entity instances
+
+Description:
+    A Blueprint wraps a finished StateMachine and shares its states, events,
+    transitions and callbacks between any number of MachineInstance objects.
+    An instance only stores the active state of every hierarchy level and
+    the exited flag, so running one machine per entity costs a few dozen
+    bytes instead of a full copy of the state graph.
+
+License:
+    Copyright 2020 Debby Nirwan
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+from typing import Any, Dict, List, Tuple
+
+from .hfsm import State, Event, ExitState, NullTransition, StateMachine, \
+    get_tracer, snapshot_many, restore_many
+
+
+class Blueprint(object):
+
+    def __init__(self, machine: StateMachine):
+        if not machine.initial_state:
+            raise ValueError("initial state is not set")
+        machine.compile()
+        machines = [machine]
+        while machines:
+            for state in machines.pop()._states:
+                if state.regions:
+                    raise ValueError("regions are not supported by "
+                                     "Blueprint")
+                if state.has_child_sm():
+                    machines.append(state.child_sm)
+        self._machine = machine
+        self._paths: Dict[Tuple[State, ...], Tuple[State, ...]] = {}
+
+    def create(self) -> "MachineInstance":
+        return MachineInstance(self)
+
+    def create_many(self, count: int) -> List["MachineInstance"]:
+        return [MachineInstance(self) for _ in range(count)]
+
+    def intern(self, path: Tuple[State, ...]) -> Tuple[State, ...]:
+        return self._paths.setdefault(path, path)
+
+    def machine_at(self, path: Tuple[State, ...], level: int) -> \
+            StateMachine:
+        if level == 0:
+            return self._machine
+        return path[level - 1].child_sm
+
+    def enter(self, path: Tuple[State, ...], state: State,
+              data: Any) -> Tuple[State, ...]:
+        path = path + (state,)
+        state.run_entry_callbacks(data)
+        while state.has_child_sm():
+            child_sm = state.child_sm
+            if not child_sm.initial_state:
+                raise ValueError("initial state is not set")
+            state = child_sm.initial_state
+            path = path + (state,)
+            state.run_entry_callbacks(data)
+        return self.intern(path)
+
+    @staticmethod
+    def exit(path: Tuple[State, ...], level: int, data: Any):
+        for state in path[level:]:
+            state.run_exit_callbacks(data)
+
+    @property
+    def machine(self):
+        return self._machine
+
+
+class MachineInstance(object):
+    __slots__ = ("_blueprint", "_path", "_exited")
+
+    def __init__(self, blueprint: Blueprint):
+        self._blueprint = blueprint
+        self._path: Tuple[State, ...] = ()
+        self._exited = True
+
+    def __repr__(self):
+        return f"MachineInstance of {self._blueprint.machine} in " \
+               f"{self.current_state}"
+
+    def start(self, data: Any):
+        blueprint = self._blueprint
+        self._exited = False
+        self._path = blueprint.enter((), blueprint.machine.initial_state,
+                                     data)
+
+    def stop(self, data: Any):
+        if not self._path:
+            raise ValueError("state machine has not been started")
+        blueprint = self._blueprint
+        blueprint.exit(self._path, 0, data)
+        self._path = blueprint.intern((blueprint.machine.exit_state,))
+        self._exited = True
+
+    def is_running(self) -> bool:
+        if self._path and self._path[0] != self._blueprint.machine.exit_state:
+            return True
+        else:
+            return False
+
+    def trigger_event(self, evt: Any, data: Any = None,
+                      propagate: bool = False) -> bool:
+        path = self._path
+        if not path:
+            raise ValueError("state machine has not been started")
+        blueprint = self._blueprint
+        if not isinstance(evt, Event):
+            evt = blueprint.machine.get_event(evt)
+        leaf = level = len(path) - 1 if propagate else 0
+        tracer = get_tracer()
+        while True:
+            machine = blueprint.machine_at(path, level)
+            for transition in machine.find_transitions(path[level], evt):
+                if not transition.condition or transition.condition(data):
+                    break
+            else:
+                transition = None
+            if transition is not None:
+                break
+            if level == 0:
+                if tracer is not None:
+                    tracer.on_unhandled(self, path[leaf], evt)
+                return False
+            level -= 1
+        if tracer is not None:
+            tracer.on_transition(transition, data)
+        if transition.action:
+            transition.action(data)
+        if isinstance(transition, NullTransition):
+            return True
+        blueprint.exit(path, level, data)
+        destination = transition.destination_state
+        self._path = blueprint.enter(path[:level], destination, data)
+        if isinstance(destination, ExitState) and machine.exit_callback:
+            if level > 0:
+                machine.exit_callback(destination, data)
+            elif not self._exited:
+                self._exited = True
+                machine.exit_callback(destination, data)
+        return True
+
+    def snapshot(self) -> bytes:
+        return snapshot_many([self])
+
+    def restore(self, buffer: bytes):
+        restore_many([self], buffer)
+
+    def _snapshot_levels(self) -> List[Tuple[int, bool]]:
+        machine_at = self._blueprint.machine_at
+        return [(machine_at(self._path, level).table.state_id(state),
+                 self._exited if level == 0 else False)
+                for level, state in enumerate(self._path)]
+
+    def _restore_levels(self, levels: List[Tuple[int, bool]]):
+        path: Tuple[State, ...] = ()
+        for level, (index, exited) in enumerate(levels):
+            machine = self._blueprint.machine_at(path, level)
+            if machine is None or index >= len(machine.table.states):
+                raise ValueError("snapshot does not match state machine")
+            path = path + (machine.table.states[index],)
+        self._path = self._blueprint.intern(path) if path else ()
+        self._exited = levels[0][1] if levels else True
+
+    @property
+    def blueprint(self):
+        return self._blueprint
+
+    @property
+    def current_state(self):
+        return self._path[0] if self._path else None
+
+    @property
+    def active_states(self):
+        return self._path
+
+    @property
+    def exited(self):
+        return self._exited
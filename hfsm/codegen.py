@@ -0,0 +1,307 @@
+"""Specialized dispatch code generated from compiled state machines
+
+Description:
+    specialize() compiles a StateMachine, generates Python source for its
+    transition table and installs the result on the machine. The generated
+    code has one handler per (state, event) pair that evaluates the guard
+    chain and performs the winning transition inline: tracer hooks, the
+    action, exit and entry callbacks, timers and child machines are all
+    called directly, with every callback bound as a closure variable. A
+    tuple with one dict per state maps events to handlers, so dispatching
+    is an index, a dict lookup and a call. trigger_event() gets a fast path
+    for non-propagated Event objects that skips the generic event queue
+    machinery when the machine is idle.
+
+    Source is generated from a structural description of the machine that
+    leaves out names and callbacks, and the code compiled from it is cached
+    under the SHA-256 of that description. Machines with the same shape
+    share one compiled factory and only bind their own callbacks.
+
+    States and transitions whose start, stop or execute methods are
+    overridden are called through those methods instead of being inlined.
+    Callbacks, conditions and actions are bound when specialize() runs, so
+    set them before specializing; the machine is frozen, so setting them
+    afterwards raises ValueError. Child machines and regions are
+    specialized too. Asyncio machines are not supported.
+
+License:
+    Copyright 2020 Debby Nirwan
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+from typing import Any, Callable, Dict, List, Tuple
+
+from . import hfsm
+from .hfsm import State, StateMachine, NormalTransition, \
+    SelfTransition, NullTransition, TransitionTable
+from .async_hfsm import AsyncStateMachine
+from .loader import definition_hash
+
+_EXECUTE_KINDS = {NormalTransition.execute: "normal",
+                  SelfTransition.execute: "self",
+                  NullTransition.execute: "null"}
+_factories: Dict[str, Callable] = {}
+
+
+def _child_kind(state: State) -> str:
+    if state._child_state_machine is not None:
+        return "machine"
+    if state._regions is not None:
+        return "regions"
+    return ""
+
+
+def _describe(machine: StateMachine, table: TransitionTable) -> \
+        Tuple[Dict[str, Any], List[Any]]:
+    chains = []
+    values: List[Any] = []
+    exit_callback = machine._exit_callback is not None
+    if exit_callback:
+        values.append(machine._exit_callback)
+    for index, chain in enumerate(table._chains):
+        if not chain:
+            continue
+        state_id, event_id = divmod(index, table._width)
+        values.append(table.events[event_id])
+        candidates = []
+        for transition, next_id in zip(chain, table._chain_ids[index]):
+            src = transition._source_state
+            dst = transition._destination_state
+            guard = bool(transition._condition)
+            kind = _EXECUTE_KINDS.get(type(transition).execute, "custom")
+            stop = type(src).stop is State.stop and kind in ("normal", "self")
+            start = type(dst).start is State.start and \
+                kind in ("normal", "self")
+            candidates.append({
+                "kind": kind, "guard": guard,
+                "action": bool(transition._action),
+                "exiting": table._exit_flags[next_id],
+                "child": dst._child_state_machine is not None,
+                "stop": [stop, len(src._exit_callbacks),
+                         bool(src._timeouts), _child_kind(src)],
+                "start": [start, len(dst._entry_callbacks),
+                          bool(dst._timeouts), _child_kind(dst)]})
+            values.extend((transition, src, dst, next_id))
+            if guard:
+                values.append(transition._condition)
+            if transition._action and kind != "custom":
+                values.append(transition._action)
+            if stop:
+                values.extend(src._exit_callbacks)
+                if src._child_state_machine is not None:
+                    values.append(src._child_state_machine)
+                elif src._regions is not None:
+                    values.append(src._regions)
+            if start:
+                values.extend(dst._entry_callbacks)
+                if dst._child_state_machine is not None:
+                    values.append(dst._child_state_machine)
+                elif dst._regions is not None:
+                    values.append(dst._regions)
+            if not guard:
+                break
+        chains.append([state_id, event_id, candidates])
+    description = {"states": len(table.states), "chains": chains,
+                   "exit_callback": exit_callback}
+    return description, values
+
+
+def _render_execute(candidate: Dict[str, Any], k: int,
+                    names: List[str]) -> List[str]:
+    kind = candidate["kind"]
+    names.extend((f"_t{k}", f"_src{k}", f"_dst{k}", f"_id{k}"))
+    if candidate["guard"]:
+        names.append(f"_g{k}")
+    if kind == "custom":
+        return [f"_t{k}.execute(data)"]
+    lines = ["tracer = hfsm._tracer",
+             "if tracer is not None:",
+             f"    tracer.on_transition(_t{k}, data)"]
+    if candidate["action"]:
+        names.append(f"_a{k}")
+        lines.append(f"_a{k}(data)")
+    if kind == "null":
+        return lines
+
+    inline, callbacks, timers, child = candidate["stop"]
+    if inline:
+        if timers:
+            lines += [f"if _src{k}._timers:",
+                      f"    _src{k}._cancel_timeouts()"]
+        lines += ["if tracer is not None:",
+                  f"    tracer.on_exit(_src{k}, data)"]
+        for position in range(callbacks):
+            names.append(f"_x{k}_{position}")
+            lines.append(f"_x{k}_{position}(data)")
+        if child:
+            names.append(f"_cs{k}")
+            lines.append(f"_cs{k}.stop(data)")
+    else:
+        lines.append(f"_src{k}.stop(data)")
+
+    inline, callbacks, timers, child = candidate["start"]
+    if inline:
+        lines += ["if tracer is not None:",
+                  f"    tracer.on_entry(_dst{k}, data)"]
+        for position in range(callbacks):
+            names.append(f"_n{k}_{position}")
+            lines.append(f"_n{k}_{position}(data)")
+        if timers:
+            lines.append(f"_dst{k}._arm_timeouts(data)")
+        if child:
+            names.append(f"_cd{k}")
+            lines.append(f"_cd{k}.start(data)")
+    else:
+        lines.append(f"_dst{k}.start(data)")
+    return lines
+
+
+def _render(description: Dict[str, Any]) -> str:
+    lines = ["from itertools import islice", ""]
+    makers: Dict[str, str] = {}
+    chains = []
+    for state_id, event_id, candidates in description["chains"]:
+        names = ["_evt"]
+        body = []
+        for k, candidate in enumerate(candidates):
+            execute = _render_execute(candidate, k, names)
+            transition = [
+                "journal = machine._journal",
+                "if journal is not None:",
+                f"    journal.record_transition(machine, _t{k})",
+                f"machine._current_state = _dst{k}",
+                f"machine._current_id = _id{k}",
+                "metrics = machine._metrics",
+                "if metrics is not None:",
+                f"    metrics.execute(_t{k}, data)",
+                "else:"]
+            transition += ["    " + line for line in execute]
+            if candidate["child"]:
+                transition.append("update_active_leaf()")
+            else:
+                transition += ["if machine._active_leaf is not machine:",
+                               "    update_active_leaf()"]
+            if candidate["exiting"] and description["exit_callback"]:
+                transition += ["if not machine._exited:",
+                               "    machine._exited = True",
+                               f"    exit_callback(_dst{k}, data)"]
+            transition.append("return True")
+            if candidate["guard"]:
+                body.append(f"if _g{k}(data):")
+                body += ["    " + line for line in transition]
+            else:
+                body += transition
+        if candidates[-1]["guard"]:
+            body.append("return False")
+        code = "\n".join(names + body)
+        maker = makers.get(code)
+        if maker is None:
+            maker = makers[code] = f"_make_{len(makers)}"
+            lines += [f"def {maker}(machine, hfsm, update_active_leaf, "
+                      f"exit_callback, values):",
+                      f"    ({', '.join(names)},) = islice(values, "
+                      f"{len(names)})",
+                      "",
+                      "    def handler(data):"]
+            lines += ["        " + line for line in body]
+            lines += ["",
+                      "    return _evt, handler",
+                      "",
+                      ""]
+        chains.append(f"({state_id}, {maker})")
+
+    lines += ["def factory(machine, hfsm, values):",
+              "    values = iter(values)"]
+    if description["exit_callback"]:
+        lines.append("    exit_callback = next(values)")
+    else:
+        lines.append("    exit_callback = None")
+    lines += ["    Event = hfsm.Event",
+              "    queue = machine._event_queue",
+              "    process_event = machine._process_event",
+              "    update_active_leaf = machine._update_active_leaf",
+              "    generic_trigger_event = type(machine).trigger_event."
+              "__get__(machine)",
+              f"    table = tuple({{}} for _ in range("
+              f"{description['states']}))",
+              f"    makers = ({''.join(chain + ',' for chain in chains)})",
+              "    for state_id, make in makers:",
+              "        evt, handler = make(machine, hfsm, update_active_leaf,",
+              "                            exit_callback, values)",
+              "        table[state_id][evt] = handler",
+              "",
+              "    def handle_event(evt, data):",
+              "        handler = table[machine._current_id].get(evt)",
+              "        return handler is not None and handler(data)",
+              "",
+              "    def trigger_event(evt, data=None, propagate=False):",
+              "        if propagate or machine._dispatching or \\",
+              "                machine._current_state is None or \\",
+              "                machine._coalescing is not None or \\",
+              "                type(evt) is not Event:",
+              "            return generic_trigger_event(evt, data, "
+              "propagate)",
+              "        handler = table[machine._current_id].get(evt)",
+              "        machine._dispatching = True",
+              "        try:",
+              "            if handler is None or not handler(data):",
+              "                tracer = hfsm._tracer",
+              "                if tracer is not None:",
+              "                    tracer.on_unhandled(",
+              "                        machine, machine._current_state, "
+              "evt)",
+              "            while queue:",
+              "                process_event(*queue.popleft())",
+              "        except BaseException:",
+              "            queue.clear()",
+              "            raise",
+              "        finally:",
+              "            machine._dispatching = False",
+              "",
+              "    return handle_event, trigger_event",
+              ""]
+    return "\n".join(lines)
+
+
+def generate_source(machine: StateMachine) -> str:
+    description, _ = _describe(machine, machine.compile())
+    return _render(description)
+
+
+def _factory(description: Dict[str, Any]) -> Callable:
+    key = definition_hash(description)
+    factory = _factories.get(key)
+    if factory is None:
+        namespace: Dict[str, Any] = {}
+        code = compile(_render(description), f"<hfsm-codegen {key[:12]}>",
+                       "exec")
+        exec(code, namespace)
+        factory = _factories[key] = namespace["factory"]
+    return factory
+
+
+def specialize(machine: StateMachine) -> StateMachine:
+    if isinstance(machine, AsyncStateMachine):
+        raise TypeError("asyncio state machines cannot be specialized")
+    if not isinstance(machine, StateMachine):
+        raise TypeError("machine must be the type of StateMachine")
+    table = machine.compile()
+    for state in table.states:
+        if state.has_child_sm():
+            specialize(state.child_sm)
+        for region in state.regions:
+            specialize(region)
+    description, values = _describe(machine, table)
+    machine._handle_event, machine.trigger_event = _factory(description)(
+        machine, hfsm, values)
+    return machine
@@ -19,17 +19,79 @@ License:
     limitations under the License.
 """
 import logging
-from typing import List, Any, Optional, Callable
+import time
+import weakref
+from array import array
+from collections import deque
+from concurrent.futures import Executor
+from typing import List, Any, Optional, Callable, Dict, Tuple, Iterable, \
+    Deque, Sequence, FrozenSet, Set
+
+
+class Tracer(object):
+
+    def on_transition(self, transition: "Transition", data: Any):
+        pass
+
+    def on_entry(self, state: "State", data: Any):
+        pass
+
+    def on_exit(self, state: "State", data: Any):
+        pass
+
+    def on_unhandled(self, machine: Any, state: "State", event: "Event"):
+        pass
+
+
+class LoggingTracer(Tracer):
+
+    def on_transition(self, transition: "Transition", data: Any):
+        if isinstance(transition, NormalTransition):
+            logging.info(f"NormalTransition from "
+                         f"{transition.source_state} to "
+                         f"{transition.destination_state} caused by "
+                         f"{transition.event}")
+        elif isinstance(transition, SelfTransition):
+            logging.info(f"SelfTransition {transition.source_state}")
+        elif isinstance(transition, NullTransition):
+            logging.info(f"NullTransition {transition.source_state}")
+
+    def on_entry(self, state: "State", data: Any):
+        logging.debug(f"Entering {state.name}")
+
+    def on_exit(self, state: "State", data: Any):
+        logging.debug(f"Exiting {state.name}")
+
+    def on_unhandled(self, machine: Any, state: "State", event: "Event"):
+        logging.warning(f"Event {event} is not valid in state {state}")
+
+
+_tracer: Optional[Tracer] = None
+
+
+def set_tracer(tracer: Optional[Tracer]):
+    global _tracer
+    _tracer = tracer
+
+
+def get_tracer() -> Optional[Tracer]:
+    return _tracer
 
 
 class State(object):
+    __slots__ = ("_name", "_entry_callbacks", "_exit_callbacks",
+                 "_child_state_machine", "_parent_state_machine",
+                 "_timeouts", "_timers", "_regions", "__weakref__")
 
     def __init__(self, name, child_sm=None):
         self._name = name
-        self._entry_callbacks: List[Callable[[Any], None]] = []
-        self._exit_callbacks: List[Callable[[Any], None]] = []
+        self._entry_callbacks: Tuple[Callable[[Any], None], ...] = ()
+        self._exit_callbacks: Tuple[Callable[[Any], None], ...] = ()
         self._child_state_machine: Optional[StateMachine] = child_sm
         self._parent_state_machine: Optional[StateMachine] = None
+        self._timeouts: Tuple[Tuple[float, Event], ...] = ()
+        self._timers: Tuple[Any, ...] = ()
+        self._regions: Optional[Regions] = None
 
     def __repr__(self):
         return f"State={self._name}"
@@ -43,14 +105,23 @@ class State(object):
     def __ne__(self, other):
         return not self.__eq__(other)
 
+    def __hash__(self):
+        return hash(self._name)
+
     def __call__(self, data: Any):
         pass
 
     def on_entry(self, callback: Callable[[Any], None]):
-        self._entry_callbacks.append(callback)
+        self._check_not_frozen()
+        self._entry_callbacks += (callback,)
 
     def on_exit(self, callback: Callable[[], None]):
-        self._exit_callbacks.append(callback)
+        self._check_not_frozen()
+        self._exit_callbacks += (callback,)
+
+    def _check_not_frozen(self):
+        if self._parent_state_machine and self._parent_state_machine.frozen:
+            raise ValueError("state machine is frozen")
 
     def set_child_sm(self, child_sm):
         if not isinstance(child_sm, StateMachine):
@@ -58,7 +129,34 @@ class State(object):
         if self._parent_state_machine and self._parent_state_machine == \
                 child_sm:
             raise ValueError("child_sm and parent_sm must be different")
+        if self._parent_state_machine and self._parent_state_machine.frozen:
+            raise ValueError("state machine is frozen")
+        if self._regions is not None:
+            raise ValueError("state already has regions")
         self._child_state_machine = child_sm
+        if self._parent_state_machine:
+            child_sm._parent_sm = self._parent_state_machine
+
+    def add_region(self, region):
+        if not isinstance(region, StateMachine):
+            raise TypeError("region must be the type of StateMachine")
+        if self._parent_state_machine and self._parent_state_machine == \
+                region:
+            raise ValueError("region and parent_sm must be different")
+        if self._parent_state_machine and self._parent_state_machine.frozen:
+            raise ValueError("state machine is frozen")
+        if self._child_state_machine is not None:
+            raise ValueError("state already has a child_sm")
+        if self._regions is None:
+            self._regions = Regions()
+        self._regions.add(region)
+        if self._parent_state_machine:
+            region._parent_sm = self._parent_state_machine
+
+    def set_region_executor(self, executor: Optional[Executor]):
+        if self._regions is None:
+            raise ValueError("state has no regions")
+        self._regions.executor = executor
 
     def set_parent_sm(self, parent_sm):
         if not isinstance(parent_sm, StateMachine):
@@ -67,20 +165,61 @@ class State(object):
                 parent_sm:
             raise ValueError("child_sm and parent_sm must be different")
         self._parent_state_machine = parent_sm
+        if self._child_state_machine:
+            self._child_state_machine._parent_sm = parent_sm
+        if self._regions is not None:
+            for region in self._regions.machines:
+                region._parent_sm = parent_sm
 
     def start(self, data: Any):
-        logging.debug(f"Entering {self._name}")
+        if _tracer is not None:
+            _tracer.on_entry(self, data)
         for callback in self._entry_callbacks:
             callback(data)
+        if self._timeouts:
+            self._arm_timeouts(data)
         if self._child_state_machine is not None:
             self._child_state_machine.start(data)
+        elif self._regions is not None:
+            self._regions.start(data)
 
     def stop(self, data: Any):
-        logging.debug(f"Exiting {self._name}")
+        if self._timers:
+            self._cancel_timeouts()
+        if _tracer is not None:
+            _tracer.on_exit(self, data)
         for callback in self._exit_callbacks:
             callback(data)
         if self._child_state_machine is not None:
             self._child_state_machine.stop(data)
+        elif self._regions is not None:
+            self._regions.stop(data)
+
+    def _arm_timeouts(self, data: Any):
+        machine = self._parent_state_machine
+        wheel = machine.timing_wheel if machine is not None else None
+        if wheel is None:
+            raise ValueError("timing wheel is not set")
+        self._timers = tuple(
+            wheel.schedule(seconds, machine._on_timeout, evt, data)
+            for seconds, evt in self._timeouts)
+
+    def _cancel_timeouts(self):
+        for timer in self._timers:
+            timer.cancel()
+        self._timers = ()
+
+    def run_entry_callbacks(self, data: Any):
+        if _tracer is not None:
+            _tracer.on_entry(self, data)
+        for callback in self._entry_callbacks:
+            callback(data)
+
+    def run_exit_callbacks(self, data: Any):
+        if _tracer is not None:
+            _tracer.on_exit(self, data)
+        for callback in self._exit_callbacks:
+            callback(data)
 
     def has_child_sm(self) -> bool:
         return True if self._child_state_machine else False
@@ -93,12 +232,25 @@ class State(object):
     def child_sm(self):
         return self._child_state_machine
 
+    @property
+    def entry_callbacks(self):
+        return self._entry_callbacks
+
+    @property
+    def exit_callbacks(self):
+        return self._exit_callbacks
+
     @property
     def parent_sm(self):
         return self._parent_state_machine
 
+    @property
+    def regions(self):
+        return self._regions.machines if self._regions is not None else ()
+
 
 class ExitState(State):
+    __slots__ = ("_status",)
 
     def __init__(self, status="Normal"):
         self._name = "ExitState"
@@ -110,16 +262,43 @@ class ExitState(State):
         return self._status
 
 
-class Event(object):
+def _new_event(cls: type, name: Any) -> "Event":
+    event = object.__new__(cls)
+    event._name = name
+    return event
+
+
+class _EventType(type):
+
+    def __call__(cls, name, *args, **kwargs):
+        if args or kwargs:
+            return super().__call__(name, *args, **kwargs)
+        key = (cls, name)
+        event = cls._interned.get(key)
+        if event is None:
+            event = cls._interned.setdefault(key, super().__call__(name))
+        return event
+
+
+class Event(object, metaclass=_EventType):
+    __slots__ = ("_name", "__weakref__")
+    _interned: "weakref.WeakValueDictionary[Tuple[type, Any], Event]" = \
+        weakref.WeakValueDictionary()
 
     def __init__(self, name):
         self._name = name
 
+    def __reduce__(self):
+        if self._interned.get((type(self), self._name)) is self:
+            return type(self), (self._name,)
+        return _new_event, (type(self), self._name), \
+            getattr(self, "__dict__", None)
+
     def __repr__(self):
         return f"Event={self._name}"
 
     def __eq__(self, other):
-        if other.name == self._name:
+        if other is self or other.name == self._name:
             return True
         else:
             return False
@@ -127,12 +306,137 @@ class Event(object):
     def __ne__(self, other):
         return not self.__eq__(other)
 
+    def __hash__(self):
+        return hash(self._name)
+
     @property
     def name(self):
         return self._name
 
 
+class Regions(object):
+    __slots__ = ("_machines", "_index", "executor")
+
+    def __init__(self):
+        self._machines: Tuple[StateMachine, ...] = ()
+        self._index: Optional[Dict[Event, Tuple[StateMachine, ...]]] = None
+        self.executor: Optional[Executor] = None
+
+    def add(self, machine: "StateMachine"):
+        self._machines += (machine,)
+        self._index = None
+
+    def _run(self, method: str, machines: Iterable["StateMachine"],
+             *args: Any) -> List[Any]:
+        if self.executor is None:
+            return [getattr(machine, method)(*args) for machine in machines]
+        futures = [self.executor.submit(getattr(machine, method), *args)
+                   for machine in machines]
+        return [future.result() for future in futures]
+
+    def start(self, data: Any):
+        if not all(machine.frozen for machine in self._machines):
+            self._index = None
+        self._run("start", self._machines, data)
+
+    def stop(self, data: Any):
+        self._run("stop", self._machines, data)
+
+    def accepting(self, evt: Event) -> Tuple["StateMachine", ...]:
+        index = self._index
+        if index is None:
+            accepted: Dict[Event, List[StateMachine]] = {}
+            for machine in self._machines:
+                for event in machine.accepted_events():
+                    accepted.setdefault(event, []).append(machine)
+            index = self._index = {event: tuple(machines) for event, machines
+                                   in accepted.items()}
+        return index.get(evt, ())
+
+    def dispatch(self, evt: Event, data: Any) -> bool:
+        machines = self.accepting(evt)
+        if not machines:
+            return False
+        return any(self._run("_dispatch_tree", machines, evt, data))
+
+    @property
+    def machines(self):
+        return self._machines
+
+
+class CoalescingPolicy(object):
+    __slots__ = ("_merge", "_window", "_clock", "_last", "_merged",
+                 "_dropped", "_pending", "_timer")
+
+    def __init__(self, merge: bool = True, window: float = 0.0,
+                 clock: Callable[[], float] = time.monotonic):
+        if window < 0:
+            raise ValueError("window must not be negative")
+        self._merge = merge
+        self._window = window
+        self._clock = clock
+        self._last: Optional[float] = None
+        self._merged = 0
+        self._dropped = 0
+        self._pending: Optional[Tuple[Any, bool]] = None
+        self._timer: Any = None
+
+    def admit(self, data: Any = None, propagate: bool = False) -> bool:
+        if self._window:
+            now = self._clock()
+            if self._last is not None and now - self._last < self._window:
+                if self._pending is not None:
+                    self._dropped += 1
+                self._pending = (data, propagate)
+                return False
+            if self._pending is not None:
+                self._dropped += 1
+                self._release()
+            self._last = now
+        return True
+
+    def _remaining(self) -> float:
+        return self._window - (self._clock() - self._last)
+
+    def _release(self) -> Optional[Tuple[Any, bool]]:
+        pending = self._pending
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._pending = None
+        if pending is not None:
+            self._last = None
+        return pending
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"merge": self._merge, "window": self._window,
+                "merged": self._merged, "dropped": self._dropped}
+
+    @property
+    def merge(self):
+        return self._merge
+
+    @property
+    def window(self):
+        return self._window
+
+    @property
+    def merged(self):
+        return self._merged
+
+    @property
+    def dropped(self):
+        return self._dropped
+
+    @property
+    def pending(self) -> bool:
+        return self._pending is not None
+
+
 class Transition(object):
+    __slots__ = ("_event", "_source_state", "_destination_state",
+                 "_condition", "_action", "_priority", "_default",
+                 "__weakref__")
 
     def __init__(self, event: Event, src: State, dst: State):
         self._event = event
@@ -140,14 +444,24 @@ class Transition(object):
         self._destination_state = dst
         self._condition: Optional[Callable[[Any], bool]] = None
         self._action: Optional[Callable[[Any], None]] = None
+        self._priority = 0
+        self._default = False
 
-    def __call__(self, data: Any):
+    def __call__(self, data: Any) -> bool:
+        if self._condition and not self._condition(data):
+            return False
+        self.execute(data)
+        return True
+
+    def execute(self, data: Any):
         raise NotImplementedError
 
     def add_condition(self, callback: Callable[[Any], bool]):
+        self._source_state._check_not_frozen()
         self._condition = callback
 
     def add_action(self, callback: Callable[[Any], Any]):
+        self._source_state._check_not_frozen()
         self._action = callback
 
     @property
@@ -162,73 +476,181 @@ class Transition(object):
     def destination_state(self):
         return self._destination_state
 
+    @property
+    def priority(self):
+        return self._priority
+
+    @property
+    def is_default(self):
+        return self._default
+
+    @property
+    def condition(self):
+        return self._condition
+
+    @property
+    def action(self):
+        return self._action
+
 
 class NormalTransition(Transition):
+    __slots__ = ()
 
     def __init__(self, source_state: State, destination_state: State,
                  event: Event):
         super().__init__(event, source_state, destination_state)
-        self._from = source_state
-        self._to = destination_state
 
-    def __call__(self, data: Any):
-        if not self._condition or self._condition(data):
-            logging.info(f"NormalTransition from {self._from} to {self._to} "
-                         f"caused by {self._event}")
-            if self._action:
-                self._action(data)
-            self._from.stop(data)
-            self._to.start(data)
+    def execute(self, data: Any):
+        if _tracer is not None:
+            _tracer.on_transition(self, data)
+        if self._action:
+            self._action(data)
+        self._source_state.stop(data)
+        self._destination_state.start(data)
 
     def __repr__(self):
-        return f"Transition {self._from} to {self._to} by {self._event}"
+        return f"Transition {self._source_state} to " \
+               f"{self._destination_state} by {self._event}"
 
 
 class SelfTransition(Transition):
+    __slots__ = ()
 
     def __init__(self, source_state: State, event: Event):
         super().__init__(event, source_state, source_state)
-        self._state = source_state
 
-    def __call__(self, data: Any):
-        if not self._condition or self._condition(data):
-            logging.info(f"SelfTransition {self._state}")
-            if self._action:
-                self._action(data)
-            self._state.stop(data)
-            self._state.start(data)
+    def execute(self, data: Any):
+        if _tracer is not None:
+            _tracer.on_transition(self, data)
+        if self._action:
+            self._action(data)
+        self._source_state.stop(data)
+        self._source_state.start(data)
 
     def __repr__(self):
-        return f"SelfTransition on {self._state}"
+        return f"SelfTransition on {self._source_state}"
 
 
 class NullTransition(Transition):
+    __slots__ = ()
 
     def __init__(self, source_state: State, event: Event):
         super().__init__(event, source_state, source_state)
-        self._state = source_state
 
-    def __call__(self, data: Any):
-        if not self._condition or self._condition(data):
-            logging.info(f"NullTransition {self._state}")
-            if self._action:
-                self._action(data)
+    def execute(self, data: Any):
+        if _tracer is not None:
+            _tracer.on_transition(self, data)
+        if self._action:
+            self._action(data)
 
     def __repr__(self):
-        return f"NullTransition on {self._state}"
+        return f"NullTransition on {self._source_state}"
+
+
+class TransitionTable(object):
+
+    def __init__(self, states: List[State], events: List[Event],
+                 transition_index: Dict[Tuple[State, Event],
+                                        List[Transition]]):
+        self._states: Tuple[State, ...] = tuple(states)
+        self._events: Tuple[Event, ...] = tuple(dict.fromkeys(events))
+        self._state_ids: Dict[State, int] = {
+            state: state_id for state_id, state in enumerate(self._states)}
+        self._event_ids: Dict[Event, int] = {
+            event: event_id for event_id, event in enumerate(self._events)}
+        self._width = len(self._events)
+        size = len(self._states) * self._width
+        chains: List[Tuple[Transition, ...]] = [()] * size
+        chain_ids: List[Tuple[int, ...]] = [()] * size
+        next_states = array("i", [-1]) * size
+        for (src, evt), candidates in transition_index.items():
+            index = self.index(self._state_ids[src], self._event_ids[evt])
+            chains[index] = tuple(candidates)
+            chain_ids[index] = tuple(
+                self._state_ids[transition.destination_state]
+                for transition in candidates)
+            next_states[index] = chain_ids[index][0]
+        self._chains: Tuple[Tuple[Transition, ...], ...] = tuple(chains)
+        self._chain_ids: Tuple[Tuple[int, ...], ...] = tuple(chain_ids)
+        self._next_states = next_states
+        self._exit_flags: Tuple[bool, ...] = tuple(
+            isinstance(state, ExitState) for state in self._states)
+
+    def __len__(self):
+        return len(self._chains)
+
+    def index(self, state_id: int, event_id: int) -> int:
+        return state_id * self._width + event_id
+
+    def state_id(self, state: State) -> int:
+        return self._state_ids[state]
+
+    def event_id(self, event: Event) -> int:
+        return self._event_ids[event]
+
+    def transition(self, state_id: int, event_id: int) -> \
+            Optional[Transition]:
+        chain = self._chains[self.index(state_id, event_id)]
+        return chain[0] if chain else None
+
+    def transitions(self, state_id: int, event_id: int) -> \
+            Tuple[Transition, ...]:
+        return self._chains[self.index(state_id, event_id)]
+
+    def destinations(self, state_id: int, event_id: int) -> Tuple[int, ...]:
+        return self._chain_ids[self.index(state_id, event_id)]
+
+    def next_state(self, state_id: int, event_id: int) -> int:
+        return self._next_states[self.index(state_id, event_id)]
+
+    def is_exit(self, state_id: int) -> bool:
+        return self._exit_flags[state_id]
+
+    @property
+    def states(self):
+        return self._states
+
+    @property
+    def events(self):
+        return self._events
+
+    @property
+    def next_states(self):
+        return memoryview(self._next_states).toreadonly()
 
 
 class StateMachine(object):
+    _exit_state_type = ExitState
+    _normal_transition_type = NormalTransition
+    _self_transition_type = SelfTransition
+    _null_transition_type = NullTransition
 
     def __init__(self, name):
         self._name = name
         self._states: List[State] = []
+        self._state_indices: Dict[State, int] = {}
         self._events: List[Event] = []
+        self._event_names: Dict[Event, int] = {}
+        self._event_keys: Dict[Any, Event] = {}
         self._transitions: List[Transition] = []
+        self._transition_index: Dict[Tuple[State, Event],
+                                     List[Transition]] = {}
         self._initial_state: Optional[State] = None
         self._current_state: Optional[State] = None
         self._exit_callback: Optional[Callable[[ExitState, Any], None]] = None
-        self._exit_state = ExitState()
+        self._exit_state = self._exit_state_type()
+        self._table: Optional[TransitionTable] = None
+        self._acceptors: Optional[Dict[Event, FrozenSet[State]]] = None
+        self._current_id = -1
+        self._event_queue: Deque[Tuple[Event, Any, bool]] = deque()
+        self._dispatching = False
+        self._parent_sm: Optional[StateMachine] = None
+        self._active_leaf: StateMachine = self
+        self._metrics: Any = None
+        self._timing_wheel: Any = None
+        self._coalescing: Optional[Dict[Event, CoalescingPolicy]] = None
+        self._journal: Any = None
+        self._journal_id = -1
         self.add_state(self._exit_state)
         self._exited = True
 
@@ -241,26 +663,72 @@ class StateMachine(object):
     def __ne__(self, other):
         return not self.__eq__(other)
 
+    def __hash__(self):
+        return hash(self._name)
+
     def __str__(self):
         return self._name
 
     def start(self, data: Any):
         if not self._initial_state:
             raise ValueError("initial state is not set")
+        self._guard(self._start, data)
+
+    def _start(self, data: Any):
         self._current_state = self._initial_state
+        if self._table is not None:
+            self._current_id = self._table.state_id(self._initial_state)
         self._exited = False
+        if self._metrics is not None:
+            self._metrics.on_start()
         self._current_state.start(data)
+        self._update_active_leaf()
 
     def stop(self, data: Any):
         if not self._initial_state:
             raise ValueError("initial state is not set")
         if self._current_state is None:
             raise ValueError("state machine has not been started")
+        self._guard(self._stop, data)
+
+    def _stop(self, data: Any):
+        if self._metrics is not None:
+            self._metrics.on_stop(self._current_state)
         self._current_state.stop(data)
         self._current_state = self._exit_state
+        if self._table is not None:
+            self._current_id = self._table.state_id(self._exit_state)
         self._exited = True
+        self._update_active_leaf()
+
+    def _guard(self, callback: Callable[[Any], None], data: Any):
+        if self._dispatching:
+            callback(data)
+            return
+        self._dispatching = True
+        try:
+            callback(data)
+        except BaseException:
+            self._event_queue.clear()
+            raise
+        finally:
+            self._dispatching = False
+        if self._event_queue:
+            self._run_to_completion(())
+
+    def enable_metrics(self, sample_every: int = 1,
+                       latency_buckets: Optional[Iterable[float]] = None,
+                       dwell_buckets: Optional[Iterable[float]] = None):
+        from .metrics import MachineMetrics
+        self._metrics = MachineMetrics(self, sample_every, latency_buckets,
+                                       dwell_buckets)
+        return self._metrics
+
+    def disable_metrics(self):
+        self._metrics = None
 
     def on_exit(self, callback):
+        self._check_not_frozen()
         self._exit_callback = callback
 
     def is_running(self) -> bool:
@@ -269,78 +737,668 @@ class StateMachine(object):
         else:
             return False
 
+    def compile(self) -> TransitionTable:
+        if self._table is None:
+            for state in self._states:
+                if state.has_child_sm():
+                    state.child_sm.compile()
+                for region in state.regions:
+                    region.compile()
+            self._table = TransitionTable(self._states, self._events,
+                                          self._transition_index)
+            self._acceptors = self.accepting_states()
+            if self._current_state is not None:
+                self._current_id = self._table.state_id(self._current_state)
+        return self._table
+
+    def _check_not_frozen(self):
+        if self._table is not None:
+            raise ValueError("state machine is frozen")
+
     def add_state(self, state: State, initial_state: bool = False):
-        if state in self._states:
+        self._check_not_frozen()
+        if state in self._state_indices:
             raise ValueError("attempting to add same state twice")
-        self._states.append(state)
-        state.set_parent_sm(self)
+        self._insert_state(state)
         if not self._initial_state and initial_state:
             self._initial_state = state
 
-    def add_event(self, event: Event):
+    def add_states(self, states: Iterable[State],
+                   initial_state: Optional[State] = None):
+        self._check_not_frozen()
+        states = list(states)
+        errors = []
+        added = set()
+        for state in states:
+            if state in self._state_indices or state in added:
+                errors.append(f"duplicate state '{state.name}'")
+            added.add(state)
+        if initial_state is not None and initial_state not in added and \
+                initial_state not in self._state_indices:
+            errors.append(f"unknown initial state '{initial_state.name}'")
+        if errors:
+            raise ValueError("cannot add states: " + "; ".join(errors))
+        for state in states:
+            self._insert_state(state)
+        if not self._initial_state and initial_state is not None:
+            self._initial_state = initial_state
+
+    def _insert_state(self, state: State):
+        self._state_indices[state] = len(self._states)
+        self._states.append(state)
+        state.set_parent_sm(self)
+
+    def add_event(self, event: Event, event_id: Optional[int] = None):
+        self._check_not_frozen()
+        if event_id is not None:
+            registered = self._event_keys.get(event_id)
+            if registered is not None and registered is not event:
+                raise ValueError(f"event id {event_id} is already "
+                                 f"registered for {registered}")
+            self._event_keys[event_id] = event
+        self._insert_event(event)
+
+    def add_events(self, events: Iterable[Event]):
+        self._check_not_frozen()
+        events = list(events)
+        errors = []
+        added = set()
+        for event in events:
+            if event in self._event_names or event in added:
+                errors.append(f"duplicate event '{event.name}'")
+            added.add(event)
+        if errors:
+            raise ValueError("cannot add events: " + "; ".join(errors))
+        for event in events:
+            self._insert_event(event)
+
+    def _insert_event(self, event: Event):
+        self._event_names.setdefault(event, len(self._events))
+        self._event_keys.setdefault(event.name, event)
         self._events.append(event)
 
-    def add_transition(self, src: State, dst: State, evt: Event) -> \
+    def get_event(self, key: Any) -> Event:
+        if isinstance(key, Event):
+            return key
+        event = self._event_keys.get(key)
+        if event is not None:
+            return event
+        if isinstance(key, str):
+            return Event(key)
+        raise ValueError(f"unknown event id {key}")
+
+    def add_transition(self, src: State, dst: State, evt: Event,
+                       priority: int = 0, default: bool = False) -> \
             Optional[Transition]:
+        self._check_not_frozen()
         transition = None
-        if src in self._states and dst in self._states and evt in self._events:
-            transition = NormalTransition(src, dst, evt)
-            self._transitions.append(transition)
+        if src in self._state_indices and dst in self._state_indices and \
+                evt in self._event_names:
+            transition = self._normal_transition_type(src, dst, evt)
+            self._add_to_index(transition, priority, default)
         return transition
 
-    def add_self_transition(self, state: State, evt: Event) -> \
+    def add_transitions(self, transitions: Iterable[Tuple[Any, ...]]) -> \
+            List[Transition]:
+        self._check_not_frozen()
+        state_indices = self._state_indices
+        event_names = self._event_names
+        transition_index = self._transition_index
+        transition_type = self._normal_transition_type
+        append = self._transitions.append
+        added: List[Transition] = []
+        unsorted = {}
+        errors = []
+        for position, (src, dst, evt, *options) in enumerate(transitions):
+            if src in state_indices and dst in state_indices and \
+                    evt in event_names:
+                if errors:
+                    continue
+                transition = transition_type(src, dst, evt)
+                if options:
+                    transition._priority = options[0]
+                    if len(options) > 1:
+                        transition._default = options[1]
+                append(transition)
+                added.append(transition)
+                chain = transition_index.setdefault((src, evt), [])
+                chain.append(transition)
+                if len(chain) > 1:
+                    unsorted[id(chain)] = chain
+                continue
+            unknown = [f"state '{state.name}'" for state in (src, dst)
+                       if state not in state_indices]
+            if evt not in event_names:
+                unknown.append(f"event '{evt.name}'")
+            errors.append(f"transition {position} refers to unknown "
+                          f"{', '.join(dict.fromkeys(unknown))}")
+        if errors:
+            for transition in reversed(added):
+                key = (transition.source_state, transition.event)
+                transition_index[key].pop()
+                if not transition_index[key]:
+                    del transition_index[key]
+            del self._transitions[len(self._transitions) - len(added):]
+            raise ValueError("cannot add transitions: " + "; ".join(errors))
+        for chain in unsorted.values():
+            self._sort_chain(chain)
+        return added
+
+    def add_self_transition(self, state: State, evt: Event,
+                            priority: int = 0, default: bool = False) -> \
             Optional[Transition]:
+        self._check_not_frozen()
         transition = None
-        if state in self._states and evt in self._events:
-            transition = SelfTransition(state, evt)
-            self._transitions.append(transition)
+        if state in self._state_indices and evt in self._event_names:
+            transition = self._self_transition_type(state, evt)
+            self._add_to_index(transition, priority, default)
         return transition
 
-    def add_null_transition(self, state: State, evt: Event) -> \
+    def add_null_transition(self, state: State, evt: Event,
+                            priority: int = 0, default: bool = False) -> \
             Optional[Transition]:
+        self._check_not_frozen()
         transition = None
-        if state in self._states and evt in self._events:
-            transition = NullTransition(state, evt)
-            self._transitions.append(transition)
+        if state in self._state_indices and evt in self._event_names:
+            transition = self._null_transition_type(state, evt)
+            self._add_to_index(transition, priority, default)
         return transition
 
-    def trigger_event(self, evt: Event, data: Any = None,
+    def add_timeout_transition(self, src: State, dst: State, seconds: float,
+                               priority: int = 0, default: bool = False) -> \
+            Optional[Transition]:
+        self._check_not_frozen()
+        if seconds <= 0:
+            raise ValueError("seconds must be positive")
+        if src not in self._state_indices or dst not in self._state_indices:
+            return None
+        evt = Event(f"after {seconds}s in {src.name}")
+        if evt not in self._event_names:
+            self._insert_event(evt)
+        transition = self._normal_transition_type(src, dst, evt)
+        self._add_to_index(transition, priority, default)
+        state = self._states[self._state_indices[src]]
+        if (seconds, evt) not in state._timeouts:
+            state._timeouts += ((seconds, evt),)
+        return transition
+
+    def accepted_events(self) -> FrozenSet[Event]:
+        return frozenset(self.accepting_states())
+
+    def accepting_states(self) -> Dict[Event, FrozenSet[State]]:
+        if self._acceptors is not None:
+            return self._acceptors
+        accepting: Dict[Event, Set[State]] = {}
+        for state, evt in self._transition_index:
+            accepting.setdefault(evt, set()).add(state)
+        for state in self._states:
+            machines = (state.child_sm,) if state.has_child_sm() else \
+                state.regions
+            for machine in machines:
+                for evt, states in machine.accepting_states().items():
+                    accepting.setdefault(evt, set()).update(states)
+        return {evt: frozenset(states) for evt, states in accepting.items()}
+
+    def set_coalescing(self, evt: Any, merge: bool = True,
+                       window: float = 0.0,
+                       clock: Callable[[], float] = time.monotonic) -> \
+            CoalescingPolicy:
+        policy = CoalescingPolicy(merge, window, clock)
+        if self._coalescing is None:
+            self._coalescing = {}
+        self._coalescing[self.get_event(evt)] = policy
+        return policy
+
+    def remove_coalescing(self, evt: Any):
+        if self._coalescing is not None:
+            policy = self._coalescing.pop(self.get_event(evt), None)
+            if policy is not None:
+                policy._release()
+            if not self._coalescing:
+                self._coalescing = None
+
+    def _enqueue(self, evt: Any, data: Any, propagate: bool):
+        queue = self._event_queue
+        evt = self.get_event(evt)
+        if queue:
+            policy = self._coalescing.get(evt)
+            last = queue[-1]
+            if policy is not None and policy._merge and \
+                    last[0] is evt and last[2] == propagate:
+                queue[-1] = (evt, data, propagate)
+                policy._merged += 1
+                return
+        queue.append((evt, data, propagate))
+
+    def _coalesced(self, events: Iterable[Tuple[Any, Any]]) -> \
+            Iterable[Tuple[Event, Any]]:
+        pending: Optional[Tuple[Event, Any]] = None
+        for evt, data in events:
+            evt = self.get_event(evt)
+            if pending is not None:
+                policy = self._coalescing.get(evt)
+                if policy is not None and policy._merge and \
+                        pending[0] is evt:
+                    pending = (evt, data)
+                    policy._merged += 1
+                    continue
+                yield pending
+            pending = (evt, data)
+        if pending is not None:
+            yield pending
+
+    def _admit(self, evt: Event, data: Any, propagate: bool) -> bool:
+        policy = self._coalescing.get(evt)
+        if policy is None or policy.admit(data, propagate):
+            return True
+        if policy._timer is None:
+            wheel = self.timing_wheel
+            if wheel is not None:
+                policy._timer = wheel.schedule(
+                    policy._remaining(), self._on_coalescing_window, evt)
+        return False
+
+    def _on_coalescing_window(self, evt: Event):
+        self.flush_coalesced(evt)
+
+    def flush_coalesced(self, evt: Any = None):
+        for event, data, propagate in self._release_coalesced(evt):
+            self.trigger_event(event, data, propagate)
+
+    def _release_coalesced(self, evt: Any) -> List[Tuple[Event, Any, bool]]:
+        if self._coalescing is None:
+            return []
+        events = list(self._coalescing) if evt is None else \
+            [self.get_event(evt)]
+        released = []
+        for event in events:
+            policy = self._coalescing.get(event)
+            pending = policy._release() if policy is not None else None
+            if pending is not None and self._current_state is not None:
+                released.append((event, pending[0], pending[1]))
+        return released
+
+    def set_journal(self, journal: Any):
+        self._journal_id = -1 if journal is None else journal.attach(self)
+        self._journal = journal
+        for state in self._states:
+            machines = (state.child_sm,) if state.has_child_sm() else \
+                state.regions
+            for machine in machines:
+                machine.set_journal(journal)
+
+    def set_timing_wheel(self, wheel: Any):
+        self._timing_wheel = wheel
+
+    def _on_timeout(self, evt: Event, data: Any):
+        root = self
+        while root._parent_sm is not None:
+            root = root._parent_sm
+        root.trigger_event(evt, data, propagate=True)
+
+    def _load(self, states: Iterable[State], initial_state: State,
+              events: Iterable[Event],
+              transitions: Iterable[Tuple[str, State, State, Event, int,
+                                          bool]]) -> List[Transition]:
+        self._check_not_frozen()
+        for state in states:
+            self._insert_state(state)
+        self._initial_state = initial_state
+        for event in events:
+            self._insert_event(event)
+        types = {"normal": self._normal_transition_type,
+                 "self": self._self_transition_type,
+                 "null": self._null_transition_type}
+        loaded = []
+        for kind, src, dst, evt, priority, default in transitions:
+            if kind == "normal":
+                transition = types[kind](src, dst, evt)
+            else:
+                transition = types[kind](src, evt)
+            self._insert_transition(transition, priority, default)
+            loaded.append(transition)
+        return loaded
+
+    def _add_to_index(self, transition: Transition, priority: int,
+                      default: bool):
+        self._sort_chain(self._insert_transition(transition, priority,
+                                                 default))
+
+    def _insert_transition(self, transition: Transition, priority: int = 0,
+                           default: bool = False) -> List[Transition]:
+        transition._priority = priority
+        transition._default = default
+        self._transitions.append(transition)
+        key = (transition.source_state, transition.event)
+        chain = self._transition_index.setdefault(key, [])
+        chain.append(transition)
+        return chain
+
+    @staticmethod
+    def _sort_chain(chain: List[Transition]):
+        if len(chain) > 1:
+            chain.sort(key=lambda candidate: (candidate.is_default,
+                                              -candidate.priority))
+
+    def find_transition(self, state: State, evt: Event) -> \
+            Optional[Transition]:
+        transitions = self._transition_index.get((state, evt))
+        return transitions[0] if transitions else None
+
+    def find_transitions(self, state: State, evt: Event) -> \
+            Tuple[Transition, ...]:
+        return tuple(self._transition_index.get((state, evt), ()))
+
+    def trigger_event(self, evt: Any, data: Any = None,
+                      propagate: bool = False):
+        if not self._initial_state:
+            raise ValueError("initial state is not set")
+
+        if self._current_state is None:
+            raise ValueError("state machine has not been started")
+
+        if self._coalescing is None:
+            self._event_queue.append((self.get_event(evt), data, propagate))
+        else:
+            self._enqueue(evt, data, propagate)
+        if not self._dispatching:
+            self._run_to_completion(())
+
+    def dispatch_many(self, events: Iterable[Tuple[Any, Any]],
                       propagate: bool = False):
-        transition_valid = False
         if not self._initial_state:
             raise ValueError("initial state is not set")
 
         if self._current_state is None:
             raise ValueError("state machine has not been started")
 
-        if propagate and self._current_state.has_child_sm():
-            logging.debug(f"Propagating evt {evt} from {self} to "
-                          f"{self._current_state.child_sm}")
-            self._current_state.child_sm.trigger_event(evt, data, propagate)
+        if self._coalescing is not None:
+            events = self._coalesced(events)
+        if self._dispatching:
+            self._event_queue.extend([(self.get_event(evt), data, propagate)
+                                      for evt, data in events])
+        else:
+            self._run_to_completion(events, propagate)
+
+    def _run_to_completion(self, events: Iterable[Tuple[Event, Any]],
+                           propagate: bool = False):
+        queue = self._event_queue
+        process_event = self._process_event
+        self._dispatching = True
+        try:
+            while queue:
+                process_event(*queue.popleft())
+            for evt, data in events:
+                process_event(evt, data, propagate)
+                while queue:
+                    process_event(*queue.popleft())
+        except BaseException:
+            queue.clear()
+            raise
+        finally:
+            self._dispatching = False
+
+    def _lookup_transitions(self, evt: Event) -> \
+            Tuple[Sequence[Transition], Optional[Sequence[int]]]:
+        table = self._table
+        if table is not None:
+            event_id = table._event_ids.get(evt)
+            if event_id is None:
+                return (), None
+            index = self._current_id * table._width + event_id
+            return table._chains[index], table._chain_ids[index]
+        return self._transition_index.get((self._current_state, evt),
+                                          ()), None
+
+    def _process_event(self, evt: Any, data: Any, propagate: bool):
+        if not isinstance(evt, Event):
+            evt = self.get_event(evt)
+        if self._coalescing is not None and \
+                not self._admit(evt, data, propagate):
+            return
+        acceptors = self._acceptors
+        if acceptors is not None and \
+                not self._accepts(acceptors.get(evt, ()), propagate):
+            handled = False
+        elif propagate:
+            handled = self._dispatch_tree(evt, data)
         else:
-            for transition in self._transitions:
-                if transition.source_state == self._current_state and \
-                        transition.event == evt:
-                    self._current_state = transition.destination_state
-                    transition(data)
-                    if isinstance(self._current_state, ExitState) and \
-                            self._exit_callback and not self._exited:
-                        self._exited = True
-                        self._exit_callback(self._current_state, data)
-                    transition_valid = True
-                    break
-            if not transition_valid:
-                logging.warning(f"Event {evt} is not valid in state "
-                                f"{self._current_state}")
+            handled = self._handle_event(evt, data)
+        if not handled and _tracer is not None:
+            leaf = self._active_leaf if propagate else self
+            _tracer.on_unhandled(leaf, leaf._current_state, evt)
+
+    def _accepts(self, states: Iterable[State], propagate: bool) -> bool:
+        if not states:
+            return False
+        state = self._current_state
+        if not propagate:
+            return state in states
+        while state is not None:
+            if state in states:
+                return True
+            regions = state._regions
+            if regions is not None:
+                return any(machine._accepts(states, True)
+                           for machine in regions._machines)
+            machine = state._child_state_machine
+            state = machine._current_state if machine is not None else None
+        return False
+
+    def _dispatch_tree(self, evt: Event, data: Any) -> bool:
+        leaf = self._active_leaf
+        regions = leaf._current_state._regions
+        if regions is not None and regions.dispatch(evt, data):
+            return True
+        machine = leaf
+        while machine is not self:
+            if machine._dispatch_local(evt, data):
+                return True
+            machine = machine._parent_sm
+        return self._dispatch_local(evt, data)
+
+    def _dispatch_local(self, evt: Event, data: Any) -> bool:
+        if self._dispatching:
+            return self._handle_event(evt, data)
+        queue = self._event_queue
+        self._dispatching = True
+        try:
+            handled = self._handle_event(evt, data)
+            while queue:
+                self._process_event(*queue.popleft())
+        except BaseException:
+            queue.clear()
+            raise
+        finally:
+            self._dispatching = False
+        return handled
+
+    def _handle_event(self, evt: Event, data: Any) -> bool:
+        transitions, next_ids = self._lookup_transitions(evt)
+        for position, transition in enumerate(transitions):
+            if not transition._condition or transition._condition(data):
+                break
+        else:
+            return False
+
+        if self._journal is not None:
+            self._journal.record_transition(self, transition)
+        self._current_state = transition.destination_state
+        if self._table is not None:
+            next_id = next_ids[position]
+            self._current_id = next_id
+            exiting = self._table._exit_flags[next_id]
+        else:
+            exiting = isinstance(self._current_state, ExitState)
+        if self._metrics is None:
+            transition.execute(data)
+        else:
+            self._metrics.execute(transition, data)
+        if self._active_leaf is not self or \
+                self._current_state._child_state_machine is not None:
+            self._update_active_leaf()
+        if exiting and self._exit_callback and not self._exited:
+            self._exited = True
+            self._exit_callback(self._current_state, data)
+        return True
+
+    def _update_active_leaf(self):
+        leaf = self
+        state = self._current_state
+        while state is not None and state.has_child_sm():
+            leaf = state.child_sm
+            state = leaf._current_state
+        machine = self
+        while True:
+            machine._active_leaf = leaf
+            parent = machine._parent_sm
+            if parent is None or parent._current_state is None or \
+                    parent._current_state.child_sm is not machine:
+                break
+            machine = parent
+
+    def snapshot(self) -> bytes:
+        return snapshot_many([self])
+
+    def restore(self, buffer: bytes):
+        restore_many([self], buffer)
+
+    def _snapshot_levels(self) -> List[Tuple[int, bool]]:
+        levels = []
+        machine = self
+        while machine is not None and machine._current_state is not None:
+            state = machine._current_state
+            if state._regions is not None:
+                raise ValueError("snapshots do not support regions")
+            levels.append((machine._state_indices[state], machine._exited))
+            machine = state.child_sm
+        return levels
+
+    def _restore_levels(self, levels: List[Tuple[int, bool]]):
+        machines = []
+        machine = self
+        for index, exited in levels:
+            if machine is None or index >= len(machine._states):
+                raise ValueError("snapshot does not match state machine")
+            state = machine._states[index]
+            if state._regions is not None:
+                raise ValueError("snapshots do not support regions")
+            machines.append((machine, state, exited))
+            machine = state.child_sm
+        machine = self
+        while machine is not None and machine._current_state is not None:
+            if machine._current_state._timers:
+                machine._current_state._cancel_timeouts()
+            machine = machine._current_state.child_sm
+        if not levels:
+            self._current_state = None
+            self._exited = True
+        for machine, state, exited in machines:
+            machine._current_state = state
+            if machine._table is not None:
+                machine._current_id = machine._table.state_id(state)
+            machine._exited = exited
+        self._update_active_leaf()
+        for _, state, _ in machines:
+            if state._timeouts:
+                state._arm_timeouts(None)
 
     @property
     def exit_state(self):
         return self._exit_state
 
+    @property
+    def frozen(self) -> bool:
+        return self._table is not None
+
+    @property
+    def table(self) -> Optional[TransitionTable]:
+        return self._table
+
     @property
     def current_state(self):
         return self._current_state
 
+    @property
+    def initial_state(self):
+        return self._initial_state
+
+    @property
+    def parent_sm(self):
+        return self._parent_sm
+
+    @property
+    def active_leaf(self):
+        return self._active_leaf
+
+    @property
+    def metrics(self):
+        return self._metrics
+
+    @property
+    def coalescing(self) -> Dict[Event, CoalescingPolicy]:
+        return dict(self._coalescing or {})
+
+    @property
+    def journal(self):
+        return self._journal
+
+    @property
+    def timing_wheel(self):
+        machine = self
+        while machine is not None:
+            if machine._timing_wheel is not None:
+                return machine._timing_wheel
+            machine = machine._parent_sm
+        return None
+
+    @property
+    def exit_callback(self):
+        return self._exit_callback
+
     @property
     def name(self):
         return self._name
+
+
+def _write_varint(out: bytearray, value: int):
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(buffer: bytes, offset: int) -> Tuple[int, int]:
+    value = shift = 0
+    while True:
+        if offset >= len(buffer):
+            raise ValueError("snapshot is truncated")
+        byte = buffer[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def snapshot_many(machines: Iterable[Any]) -> bytes:
+    out = bytearray()
+    for machine in machines:
+        levels = machine._snapshot_levels()
+        _write_varint(out, len(levels))
+        for index, exited in levels:
+            _write_varint(out, index << 1 | exited)
+    return bytes(out)
+
+
+def restore_many(machines: Iterable[Any], buffer: bytes):
+    offset = 0
+    for machine in machines:
+        depth, offset = _read_varint(buffer, offset)
+        levels = []
+        for _ in range(depth):
+            value, offset = _read_varint(buffer, offset)
+            levels.append((value >> 1, bool(value & 1)))
+        machine._restore_levels(levels)
+    if offset != len(buffer):
+        raise ValueError("snapshot does not match state machines")
@@ -0,0 +1,239 @@
+"""Ring-buffer journal of state machine transitions
+
+Description:
+    A TransitionJournal keeps the last N transitions of every machine
+    attached to it. Each transition is one fixed-size binary entry in a
+    preallocated ring buffer: machine ID, source state ID, destination
+    state ID, event ID and a time.monotonic() timestamp. Entries are
+    written before the transition runs its callbacks, so the transition
+    that crashed a process is the last one in the journal.
+
+    Without a path the ring lives in memory. With a path it is a
+    memory-mapped file, so the entries survive a crash of the process. The
+    names of the attached machines, their states and events are appended
+    to <path>.names, one JSON line per machine, when the machine is
+    attached; flush() appends a new line for unfrozen machines whose
+    definition has changed since. Reopening a journal file with the same
+    capacity continues after the entries already in it, and machines
+    attached by the new process get IDs after the ones already in the
+    names file, so entries written before a crash still decode to the
+    right names.
+
+    read_journal() decodes a journal file back to names, and
+
+        python -m hfsm journal <path> [--last N] [--json]
+
+    prints it.
+
+License:
+    Copyright 2020 Debby Nirwan
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+import json
+import mmap
+import os
+import struct
+import time
+import weakref
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from .hfsm import StateMachine, Transition
+
+JOURNAL_MAGIC = b"HFSMJRN1"
+JOURNAL_HEADER = struct.Struct("<8sIIQ")
+JOURNAL_ENTRY = struct.Struct("<IIIId")
+_COUNT = struct.Struct("<Q")
+_COUNT_OFFSET = JOURNAL_HEADER.size - _COUNT.size
+
+
+def _entries(buffer: Any) -> List[Tuple[int, int, int, int, float]]:
+    magic, capacity, entry_size, count = JOURNAL_HEADER.unpack_from(buffer)
+    if magic != JOURNAL_MAGIC or entry_size != JOURNAL_ENTRY.size or \
+            len(buffer) < JOURNAL_HEADER.size + capacity * entry_size:
+        raise ValueError("not a transition journal")
+    first = max(0, count - capacity)
+    return [JOURNAL_ENTRY.unpack_from(
+        buffer, JOURNAL_HEADER.size + (position % capacity) * entry_size)
+        for position in range(first, count)]
+
+
+def _name(names: List[str], index: int) -> str:
+    return names[index] if index < len(names) else f"#{index}"
+
+
+def _machine_names(machine: StateMachine) -> Dict[str, Any]:
+    return {"name": str(machine.name),
+            "states": [str(state.name) for state in machine._states],
+            "events": [str(event.name) for event in machine._events]}
+
+
+def _read_names(path: str) -> Dict[int, Dict[str, Any]]:
+    machines: Dict[int, Dict[str, Any]] = {}
+    try:
+        with open(path, "r", encoding="utf-8") as fh:
+            for line in fh:
+                try:
+                    names = json.loads(line)
+                    machines[int(names.pop("id"))] = names
+                except (ValueError, KeyError, TypeError, AttributeError):
+                    continue
+    except OSError:
+        pass
+    return machines
+
+
+def decode_entries(entries: List[Tuple[int, int, int, int, float]],
+                   machines: Mapping[int, Dict[str, Any]]) -> \
+        List[Dict[str, Any]]:
+    decoded = []
+    for machine_id, source, destination, event, timestamp in entries:
+        machine = machines.get(machine_id)
+        if machine is None:
+            machine = {"name": f"#{machine_id}", "states": [], "events": []}
+        decoded.append({"timestamp": timestamp,
+                        "machine": machine["name"],
+                        "source": _name(machine["states"], source),
+                        "destination": _name(machine["states"], destination),
+                        "event": _name(machine["events"], event)})
+    return decoded
+
+
+def read_journal(path: str,
+                 names_path: Optional[str] = None) -> List[Dict[str, Any]]:
+    with open(path, "rb") as fh:
+        buffer = fh.read()
+    return decode_entries(_entries(buffer),
+                          _read_names(names_path or f"{path}.names"))
+
+
+class TransitionJournal(object):
+
+    def __init__(self, capacity: int = 4096, path: Optional[str] = None):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        size = JOURNAL_HEADER.size + capacity * JOURNAL_ENTRY.size
+        self._capacity = capacity
+        self._path = path
+        self._names: Dict[int, Dict[str, Any]] = {}
+        self._attached: List[Tuple[int, Any, int, int]] = []
+        self._names_file: Any = None
+        if path is None:
+            self._buffer: Any = bytearray(size)
+            count = None
+        else:
+            descriptor = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                resized = os.fstat(descriptor).st_size != size
+                if resized:
+                    os.ftruncate(descriptor, size)
+                self._buffer = mmap.mmap(descriptor, size)
+            finally:
+                os.close(descriptor)
+            magic, stored, entry_size, count = \
+                JOURNAL_HEADER.unpack_from(self._buffer)
+            if resized or (magic, stored, entry_size) != \
+                    (JOURNAL_MAGIC, capacity, JOURNAL_ENTRY.size):
+                count = None
+        if count is None:
+            count = 0
+            JOURNAL_HEADER.pack_into(self._buffer, 0, JOURNAL_MAGIC,
+                                     capacity, JOURNAL_ENTRY.size, count)
+        if path is not None:
+            names_path = f"{path}.names"
+            if count:
+                self._names = _read_names(names_path)
+            self._names_file = open(names_path, "a" if count else "w",
+                                    encoding="utf-8")
+        self._next_id = max(self._names, default=-1) + 1
+        self._count = count
+
+    def __len__(self):
+        return min(self._count, self._capacity)
+
+    def attach(self, machine: StateMachine) -> int:
+        if machine.journal is self:
+            return machine._journal_id
+        machine_id = self._next_id
+        self._next_id += 1
+        if not machine.frozen:
+            self._attached.append((machine_id, weakref.ref(machine),
+                                   len(machine._states),
+                                   len(machine._events)))
+        self._add_names(machine_id, _machine_names(machine))
+        return machine_id
+
+    def _add_names(self, machine_id: int, names: Dict[str, Any]):
+        self._names[machine_id] = names
+        if self._names_file is not None:
+            self._names_file.write(json.dumps(dict(id=machine_id, **names),
+                                              separators=(",", ":")) + "\n")
+            self._names_file.flush()
+
+    def record_transition(self, machine: StateMachine,
+                          transition: Transition):
+        count = self._count
+        indices = machine._state_indices
+        JOURNAL_ENTRY.pack_into(
+            self._buffer, JOURNAL_HEADER.size +
+            (count % self._capacity) * JOURNAL_ENTRY.size,
+            machine._journal_id, indices[transition._source_state],
+            indices[transition._destination_state],
+            machine._event_names[transition._event], time.monotonic())
+        self._count = count + 1
+        _COUNT.pack_into(self._buffer, _COUNT_OFFSET, count + 1)
+
+    def entries(self) -> List[Tuple[int, int, int, int, float]]:
+        return _entries(self._buffer)
+
+    def decoded(self) -> List[Dict[str, Any]]:
+        self._refresh_names()
+        return decode_entries(self.entries(), self._names)
+
+    def _refresh_names(self):
+        attached = []
+        for machine_id, reference, states, events in self._attached:
+            machine = reference()
+            if machine is None:
+                continue
+            if len(machine._states) != states or \
+                    len(machine._events) != events:
+                states = len(machine._states)
+                events = len(machine._events)
+                self._add_names(machine_id, _machine_names(machine))
+            if not machine.frozen:
+                attached.append((machine_id, reference, states, events))
+        self._attached = attached
+
+    def flush(self):
+        self._refresh_names()
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.flush()
+
+    def close(self):
+        if isinstance(self._buffer, mmap.mmap) and not self._buffer.closed:
+            self.flush()
+            self._buffer.close()
+            self._names_file.close()
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    @property
+    def count(self):
+        return self._count
+
+    @property
+    def path(self):
+        return self._path
@@ -0,0 +1,301 @@
+"""Build state machines from plain dict or JSON definitions
+
+Description:
+    A definition describes a (hierarchical) machine with names only:
+
+        {"name": "sm", "initial": "idle",
+         "states": ["idle", {"name": "busy", "on_entry": ["log"],
+                             "machine": {...child definition...}},
+                    {"exit": "Error"}],
+         "events": ["go", "fail"],
+         "transitions": [
+             {"source": "idle", "destination": "busy", "event": "go",
+              "condition": "ready", "action": "log", "priority": 1},
+             {"source": "busy", "destination": "ErrorExitState",
+              "event": "fail"},
+             {"source": "busy", "event": "go", "type": "self"}],
+         "on_exit": "finished"}
+
+    Callback names are resolved through a registry mapping names to
+    callables. compile_definition() validates a definition, reporting every
+    error at once, and turns it into an artifact: a JSON-serializable form
+    in which states, events and transitions are referred to by index and
+    transition chains are already in priority order. load_artifact() builds
+    a compiled machine from an artifact without validating it again, and
+    load() caches artifacts on disk keyed by the SHA-256 of the definition,
+    so later starts skip validation and indexing.
+
+License:
+    Copyright 2020 Debby Nirwan
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+import hashlib
+import json
+import os
+import tempfile
+from typing import Any, Callable, Dict, List, Mapping, Optional, Type
+
+from .hfsm import State, Event, StateMachine
+
+ARTIFACT_VERSION = 1
+TRANSITION_TYPES = ("normal", "self", "null")
+
+
+def definition_hash(definition: Mapping[str, Any]) -> str:
+    text = json.dumps(definition, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _names(value: Any) -> List[str]:
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [value]
+    return list(value)
+
+
+def _state_name(state: Any) -> Optional[str]:
+    if isinstance(state, str):
+        return state
+    if "exit" in state:
+        return f"{state['exit']}ExitState"
+    return state.get("name")
+
+
+def _compile_machine(definition: Mapping[str, Any], path: str,
+                     errors: List[str]) -> Optional[Dict[str, Any]]:
+    if not isinstance(definition, Mapping):
+        errors.append("definition must be a mapping")
+        return None
+    name = definition.get("name")
+    if not name:
+        errors.append(f"{path}: machine has no name")
+    path = f"{path}/{name}" if path else str(name)
+
+    indices = {"NormalExitState": 0}
+    states = []
+    for position, state in enumerate(definition.get("states", ())):
+        if not isinstance(state, (str, Mapping)):
+            errors.append(f"{path}: state {position} must be a name or "
+                          f"a mapping")
+            continue
+        state_name = _state_name(state)
+        if not state_name:
+            errors.append(f"{path}: state {position} has no name")
+            continue
+        if not isinstance(state_name, str):
+            errors.append(f"{path}: state {position} name must be a string")
+            continue
+        if state_name in indices:
+            errors.append(f"{path}: duplicate state '{state_name}'")
+            continue
+        indices[state_name] = len(indices)
+        if isinstance(state, str):
+            state = {"name": state}
+        child = state.get("machine")
+        if child is not None and not isinstance(child, Mapping):
+            errors.append(f"{path}: machine of state '{state_name}' must "
+                          f"be a mapping")
+            child = None
+        states.append({
+            "name": state_name,
+            "exit": state.get("exit"),
+            "on_entry": _names(state.get("on_entry")),
+            "on_exit": _names(state.get("on_exit")),
+            "machine": None if child is None else
+            _compile_machine(child, path, errors),
+        })
+
+    initial = definition.get("initial")
+    if initial is None:
+        errors.append(f"{path}: initial state is not set")
+    elif not isinstance(initial, str) or initial not in indices:
+        errors.append(f"{path}: unknown initial state '{initial}'")
+
+    events: Dict[str, int] = {}
+    for position, event in enumerate(definition.get("events", ())):
+        if not isinstance(event, str):
+            errors.append(f"{path}: event {position} must be a name")
+        elif event in events:
+            errors.append(f"{path}: duplicate event '{event}'")
+        else:
+            events[event] = len(events)
+
+    transitions = []
+    for position, transition in enumerate(
+            definition.get("transitions", ())):
+        where = f"{path}: transition {position}"
+        if not isinstance(transition, Mapping):
+            errors.append(f"{where} must be a mapping")
+            continue
+        kind = transition.get("type", "normal")
+        source = transition.get("source")
+        destination = transition.get("destination", source)
+        event = transition.get("event")
+        priority = transition.get("priority", 0)
+        if not isinstance(kind, str) or kind not in TRANSITION_TYPES:
+            errors.append(f"{where} has unknown type '{kind}'")
+            continue
+        if kind == "normal" and "destination" not in transition:
+            errors.append(f"{where} has no destination")
+            continue
+        if not isinstance(priority, int):
+            errors.append(f"{where} has a priority that is not an integer")
+            continue
+        unknown = [f"state '{state}'" for state in (source, destination)
+                   if not isinstance(state, str) or state not in indices]
+        if not isinstance(event, str) or event not in events:
+            unknown.append(f"event '{event}'")
+        if unknown:
+            errors.append(f"{where} refers to unknown "
+                          f"{', '.join(dict.fromkeys(unknown))}")
+            continue
+        transitions.append([kind, indices[source], indices[destination],
+                            events[event], transition.get("condition"),
+                            transition.get("action"), priority,
+                            bool(transition.get("default", False))])
+    transitions.sort(key=lambda item: (item[7], -item[6]))
+
+    return {"name": name,
+            "initial": indices.get(initial, 0)
+            if isinstance(initial, str) else 0,
+            "on_exit": definition.get("on_exit"),
+            "states": states,
+            "events": list(events),
+            "transitions": transitions}
+
+
+def compile_definition(definition: Mapping[str, Any]) -> Dict[str, Any]:
+    errors: List[str] = []
+    machine = _compile_machine(definition, "", errors)
+    if errors:
+        raise ValueError("invalid state machine definition:\n" +
+                         "\n".join(errors))
+    return {"version": ARTIFACT_VERSION,
+            "hash": definition_hash(definition),
+            "machine": machine}
+
+
+def _callback_names(machine: Mapping[str, Any]) -> List[str]:
+    names = _names(machine["on_exit"])
+    for state in machine["states"]:
+        names.extend(state["on_entry"])
+        names.extend(state["on_exit"])
+        if state["machine"] is not None:
+            names.extend(_callback_names(state["machine"]))
+    for transition in machine["transitions"]:
+        names.extend(name for name in transition[4:6] if name is not None)
+    return names
+
+
+def _build_machine(artifact: Mapping[str, Any],
+                   registry: Mapping[str, Callable],
+                   machine_type: Type[StateMachine],
+                   state_type: Type[State]) -> StateMachine:
+    machine = machine_type(artifact["name"])
+    states = [machine.exit_state]
+    for definition in artifact["states"]:
+        child = definition["machine"]
+        if definition["exit"] is not None:
+            state = machine_type._exit_state_type(definition["exit"])
+        else:
+            state = state_type(definition["name"])
+        if child is not None:
+            state.set_child_sm(_build_machine(child, registry, machine_type,
+                                              state_type))
+        for callback in definition["on_entry"]:
+            state.on_entry(registry[callback])
+        for callback in definition["on_exit"]:
+            state.on_exit(registry[callback])
+        states.append(state)
+    events = [Event(name) for name in artifact["events"]]
+    transitions = machine._load(
+        states[1:], states[artifact["initial"]], events,
+        ((kind, states[source], states[destination], events[event],
+          priority, default)
+         for kind, source, destination, event, _, _, priority, default
+         in artifact["transitions"]))
+    for transition, item in zip(transitions, artifact["transitions"]):
+        if item[4] is not None:
+            transition.add_condition(registry[item[4]])
+        if item[5] is not None:
+            transition.add_action(registry[item[5]])
+    if artifact["on_exit"] is not None:
+        machine.on_exit(registry[artifact["on_exit"]])
+    return machine
+
+
+def load_artifact(artifact: Mapping[str, Any],
+                  registry: Mapping[str, Callable],
+                  machine_type: Type[StateMachine] = StateMachine,
+                  state_type: Type[State] = State) -> StateMachine:
+    if artifact.get("version") != ARTIFACT_VERSION:
+        raise ValueError("unsupported artifact version")
+    missing = sorted(set(name for name in _callback_names(
+        artifact["machine"]) if name not in registry))
+    if missing:
+        raise ValueError(f"unknown callbacks: {', '.join(missing)}")
+    machine = _build_machine(artifact["machine"], registry, machine_type,
+                             state_type)
+    machine.compile()
+    return machine
+
+
+def _read_artifact(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, "r", encoding="utf-8") as fh:
+            artifact = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    if artifact.get("version") != ARTIFACT_VERSION:
+        return None
+    return artifact
+
+
+def _write_artifact(path: str, artifact: Mapping[str, Any]):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, "w", encoding="utf-8") as fh:
+            json.dump(artifact, fh, separators=(",", ":"))
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def load(definition: Mapping[str, Any], registry: Mapping[str, Callable],
+         cache_dir: Optional[str] = None,
+         machine_type: Type[StateMachine] = StateMachine,
+         state_type: Type[State] = State) -> StateMachine:
+    artifact = None
+    if cache_dir is not None:
+        path = os.path.join(cache_dir,
+                            f"hfsm-{definition_hash(definition)}.json")
+        artifact = _read_artifact(path)
+    if artifact is None:
+        artifact = compile_definition(definition)
+        if cache_dir is not None:
+            _write_artifact(path, artifact)
+    return load_artifact(artifact, registry, machine_type, state_type)
+
+
+def load_file(path: str, registry: Mapping[str, Callable],
+              cache_dir: Optional[str] = None,
+              machine_type: Type[StateMachine] = StateMachine,
+              state_type: Type[State] = State) -> StateMachine:
+    with open(path, "r", encoding="utf-8") as fh:
+        definition = json.load(fh)
+    return load(definition, registry, cache_dir, machine_type, state_type)
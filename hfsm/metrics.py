@@ -0,0 +1,247 @@
+"""Opt-in counters and latency histograms for state machines
+
+Description:
+    MachineMetrics records, for one StateMachine, how often every transition
+    fires, how long the machine stays in each state and how long entry
+    callbacks, exit callbacks and transition actions take. Durations go into
+    histograms with fixed bucket bounds, so recording an observation is a
+    bisect and two additions. With sample_every=N only every Nth transition
+    has its callbacks timed; counts and dwell times stay exact.
+
+    Enable it with StateMachine.enable_metrics() and export the results with
+    as_dict() or to_prometheus().
+
+License:
+    Copyright 2020 Debby Nirwan
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+from bisect import bisect_left
+from time import perf_counter
+from typing import Any, Dict, List, Optional, Sequence
+
+from .hfsm import State, Transition, NullTransition, get_tracer
+
+LATENCY_BUCKETS = (0.000001, 0.000005, 0.00001, 0.00005, 0.0001, 0.0005,
+                   0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+DWELL_BUCKETS = (0.001, 0.01, 0.1, 1.0, 10.0, 60.0, 600.0, 3600.0)
+
+
+class Histogram(object):
+
+    def __init__(self, bounds: Sequence[float]):
+        if list(bounds) != sorted(bounds):
+            raise ValueError("histogram bounds must be sorted")
+        self._bounds = tuple(bounds)
+        self._counts = [0] * (len(self._bounds) + 1)
+        self._sum = 0.0
+        self._count = 0
+
+    def observe(self, value: float):
+        self._counts[bisect_left(self._bounds, value)] += 1
+        self._sum += value
+        self._count += 1
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"bounds": list(self._bounds), "counts": list(self._counts),
+                "sum": self._sum, "count": self._count}
+
+    @property
+    def bounds(self):
+        return self._bounds
+
+    @property
+    def counts(self):
+        return tuple(self._counts)
+
+    @property
+    def sum(self):
+        return self._sum
+
+    @property
+    def count(self):
+        return self._count
+
+
+def _labels(**labels: str) -> str:
+    return ",".join(
+        '{}="{}"'.format(key, str(value).replace("\\", "\\\\")
+                         .replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in labels.items())
+
+
+def _histogram_lines(name: str, labels: str,
+                     histogram: Histogram) -> List[str]:
+    lines = []
+    cumulative = 0
+    for bound, count in zip(histogram.bounds, histogram.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+    lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+    lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+    return lines
+
+
+class MachineMetrics(object):
+
+    def __init__(self, machine: Any, sample_every: int = 1,
+                 latency_buckets: Optional[Sequence[float]] = None,
+                 dwell_buckets: Optional[Sequence[float]] = None):
+        if sample_every < 1:
+            raise ValueError("sample_every must be at least 1")
+        self._machine = machine
+        self._sample_every = sample_every
+        self._countdown = 1
+        self._latency_buckets = tuple(latency_buckets or LATENCY_BUCKETS)
+        self._dwell_buckets = tuple(dwell_buckets or DWELL_BUCKETS)
+        for bounds in (self._latency_buckets, self._dwell_buckets):
+            if list(bounds) != sorted(bounds):
+                raise ValueError("histogram bounds must be sorted")
+        self._fired: Dict[Transition, int] = {}
+        self._dwell: Dict[State, Histogram] = {}
+        self._entry: Dict[State, Histogram] = {}
+        self._exit: Dict[State, Histogram] = {}
+        self._action: Dict[Transition, Histogram] = {}
+        self._entered_at: Optional[float] = None
+        if machine.current_state is not None:
+            self._entered_at = perf_counter()
+
+    def _histogram(self, histograms: Dict[Any, Histogram], key: Any,
+                   bounds: Sequence[float]) -> Histogram:
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = Histogram(bounds)
+        return histogram
+
+    def on_start(self):
+        self._entered_at = perf_counter()
+
+    def on_stop(self, state: State):
+        self._leave(state, perf_counter())
+        self._entered_at = None
+
+    def _leave(self, state: State, now: float):
+        if self._entered_at is not None:
+            self._histogram(self._dwell, state, self._dwell_buckets).observe(
+                now - self._entered_at)
+        self._entered_at = now
+
+    def record(self, transition: Transition):
+        fired = self._fired
+        fired[transition] = fired.get(transition, 0) + 1
+        if not isinstance(transition, NullTransition):
+            self._leave(transition.source_state, perf_counter())
+
+    def execute(self, transition: Transition, data: Any):
+        self.record(transition)
+        self._countdown -= 1
+        if self._countdown:
+            transition.execute(data)
+            return
+        self._countdown = self._sample_every
+        tracer = get_tracer()
+        if tracer is not None:
+            tracer.on_transition(transition, data)
+        buckets = self._latency_buckets
+        if transition.action:
+            started = perf_counter()
+            transition.action(data)
+            self._histogram(self._action, transition, buckets).observe(
+                perf_counter() - started)
+        if isinstance(transition, NullTransition):
+            return
+        source = transition.source_state
+        destination = transition.destination_state
+        started = perf_counter()
+        source.stop(data)
+        stopped = perf_counter()
+        destination.start(data)
+        self._histogram(self._exit, source, buckets).observe(
+            stopped - started)
+        self._histogram(self._entry, destination, buckets).observe(
+            perf_counter() - stopped)
+
+    def reset(self):
+        self._fired.clear()
+        self._dwell.clear()
+        self._entry.clear()
+        self._exit.clear()
+        self._action.clear()
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "machine": self._machine.name,
+            "sample_every": self._sample_every,
+            "transitions": [
+                {"source": transition.source_state.name,
+                 "event": transition.event.name,
+                 "destination": transition.destination_state.name,
+                 "count": count}
+                for transition, count in self._fired.items()],
+            "dwell_seconds": {state.name: histogram.as_dict()
+                              for state, histogram in self._dwell.items()},
+            "entry_seconds": {state.name: histogram.as_dict()
+                              for state, histogram in self._entry.items()},
+            "exit_seconds": {state.name: histogram.as_dict()
+                             for state, histogram in self._exit.items()},
+            "action_seconds": [
+                dict(source=transition.source_state.name,
+                     event=transition.event.name,
+                     destination=transition.destination_state.name,
+                     **histogram.as_dict())
+                for transition, histogram in self._action.items()],
+        }
+
+    def to_prometheus(self, prefix: str = "hfsm") -> str:
+        machine = self._machine.name
+        lines = [f"# HELP {prefix}_transitions_total Fired transitions.",
+                 f"# TYPE {prefix}_transitions_total counter"]
+        for transition, count in self._fired.items():
+            labels = _labels(machine=machine,
+                             source=transition.source_state.name,
+                             event=transition.event.name,
+                             destination=transition.destination_state.name)
+            lines.append(f"{prefix}_transitions_total{{{labels}}} {count}")
+        for name, help_text, histograms in (
+                ("state_dwell_seconds", "Time spent in a state.",
+                 self._dwell),
+                ("entry_duration_seconds", "Duration of state entry.",
+                 self._entry),
+                ("exit_duration_seconds", "Duration of state exit.",
+                 self._exit)):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} histogram")
+            for state, histogram in histograms.items():
+                lines.extend(_histogram_lines(
+                    f"{prefix}_{name}",
+                    _labels(machine=machine, state=state.name), histogram))
+        lines.append(f"# HELP {prefix}_action_duration_seconds "
+                     f"Duration of transition actions.")
+        lines.append(f"# TYPE {prefix}_action_duration_seconds histogram")
+        for transition, histogram in self._action.items():
+            labels = _labels(machine=machine,
+                             source=transition.source_state.name,
+                             event=transition.event.name,
+                             destination=transition.destination_state.name)
+            lines.extend(_histogram_lines(
+                f"{prefix}_action_duration_seconds", labels, histogram))
+        return "\n".join(lines) + "\n"
+
+    @property
+    def machine(self):
+        return self._machine
+
+    @property
+    def sample_every(self):
+        return self._sample_every
@@ -0,0 +1,173 @@
+"""Vectorized event dispatch over a population of machine instances
+
+Description:
+    A Population runs the same flat StateMachine definition for many
+    instances and keeps every instance's current state as a NumPy integer
+    array of compiled state IDs. One event is applied to many instances with
+    a single table lookup; callbacks only run for the instances that
+    actually take a transition, grouped by transition.
+
+    Requires numpy (pip3 install hfsm[numpy]).
+
+License:
+    Copyright 2020 Debby Nirwan
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+from typing import Any, Callable, Dict, Optional, Sequence
+
+from .hfsm import State, ExitState, NullTransition, StateMachine, \
+    Transition
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+
+class Population(object):
+
+    def __init__(self, machine: StateMachine, size: int):
+        if np is None:
+            raise ImportError("Population requires numpy")
+        if not machine.initial_state:
+            raise ValueError("initial state is not set")
+        table = machine.compile()
+        for state in table.states:
+            if state.has_child_sm() or state.regions:
+                raise ValueError("hierarchical state machines are not "
+                                 "supported by Population")
+        self._machine = machine
+        self._table = table
+        self._next_states = np.frombuffer(table.next_states,
+                                          dtype=np.intc).reshape(
+            len(table.states), len(table.events))
+        self._initial_id = table.state_id(machine.initial_state)
+        self._states = np.full(size, -1, dtype=np.intc)
+        self._vectorized_conditions: Dict[Transition, Callable] = {}
+
+    def __len__(self):
+        return len(self._states)
+
+    def set_vectorized_condition(self, transition: Transition,
+                                 predicate: Callable[[Any, Any], Any]):
+        self._vectorized_conditions[transition] = predicate
+
+    def _select(self, instance_ids: Optional[Sequence[int]]):
+        if instance_ids is None:
+            return np.arange(len(self._states))
+        return np.asarray(instance_ids, dtype=np.intp)
+
+    def start(self, data: Any = None,
+              instance_ids: Optional[Sequence[int]] = None):
+        instance_ids = self._select(instance_ids)
+        self._states[instance_ids] = self._initial_id
+        initial_state = self._machine.initial_state
+        if initial_state.entry_callbacks:
+            for _ in range(len(instance_ids)):
+                initial_state.run_entry_callbacks(data)
+
+    def trigger_event_batch(self, event: Any,
+                            instance_ids: Optional[Sequence[int]] = None,
+                            data: Any = None,
+                            instance_data: Optional[Sequence[Any]] = None):
+        instance_ids = self._select(instance_ids)
+        current = self._states[instance_ids]
+        if (current < 0).any():
+            raise ValueError("state machine has not been started")
+        event_id = self._table.event_id(self._machine.get_event(event))
+        candidates = self._next_states[current, event_id] >= 0
+        fired = []
+        for source_id in np.unique(current[candidates]):
+            positions = np.flatnonzero(candidates & (current == source_id))
+            transitions = self._table.transitions(int(source_id), event_id)
+            destinations = self._table.destinations(int(source_id),
+                                                    event_id)
+            for transition, destination in zip(transitions, destinations):
+                enabled = self._enabled(transition, instance_ids[positions],
+                                        positions, data, instance_data)
+                fired_ids = self._fire(transition, instance_ids[positions],
+                                       positions, enabled, data,
+                                       instance_data)
+                if len(fired_ids):
+                    self._states[fired_ids] = destination
+                    fired.append(fired_ids)
+                positions = positions[~enabled]
+                if not len(positions):
+                    break
+        if not fired:
+            return np.empty(0, dtype=np.intp)
+        return np.concatenate(fired)
+
+    def _enabled(self, transition: Transition, group_ids, positions,
+                 data: Any, instance_data: Optional[Sequence[Any]]):
+        predicate = self._vectorized_conditions.get(transition)
+        if predicate is not None:
+            return np.asarray(predicate(group_ids, data), dtype=bool)
+        if transition.condition:
+            return np.fromiter(
+                (bool(transition.condition(item)) for item in
+                 self._data(positions, data, instance_data)),
+                dtype=bool, count=len(positions))
+        return np.ones(len(positions), dtype=bool)
+
+    def _fire(self, transition: Transition, group_ids, positions, enabled,
+              data: Any, instance_data: Optional[Sequence[Any]]):
+        group_ids = group_ids[enabled]
+        positions = positions[enabled]
+        callbacks = self._callbacks(transition)
+        if callbacks:
+            for item in self._data(positions, data, instance_data):
+                for callback in callbacks:
+                    callback(item)
+        return group_ids
+
+    @staticmethod
+    def _data(positions, data: Any, instance_data: Optional[Sequence[Any]]):
+        if instance_data is None:
+            return (data for _ in range(len(positions)))
+        return (instance_data[position] for position in positions)
+
+    def _callbacks(self, transition: Transition):
+        callbacks = []
+        if transition.action:
+            callbacks.append(transition.action)
+        if not isinstance(transition, NullTransition):
+            callbacks.extend(transition.source_state.exit_callbacks)
+            callbacks.extend(transition.destination_state.entry_callbacks)
+            destination = transition.destination_state
+            exit_callback = self._machine.exit_callback
+            if isinstance(destination, ExitState) and exit_callback:
+                callbacks.append(
+                    lambda item: exit_callback(destination, item))
+        return callbacks
+
+    def state_of(self, instance_id: int) -> Optional[State]:
+        state_id = self._states[instance_id]
+        return None if state_id < 0 else self._table.states[state_id]
+
+    def counts(self) -> Dict[str, int]:
+        started = self._states[self._states >= 0]
+        counts = np.bincount(started, minlength=len(self._table.states))
+        return {state.name: int(count) for state, count in
+                zip(self._table.states, counts) if count}
+
+    @property
+    def machine(self):
+        return self._machine
+
+    @property
+    def states(self):
+        view = self._states.view()
+        view.flags.writeable = False
+        return view
@@ -0,0 +1,201 @@
+"""Replay captured event logs into state machines
+
+Description:
+    An event log is a text file, optionally gzip-compressed, with one JSON
+    record per line, either an object or an array:
+
+        {"timestamp": 12.5, "event": "go", "data": {...}, "machine": "a"}
+        [12.5, "go", {...}, "a"]
+
+    "data" and "machine" are optional. Events are given by name or by
+    registered ID. read_records() streams the records from a file,
+    paced() delays them to follow their timestamps scaled by a speed
+    factor, and replay_records() dispatches them into one or many machines
+    and returns a ReplayReport with the throughput and the distribution of
+    the machines' final (nested) states. Every stage is a generator and
+    batches have a fixed size, so memory use does not grow with the log.
+
+    replay_records() accepts a single machine, a sequence of machines that
+    all receive every record, or a mapping of keys to machines, in which
+    case records are routed by their "machine" key and records without one
+    go to every machine. As fast as possible (speed=None), records are
+    dispatched in batches through dispatch_many(); in real-time mode they
+    are triggered one by one when they are due. Machines must already be
+    started. MachineInstance objects are supported; asyncio machines are
+    not.
+
+License:
+    Copyright 2020 Debby Nirwan
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+import gzip
+import json
+import time
+from collections import Counter
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, \
+    Mapping, Optional, Tuple
+
+Record = Tuple[float, Any, Any, Any]
+
+
+def parse_record(line: str) -> Record:
+    record = json.loads(line)
+    if isinstance(record, Mapping):
+        return (float(record.get("timestamp", 0.0)), record["event"],
+                record.get("data"), record.get("machine"))
+    if isinstance(record, list) and 2 <= len(record) <= 4:
+        record = record + [None] * (4 - len(record))
+        return float(record[0]), record[1], record[2], record[3]
+    raise ValueError(f"invalid record: {line.strip()}")
+
+
+def read_records(path: str) -> Iterator[Record]:
+    opener: Callable[..., Any] = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as fh:
+        for line in fh:
+            if line.strip():
+                yield parse_record(line)
+
+
+def paced(records: Iterable[Record], speed: float,
+          clock: Callable[[], float] = time.monotonic,
+          sleep: Callable[[float], Any] = time.sleep) -> Iterator[Record]:
+    if speed <= 0:
+        raise ValueError("speed must be positive")
+    started = origin = None
+    for record in records:
+        if started is None:
+            started, origin = clock(), record[0]
+        delay = started + (record[0] - origin) / speed - clock()
+        if delay > 0:
+            sleep(delay)
+        yield record
+
+
+def state_path(machine: Any) -> str:
+    states = getattr(machine, "active_states", None)
+    if states is None:
+        states = []
+        while machine is not None and machine.current_state is not None:
+            states.append(machine.current_state)
+            machine = machine.current_state.child_sm
+    return "/".join(str(state.name) for state in states)
+
+
+class ReplayReport(object):
+
+    def __init__(self, records: int, deliveries: int, elapsed: float,
+                 states: Dict[str, int]):
+        self._records = records
+        self._deliveries = deliveries
+        self._elapsed = elapsed
+        self._states = states
+
+    def __str__(self):
+        lines = [f"{self._records} records, {self._deliveries} deliveries "
+                 f"in {self._elapsed:.3f}s ({self.throughput:,.0f} "
+                 f"records/s)"]
+        lines.extend(f"{count:>10} {state}" for state, count in
+                     sorted(self._states.items(),
+                            key=lambda item: (-item[1], item[0])))
+        return "\n".join(lines)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"records": self._records, "deliveries": self._deliveries,
+                "elapsed": self._elapsed, "throughput": self.throughput,
+                "states": dict(self._states)}
+
+    @property
+    def records(self):
+        return self._records
+
+    @property
+    def deliveries(self):
+        return self._deliveries
+
+    @property
+    def elapsed(self):
+        return self._elapsed
+
+    @property
+    def throughput(self) -> float:
+        return self._records / self._elapsed if self._elapsed else 0.0
+
+    @property
+    def states(self):
+        return self._states
+
+
+def _dispatch(machine: Any, events: List[Tuple[Any, Any]], propagate: bool):
+    dispatch_many = getattr(machine, "dispatch_many", None)
+    if dispatch_many is not None:
+        dispatch_many(events, propagate)
+    else:
+        for evt, data in events:
+            machine.trigger_event(evt, data, propagate)
+
+
+def replay_records(records: Iterable[Record], machines: Any,
+                   speed: Optional[float] = None, propagate: bool = False,
+                   batch_size: int = 1024,
+                   clock: Callable[[], float] = time.perf_counter,
+                   sleep: Callable[[float], Any] = time.sleep) -> \
+        ReplayReport:
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+    if isinstance(machines, Mapping):
+        routes: Optional[Mapping[Any, Any]] = machines
+        targets = list(machines.values())
+    else:
+        routes = None
+        targets = list(machines) if isinstance(machines, (list, tuple)) \
+            else [machines]
+    if speed is not None:
+        records = paced(records, speed, clock, sleep)
+        batch_size = 1
+
+    count = deliveries = 0
+    iterator = iter(records)
+    started = clock()
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            break
+        count += len(batch)
+        if routes is None:
+            events = [(evt, data) for _, evt, data, _ in batch]
+            for machine in targets:
+                _dispatch(machine, events, propagate)
+            deliveries += len(events) * len(targets)
+            continue
+        routed: Dict[Any, List[Tuple[Any, Any]]] = {}
+        for _, evt, data, key in batch:
+            if key is None:
+                for machine in targets:
+                    routed.setdefault(id(machine), []).append((evt, data))
+                deliveries += len(targets)
+            elif key in routes:
+                routed.setdefault(id(routes[key]), []).append((evt, data))
+                deliveries += 1
+            else:
+                raise ValueError(f"unknown machine '{key}'")
+        for machine in targets:
+            events = routed.get(id(machine))
+            if events:
+                _dispatch(machine, events, propagate)
+    elapsed = clock() - started
+    return ReplayReport(count, deliveries, elapsed,
+                        dict(Counter(state_path(machine)
+                                     for machine in targets)))
@@ -0,0 +1,214 @@
+"""Actor-style scheduling of many state machines on a thread pool
+
+Description:
+    The Scheduler gives every StateMachine a bounded mailbox and drains the
+    mailboxes on a ThreadPoolExecutor. A machine is never executed on two
+    threads at once, so its events are processed in the order they were
+    posted, while independent machines run in parallel. When a mailbox is
+    full the configured OverflowPolicy decides whether the poster blocks,
+    the newest or oldest message is dropped, or queue.Full is raised.
+
+License:
+    Copyright 2020 Debby Nirwan
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+import logging
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+from enum import Enum
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+from .hfsm import Event, StateMachine
+
+
+class OverflowPolicy(Enum):
+    BLOCK = "block"
+    DROP_NEWEST = "drop_newest"
+    DROP_OLDEST = "drop_oldest"
+    RAISE = "raise"
+
+
+class Mailbox(object):
+
+    def __init__(self, machine: StateMachine, capacity: int,
+                 policy: OverflowPolicy):
+        if capacity < 1:
+            raise ValueError("mailbox capacity must be at least 1")
+        self._machine = machine
+        self._capacity = capacity
+        self._policy = policy
+        self._messages: Deque[Tuple[Event, Any, bool]] = deque()
+        self._lock = threading.Lock()
+        self._not_full = threading.Condition(self._lock)
+        self._scheduled = False
+        self._dropped = 0
+
+    def __len__(self):
+        return len(self._messages)
+
+    @property
+    def machine(self):
+        return self._machine
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    @property
+    def policy(self):
+        return self._policy
+
+    @property
+    def dropped(self):
+        return self._dropped
+
+
+class Scheduler(object):
+
+    def __init__(self, max_workers: Optional[int] = None,
+                 mailbox_size: int = 1024,
+                 overflow_policy: OverflowPolicy = OverflowPolicy.BLOCK,
+                 batch_size: int = 64,
+                 executor: Optional[Executor] = None,
+                 error_handler: Optional[
+                     Callable[[StateMachine, BaseException], None]] = None):
+        self._owns_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(max_workers)
+        self._mailbox_size = mailbox_size
+        self._overflow_policy = overflow_policy
+        self._batch_size = batch_size
+        self._error_handler = error_handler
+        self._mailboxes: Dict[int, Mailbox] = {}
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._pending = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+    def register(self, machine: StateMachine,
+                 mailbox_size: Optional[int] = None,
+                 overflow_policy: Optional[OverflowPolicy] = None) -> \
+            Mailbox:
+        with self._lock:
+            mailbox = self._mailboxes.get(id(machine))
+            if mailbox is None:
+                mailbox = Mailbox(machine,
+                                  mailbox_size or self._mailbox_size,
+                                  overflow_policy or self._overflow_policy)
+                self._mailboxes[id(machine)] = mailbox
+            return mailbox
+
+    def mailbox(self, machine: StateMachine) -> Mailbox:
+        mailbox = self._mailboxes.get(id(machine))
+        if mailbox is None:
+            mailbox = self.register(machine)
+        return mailbox
+
+    def post(self, machine: StateMachine, evt: Event, data: Any = None,
+             propagate: bool = False, timeout: Optional[float] = None) -> \
+            bool:
+        mailbox = self.mailbox(machine)
+        with mailbox._lock:
+            if len(mailbox._messages) >= mailbox._capacity:
+                policy = mailbox._policy
+                if policy is OverflowPolicy.DROP_NEWEST:
+                    mailbox._dropped += 1
+                    return False
+                elif policy is OverflowPolicy.DROP_OLDEST:
+                    mailbox._messages.popleft()
+                    mailbox._dropped += 1
+                    self._done(1)
+                elif policy is OverflowPolicy.RAISE:
+                    raise queue.Full
+                elif not mailbox._not_full.wait_for(
+                        lambda: len(mailbox._messages) < mailbox._capacity,
+                        timeout):
+                    raise queue.Full
+            with self._lock:
+                self._pending += 1
+            mailbox._messages.append((evt, data, propagate))
+            if mailbox._scheduled:
+                return True
+            mailbox._scheduled = True
+        self._executor.submit(self._run, mailbox)
+        return True
+
+    def _run(self, mailbox: Mailbox):
+        machine = mailbox._machine
+        try:
+            for _ in range(self._batch_size):
+                with mailbox._lock:
+                    if not mailbox._messages:
+                        mailbox._scheduled = False
+                        return
+                    evt, data, propagate = mailbox._messages.popleft()
+                    mailbox._not_full.notify()
+                try:
+                    machine.trigger_event(evt, data, propagate)
+                except Exception as error:
+                    self._report(machine, evt, error)
+                finally:
+                    self._done(1)
+        except BaseException:
+            try:
+                self._resubmit(mailbox)
+            except RuntimeError:
+                pass
+            raise
+        self._resubmit(mailbox)
+
+    def _resubmit(self, mailbox: Mailbox):
+        try:
+            self._executor.submit(self._run, mailbox)
+        except BaseException:
+            with mailbox._lock:
+                mailbox._scheduled = False
+            raise
+
+    def _report(self, machine: StateMachine, evt: Event,
+                error: Exception):
+        if self._error_handler is None:
+            logging.exception(f"Event {evt} failed in {machine}")
+            return
+        try:
+            self._error_handler(machine, error)
+        except Exception:
+            logging.exception(f"Error handler failed for event {evt} in "
+                              f"{machine}")
+
+    def _done(self, count: int):
+        with self._lock:
+            self._pending -= count
+            if not self._pending:
+                self._idle.notify_all()
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        with self._lock:
+            return self._idle.wait_for(lambda: not self._pending, timeout)
+
+    def shutdown(self, wait: bool = True):
+        if wait:
+            self.join()
+        if self._owns_executor:
+            self._executor.shutdown(wait)
+
+    @property
+    def pending(self):
+        return self._pending
@@ -0,0 +1,207 @@
+"""Process-pool sharded runtime for large numbers of machine instances
+
+Description:
+    A ShardedRuntime partitions machine instances across worker processes
+    by a user-supplied key. The machine definition is shipped to every
+    worker once, at startup; each worker then keeps a Blueprint of it and
+    one MachineInstance per key. Events are routed to the owning shard in
+    batches and every shard reports how many events it processed, how many
+    transitions fired and how long it took. An exception raised while an
+    event is processed is counted in the shard's result, together with the
+    message of the first one, and does not stop the shard.
+
+License:
+    Copyright 2020 Debby Nirwan
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+import multiprocessing
+import time
+import traceback
+from typing import Any, Callable, Dict, Hashable, Iterable, List, \
+    NamedTuple, Optional, Tuple
+
+from .blueprint import Blueprint, MachineInstance
+from .hfsm import Event, StateMachine
+
+
+class ShardResult(NamedTuple):
+    shard: int
+    events: int
+    transitions: int
+    instances: int
+    elapsed: float
+    errors: int = 0
+    error: Optional[str] = None
+
+
+def _shard_worker(definition: StateMachine, connection, start_data: Any):
+    blueprint = Blueprint(definition)
+    instances: Dict[Hashable, MachineInstance] = {}
+    events = transitions = errors = 0
+    error: Optional[str] = None
+    elapsed = 0.0
+    while True:
+        command, payload = connection.recv()
+        if command == "dispatch":
+            records, propagate = payload
+            started = time.perf_counter()
+            for key, evt, data in records:
+                try:
+                    instance = instances.get(key)
+                    if instance is None:
+                        instance = blueprint.create()
+                        instance.start(start_data)
+                        instances[key] = instance
+                    if instance.trigger_event(evt, data, propagate):
+                        transitions += 1
+                except Exception as exception:
+                    errors += 1
+                    if error is None:
+                        error = "".join(traceback.format_exception_only(
+                            type(exception), exception)).strip()
+            events += len(records)
+            elapsed += time.perf_counter() - started
+            connection.send(None)
+        elif command == "results":
+            connection.send((events, transitions, len(instances), elapsed,
+                             errors, error))
+            events = transitions = errors = 0
+            error = None
+            elapsed = 0.0
+        elif command == "states":
+            keys = instances.keys() if payload is None else payload
+            connection.send({key: instances[key].current_state.name
+                             for key in keys if key in instances})
+        else:
+            break
+    connection.close()
+
+
+class ShardedRuntime(object):
+
+    def __init__(self, definition: StateMachine, shards: int,
+                 partition: Optional[Callable[[Hashable], int]] = None,
+                 batch_size: int = 1024, start_data: Any = None,
+                 context: Optional[str] = None):
+        if shards < 1:
+            raise ValueError("shards must be at least 1")
+        if not definition.initial_state:
+            raise ValueError("initial state is not set")
+        self._definition = definition
+        self._shards = shards
+        self._partition = partition
+        self._batch_size = batch_size
+        self._start_data = start_data
+        self._context = multiprocessing.get_context(context)
+        self._processes: List[Any] = []
+        self._connections: List[Any] = []
+        self._outstanding: List[bool] = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def start(self):
+        if self._processes:
+            raise ValueError("sharded runtime is already started")
+        for _ in range(self._shards):
+            parent_connection, child_connection = self._context.Pipe()
+            process = self._context.Process(
+                target=_shard_worker,
+                args=(self._definition, child_connection, self._start_data),
+                daemon=True)
+            process.start()
+            child_connection.close()
+            self._processes.append(process)
+            self._connections.append(parent_connection)
+            self._outstanding.append(False)
+
+    def close(self):
+        for connection in self._connections:
+            try:
+                connection.send(("stop", None))
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self._processes:
+            process.join()
+        for connection in self._connections:
+            connection.close()
+        self._processes = []
+        self._connections = []
+        self._outstanding = []
+
+    def shard_of(self, key: Hashable) -> int:
+        if self._partition is not None:
+            return self._partition(key) % self._shards
+        return hash(key) % self._shards
+
+    def _send(self, shard: int, batch: List[Tuple[Hashable, Event, Any]],
+              propagate: bool):
+        self._wait(shard)
+        self._connections[shard].send(("dispatch", (batch, propagate)))
+        self._outstanding[shard] = True
+
+    def _wait(self, shard: int):
+        if self._outstanding[shard]:
+            self._connections[shard].recv()
+            self._outstanding[shard] = False
+
+    def dispatch(self, records: Iterable[Tuple[Hashable, Event, Any]],
+                 propagate: bool = False) -> List[ShardResult]:
+        if not self._processes:
+            raise ValueError("sharded runtime has not been started")
+        batches: List[List[Tuple[Hashable, Event, Any]]] = \
+            [[] for _ in range(self._shards)]
+        for record in records:
+            shard = self.shard_of(record[0])
+            batch = batches[shard]
+            batch.append(record)
+            if len(batch) >= self._batch_size:
+                self._send(shard, batch, propagate)
+                batches[shard] = []
+        for shard, batch in enumerate(batches):
+            if batch:
+                self._send(shard, batch, propagate)
+        results = []
+        for shard, connection in enumerate(self._connections):
+            self._wait(shard)
+            connection.send(("results", None))
+        for shard, connection in enumerate(self._connections):
+            results.append(ShardResult(shard, *connection.recv()))
+        return results
+
+    def states(self, keys: Optional[Iterable[Hashable]] = None) -> \
+            Dict[Hashable, str]:
+        if not self._processes:
+            raise ValueError("sharded runtime has not been started")
+        requests: List[Optional[List[Hashable]]]
+        if keys is None:
+            requests = [None] * self._shards
+        else:
+            requests = [[] for _ in range(self._shards)]
+            for key in keys:
+                requests[self.shard_of(key)].append(key)
+        for connection, request in zip(self._connections, requests):
+            connection.send(("states", request))
+        states: Dict[Hashable, str] = {}
+        for connection in self._connections:
+            states.update(connection.recv())
+        return states
+
+    @property
+    def shards(self):
+        return self._shards
@@ -0,0 +1,183 @@
+"""Hierarchical timing wheel for timed transitions
+
+Description:
+    A TimingWheel keeps timers in a few levels of fixed-size slot arrays.
+    Level 0 has one slot per tick of the wheel's resolution, and every
+    higher level covers a whole rotation of the level below it. Arming and
+    cancelling a timer are O(1); timers in higher levels are cascaded down
+    as the wheel turns. The wheel is driven either manually, with
+    advance(now) for tests and simulations, or by the drive() coroutine on
+    an asyncio event loop. A wheel created without now starts at 0.0 for
+    advance(), or at the clock's time when drive() is its first driver.
+
+    StateMachine.add_timeout_transition() uses a wheel to arm a timer when a
+    state starts and cancel it when the state stops.
+
+License:
+    Copyright 2020 Debby Nirwan
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+import asyncio
+import math
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+
+class Timer(object):
+    __slots__ = ("_wheel", "_deadline", "_callback", "_args", "_bucket")
+
+    def __init__(self, wheel: "TimingWheel", deadline: int,
+                 callback: Callable[..., Any], args: tuple):
+        self._wheel = wheel
+        self._deadline = deadline
+        self._callback = callback
+        self._args = args
+        self._bucket: Optional[Dict["Timer", None]] = None
+
+    def cancel(self):
+        if self._bucket is not None:
+            del self._bucket[self]
+            self._bucket = None
+            self._wheel._count -= 1
+
+    @property
+    def active(self) -> bool:
+        return self._bucket is not None
+
+    @property
+    def deadline(self) -> float:
+        return self._wheel._time_of(self._deadline)
+
+
+class TimingWheel(object):
+
+    def __init__(self, resolution: float = 0.01, slots: int = 256,
+                 levels: int = 4, now: Optional[float] = None):
+        if resolution <= 0:
+            raise ValueError("resolution must be positive")
+        if slots < 2 or slots & (slots - 1):
+            raise ValueError("slots must be a power of two")
+        if levels < 1:
+            raise ValueError("levels must be at least 1")
+        self._resolution = resolution
+        self._slots = slots
+        self._bits = slots.bit_length() - 1
+        self._mask = slots - 1
+        self._wheels: List[List[Dict[Timer, None]]] = [
+            [{} for _ in range(slots)] for _ in range(levels)]
+        self._origin = 0.0 if now is None else now
+        self._anchored = now is not None
+        self._tick = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def _time_of(self, tick: int) -> float:
+        return self._origin + tick * self._resolution
+
+    def schedule(self, delay: float, callback: Callable[..., Any],
+                 *args: Any) -> Timer:
+        ticks = max(1, math.ceil(delay / self._resolution - 1e-9))
+        timer = Timer(self, self._tick + ticks, callback, args)
+        self._place(timer)
+        self._count += 1
+        return timer
+
+    def schedule_at(self, when: float, callback: Callable[..., Any],
+                    *args: Any) -> Timer:
+        return self.schedule(when - self.now, callback, *args)
+
+    def _place(self, timer: Timer):
+        delta = timer._deadline - self._tick
+        level = 0
+        limit = self._slots
+        while delta >= limit and level < len(self._wheels) - 1:
+            level += 1
+            limit <<= self._bits
+        if delta >= limit:
+            index = (self._tick + limit - 1) >> (level * self._bits)
+        else:
+            index = timer._deadline >> (level * self._bits)
+        bucket = self._wheels[level][index & self._mask]
+        bucket[timer] = None
+        timer._bucket = bucket
+
+    def _cascade(self):
+        for level in range(1, len(self._wheels)):
+            shift = level * self._bits
+            if self._tick & ((1 << shift) - 1):
+                return
+            index = (self._tick >> shift) & self._mask
+            bucket = self._wheels[level][index]
+            self._wheels[level][index] = {}
+            for timer in bucket:
+                self._place(timer)
+
+    def advance(self, now: float) -> int:
+        self._anchored = True
+        target = math.floor((now - self._origin) / self._resolution + 1e-9)
+        fired = 0
+        while self._tick < target:
+            if not self._count:
+                self._tick = target
+                break
+            self._tick += 1
+            self._cascade()
+            index = self._tick & self._mask
+            bucket = self._wheels[0][index]
+            if not bucket:
+                continue
+            self._wheels[0][index] = {}
+            pending = list(bucket)
+            for position, timer in enumerate(pending):
+                if timer._bucket is not bucket:
+                    continue
+                if timer._deadline > self._tick:
+                    self._place(timer)
+                    continue
+                timer._bucket = None
+                self._count -= 1
+                try:
+                    timer._callback(*timer._args)
+                except BaseException:
+                    self._requeue(pending[position + 1:], bucket, index)
+                    raise
+                fired += 1
+        return fired
+
+    def _requeue(self, timers: List[Timer], bucket: Dict[Timer, None],
+                 index: int):
+        current = self._wheels[0][index]
+        for timer in timers:
+            if timer._bucket is bucket:
+                current[timer] = None
+                timer._bucket = current
+        self._tick -= 1
+
+    async def drive(self, clock: Callable[[], float] = time.monotonic):
+        if not self._anchored:
+            self._origin = clock() - self._tick * self._resolution
+            self._anchored = True
+        while True:
+            self.advance(clock())
+            await asyncio.sleep(self._resolution)
+
+    @property
+    def now(self) -> float:
+        return self._time_of(self._tick)
+
+    @property
+    def resolution(self):
+        return self._resolution
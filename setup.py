@@ -18,7 +18,10 @@ setuptools.setup(
         "License :: OSI Approved :: Apache Software License",
         "Operating System :: OS Independent",
     ],
-    python_requires='>=3.6',
+    python_requires='>=3.7',
+    extras_require={
+        "numpy": ["numpy"],
+    },
     license="Apache License, Version 2.0",
     platforms="Python 3",
 )
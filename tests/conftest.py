@@ -0,0 +1,46 @@
+from hfsm import State, StateMachine, Event
+import pytest
+
+
+def build_fsm(transitions=(), name="sm", machine_type=StateMachine,
+              state_type=State, states=(), events=(), children=None):
+    """Build a state machine from the names of its states and events
+
+    transitions holds (source, destination, event) tuples with an optional
+    "normal", "self" or "null" type as a fourth item. States are added in
+    the order they are named, those in states first, and the first one is
+    the initial state. Names ending in ExitState become exit states and
+    children maps state names to their child state machines.
+    """
+    state_machine = machine_type(name)
+    children = children or {}
+    added = {state_machine.exit_state.name: state_machine.exit_state}
+    names = list(states)
+    for source, destination, *_ in transitions:
+        names += [source, destination or source]
+    for state_name in names:
+        if state_name in added:
+            continue
+        if state_name.endswith("ExitState"):
+            state = state_machine._exit_state_type(state_name[:-9])
+        else:
+            state = state_type(state_name, children.get(state_name))
+        state_machine.add_state(state, initial_state=len(added) == 1)
+        added[state_name] = state
+    names = list(events) + [transition[2] for transition in transitions]
+    for event_name in dict.fromkeys(names):
+        state_machine.add_event(Event(event_name))
+    for source, destination, event_name, *kind in transitions:
+        source, event = added[source], Event(event_name)
+        if kind == ["null"]:
+            state_machine.add_null_transition(source, event)
+        elif kind == ["self"]:
+            state_machine.add_self_transition(source, event)
+        else:
+            state_machine.add_transition(source, added[destination], event)
+    return state_machine
+
+
+@pytest.fixture
+def fsm_builder():
+    return build_fsm
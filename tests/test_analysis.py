@@ -0,0 +1,109 @@
+from hfsm import State, StateMachine, Event, analyze, \
+    LoggingTracer, set_tracer
+from unittest.mock import MagicMock
+import pytest
+
+
+class TestAnalysis:
+
+    @pytest.fixture
+    def create_fsm(self, fsm_builder):
+        def create():
+            child_sm = fsm_builder(
+                [("child_state", "NormalExitState", "child_event")],
+                "child_sm")
+            return fsm_builder(
+                [("initial_state", "busy_state", "go"),
+                 ("busy_state", "ErrorExitState", "fail"),
+                 ("busy_state", "stuck_state", "stick"),
+                 ("stuck_state", "stuck_state", "go"),
+                 ("orphan_state", "busy_state", "fail")],
+                states=["initial_state", "busy_state", "stuck_state",
+                        "orphan_state"],
+                events=["go", "stick", "fail", "unused"],
+                children={"orphan_state": child_sm})
+        return create
+
+    def test_analyze(self, create_fsm):
+        report = analyze(create_fsm())
+        assert not report.clean
+        root, child = report.machines
+        assert root.path == "sm"
+        assert [state.name for state in root.unreachable_states] == \
+            ["orphan_state"]
+        assert [event.name for event in root.dead_events] == ["unused"]
+        assert [state.name for state in root.trapped_states] == \
+            ["stuck_state"]
+        assert child.path == "sm/child_sm"
+        assert [state.name for state in child.unreachable_states] == \
+            ["child_state"]
+        assert [event.name for event in child.dead_events] == \
+            ["child_event"]
+        assert child.trapped_states == ()
+        assert "sm: dead event unused" in str(report).splitlines()
+
+    def test_clean_report(self):
+        state_machine = StateMachine("sm")
+        state = State("state")
+        event = Event("event")
+        state_machine.add_state(state, initial_state=True)
+        state_machine.add_event(event)
+        state_machine.add_transition(state, state_machine.exit_state, event)
+        report = analyze(state_machine)
+        assert report.clean
+        assert str(report) == ""
+        assert report.as_dict()["acceptors"] == {"event": ["state"]}
+
+    def test_accepting_states(self, create_fsm):
+        state_machine = create_fsm()
+        acceptors = state_machine.accepting_states()
+        assert acceptors[Event("go")] == frozenset(
+            [State("initial_state"), State("stuck_state")])
+        assert acceptors[Event("child_event")] == frozenset(
+            [State("child_state")])
+        assert Event("unused") not in acceptors
+        assert state_machine.accepted_events() == frozenset(acceptors)
+
+    def test_irrelevant_event_rejected(self, create_fsm):
+        state_machine = create_fsm()
+        state_machine.compile()
+        assert state_machine.accepting_states() is \
+            state_machine._acceptors
+        state_machine.start("data")
+        state_machine._dispatch_tree = MagicMock()
+        tracer = LoggingTracer()
+        tracer.on_unhandled = MagicMock()
+        set_tracer(tracer)
+        try:
+            state_machine.trigger_event(Event("unused"), "data",
+                                        propagate=True)
+            state_machine.trigger_event("broadcast", "data", propagate=True)
+        finally:
+            set_tracer(None)
+        state_machine._dispatch_tree.assert_not_called()
+        assert tracer.on_unhandled.call_count == 2
+        assert state_machine.current_state.name == "initial_state"
+
+    def test_inactive_acceptor_rejected(self, create_fsm):
+        state_machine = create_fsm()
+        state_machine.compile()
+        state_machine.start("data")
+        dispatch_tree = state_machine._dispatch_tree
+        state_machine._dispatch_tree = MagicMock(side_effect=dispatch_tree)
+        state_machine.trigger_event(Event("fail"), "data", propagate=True)
+        state_machine.trigger_event(Event("fail"), "data")
+        state_machine._dispatch_tree.assert_not_called()
+        assert state_machine.current_state.name == "initial_state"
+        state_machine.trigger_event(Event("go"), "data", propagate=True)
+        state_machine._dispatch_tree.assert_called_once()
+        assert state_machine.current_state.name == "busy_state"
+        state_machine.trigger_event(Event("fail"), "data")
+        assert state_machine.current_state.name == "ErrorExitState"
+
+    def test_accepting_states_frozen(self, create_fsm):
+        state_machine = create_fsm()
+        state_machine.compile()
+        with pytest.raises(ValueError):
+            state_machine.add_event(Event("late"))
+        assert analyze(state_machine).acceptors is \
+            state_machine.accepting_states()
@@ -0,0 +1,214 @@
+from hfsm import State, StateMachine, Event, AsyncState, AsyncExitState, \
+    AsyncStateMachine, AsyncNormalTransition
+from unittest.mock import MagicMock
+import asyncio
+import pytest
+
+
+class TestAsyncStateMachine:
+
+    @pytest.fixture
+    def create_child_fsm(self, fsm_builder):
+        return lambda: fsm_builder(
+            [("child_initial_state", "child_second_state", "event")],
+            "child_sm", AsyncStateMachine, AsyncState)
+
+    @pytest.fixture
+    def create_fsm(self, fsm_builder):
+        def create(calls):
+            state_machine = fsm_builder(
+                [("initial_state", "second_state", "event"),
+                 ("second_state", "ErrorExitState", "error")],
+                machine_type=AsyncStateMachine, state_type=AsyncState)
+
+            async def on_entry(data):
+                await asyncio.sleep(0)
+                calls.append(("entry", data))
+
+            async def on_exit(data):
+                await asyncio.sleep(0)
+                calls.append(("exit", data))
+
+            initial_state = state_machine.initial_state
+            second_state = state_machine.find_transition(
+                initial_state, Event("event")).destination_state
+            initial_state.on_exit(on_exit)
+            second_state.on_entry(on_entry)
+            return state_machine
+        return create
+
+    def test_rejects_sync_states(self):
+        state_machine = AsyncStateMachine("sm")
+        with pytest.raises(TypeError):
+            state_machine.add_state(State("state"))
+        with pytest.raises(TypeError):
+            state_machine.add_state(AsyncState("state", StateMachine("sm")))
+        with pytest.raises(TypeError):
+            AsyncState("state").set_child_sm(StateMachine("sm"))
+
+    def test_async_transition_types(self):
+        state_machine = AsyncStateMachine("sm")
+        assert isinstance(state_machine.exit_state, AsyncExitState)
+        initial_state = AsyncState("initial_state")
+        event = Event("event")
+        state_machine.add_state(initial_state, initial_state=True)
+        state_machine.add_event(event)
+        transition = state_machine.add_transition(
+            initial_state, state_machine.exit_state, event)
+        assert isinstance(transition, AsyncNormalTransition)
+
+    def test_event_trigger(self, create_fsm):
+        calls = []
+        exit_sm_cb = MagicMock()
+
+        async def run():
+            state_machine = create_fsm(calls)
+            state_machine.on_exit(exit_sm_cb)
+            with pytest.raises(ValueError):
+                await state_machine.trigger_event(Event("event"))
+            await state_machine.start("data")
+            await state_machine.trigger_event(Event("event"), "data")
+            assert state_machine.current_state.name == "second_state"
+            await state_machine.trigger_event(Event("error"), "data")
+            return state_machine
+
+        state_machine = asyncio.run(run())
+        assert calls == [("exit", "data"), ("entry", "data")]
+        exit_sm_cb.assert_called_once_with(state_machine.current_state,
+                                           "data")
+
+    def test_async_condition_and_action(self, create_fsm):
+        action = MagicMock()
+
+        async def condition(data):
+            await asyncio.sleep(0)
+            return data == "yes"
+
+        async def run():
+            state_machine = create_fsm([])
+            transition = state_machine.find_transition(
+                AsyncState("initial_state"), Event("event"))
+            transition.add_condition(condition)
+            transition.add_action(action)
+            await state_machine.start("data")
+            await state_machine.trigger_event(Event("event"), "no")
+            assert state_machine.current_state.name == "initial_state"
+            await state_machine.trigger_event(Event("event"), "yes")
+            assert state_machine.current_state.name == "second_state"
+
+        asyncio.run(run())
+        action.assert_called_once_with("yes")
+
+    def test_run_to_completion(self, create_fsm):
+        calls = []
+
+        async def run():
+            state_machine = create_fsm(calls)
+
+            async def on_second_entry(data):
+                await state_machine.trigger_event(Event("error"), data)
+                calls.append(("entry done", data))
+
+            state_machine.find_transition(
+                AsyncState("initial_state"),
+                Event("event")).destination_state.on_entry(on_second_entry)
+            await state_machine.start("data")
+            await state_machine.dispatch_many([(Event("event"), "data")])
+            assert state_machine.current_state.name == "ErrorExitState"
+
+        asyncio.run(run())
+        assert calls == [("exit", "data"), ("entry", "data"),
+                         ("entry done", "data")]
+
+    def test_trigger_during_start(self, create_fsm):
+        calls = []
+
+        async def run():
+            state_machine = create_fsm(calls)
+
+            async def on_initial_entry(data):
+                await state_machine.trigger_event(Event("event"), data)
+                calls.append(("entry done", data))
+
+            state_machine.initial_state.on_entry(on_initial_entry)
+            await state_machine.start("data")
+            assert state_machine.current_state.name == "second_state"
+
+        asyncio.run(run())
+        assert calls == [("entry done", "data"), ("exit", "data"),
+                         ("entry", "data")]
+
+    def test_concurrent_callers(self, create_fsm):
+        calls = []
+
+        async def run():
+            state_machine = create_fsm(calls)
+
+            async def on_error_entry(data):
+                raise RuntimeError(data)
+
+            state_machine.find_transition(
+                AsyncState("second_state"),
+                Event("error")).destination_state.on_entry(on_error_entry)
+            await state_machine.start("data")
+            first = asyncio.ensure_future(
+                state_machine.trigger_event(Event("event"), "a"))
+            await asyncio.sleep(0)
+            assert state_machine._dispatching
+            second = asyncio.ensure_future(
+                state_machine.trigger_event(Event("error"), "b"))
+            await asyncio.sleep(0)
+            assert not second.done()
+            await first
+            with pytest.raises(RuntimeError, match="b"):
+                await second
+            assert state_machine.current_state.name == "ErrorExitState"
+
+        asyncio.run(run())
+        assert calls == [("exit", "a"), ("entry", "a")]
+
+    def test_propagate_with_child_sm(self, create_child_fsm):
+        async def run():
+            state_machine = AsyncStateMachine("sm")
+            child_sm = create_child_fsm()
+            initial_state = AsyncState("initial_state", child_sm)
+            state_machine.add_state(initial_state, initial_state=True)
+            await state_machine.start("data")
+            await state_machine.trigger_event(Event("event"), "data",
+                                              propagate=True)
+            assert child_sm.current_state.name == "child_second_state"
+
+        asyncio.run(run())
+
+    def test_concurrent_machines(self, create_fsm):
+        async def run():
+            machines = [create_fsm([]) for _ in range(100)]
+            await asyncio.gather(*(sm.start("data") for sm in machines))
+            await asyncio.gather(*(sm.trigger_event(Event("event"), "data")
+                                   for sm in machines))
+            return machines
+
+        machines = asyncio.run(run())
+        assert all(sm.current_state.name == "second_state"
+                   for sm in machines)
+
+    def test_event_bubbling(self, create_child_fsm):
+        async def run():
+            state_machine = AsyncStateMachine("sm")
+            child_sm = create_child_fsm()
+            initial_state = AsyncState("initial_state", child_sm)
+            second_state = AsyncState("second_state")
+            error_event = Event("error")
+            state_machine.add_state(initial_state, initial_state=True)
+            state_machine.add_state(second_state)
+            state_machine.add_event(error_event)
+            state_machine.add_transition(initial_state, second_state,
+                                         error_event)
+            await state_machine.start("data")
+            assert state_machine.active_leaf is child_sm
+            await state_machine.trigger_event(error_event, "data",
+                                              propagate=True)
+            assert state_machine.current_state == second_state
+            assert state_machine.active_leaf is state_machine
+
+        asyncio.run(run())
@@ -0,0 +1,173 @@
+from hfsm import State, StateMachine, Event, Blueprint, \
+    MachineInstance, snapshot_many, restore_many
+from unittest.mock import MagicMock
+import sys
+import pytest
+
+
+class TestBlueprint:
+
+    @pytest.fixture
+    def create_fsm(self, fsm_builder):
+        def create():
+            child_sm = fsm_builder(
+                [("child_initial_state", "child_second_state",
+                  "child_event")], "child_sm")
+            return fsm_builder(
+                [("initial_state", "second_state", "event"),
+                 ("second_state", "ErrorExitState", "error")],
+                children={"second_state": child_sm})
+        return create
+
+    def test_without_initial_state(self):
+        with pytest.raises(ValueError):
+            Blueprint(StateMachine("sm"))
+
+    def test_regions_rejected(self, create_fsm):
+        state_machine = create_fsm()
+        region = StateMachine("region")
+        region.add_state(State("region_state"), initial_state=True)
+        child_sm = state_machine.find_transition(
+            State("initial_state"), Event("event")).destination_state.child_sm
+        parallel_state = State("parallel_state")
+        parallel_state.add_region(region)
+        child_sm.add_state(parallel_state)
+        with pytest.raises(ValueError):
+            Blueprint(state_machine)
+
+    def test_blueprint_freezes_machine(self, create_fsm):
+        state_machine = create_fsm()
+        blueprint = Blueprint(state_machine)
+        assert state_machine.frozen
+        assert blueprint.machine is state_machine
+        assert isinstance(blueprint.create(), MachineInstance)
+        assert len(blueprint.create_many(3)) == 3
+
+    def test_instances_are_independent(self, create_fsm):
+        state_machine = create_fsm()
+        blueprint = Blueprint(state_machine)
+        instance1, instance2 = blueprint.create_many(2)
+        instance1.start("data")
+        instance2.start("data")
+        assert instance1.trigger_event(Event("event"), "data")
+        assert instance1.current_state.name == "second_state"
+        assert instance2.current_state.name == "initial_state"
+        assert state_machine.current_state is None
+        assert [state.name for state in instance1.active_states] == \
+            ["second_state", "child_initial_state"]
+        assert instance1.trigger_event(Event("child_event"), "data",
+                                       propagate=True)
+        assert instance1.active_states[-1].name == "child_second_state"
+        assert state_machine.table.state_id(instance1.current_state) == 2
+
+    def test_instances_share_paths(self, create_fsm):
+        blueprint = Blueprint(create_fsm())
+        instance1, instance2 = blueprint.create_many(2)
+        instance1.start("data")
+        instance2.start("data")
+        assert instance1.active_states is instance2.active_states
+
+    def test_instance_is_compact(self, create_fsm):
+        instance = Blueprint(create_fsm()).create()
+        assert not hasattr(instance, "__dict__")
+        assert sys.getsizeof(instance) <= 64
+
+    def test_callbacks(self, create_fsm):
+        state_machine = create_fsm()
+        exit_sm_cb = MagicMock()
+        state_machine.on_exit(exit_sm_cb)
+        entry_cb = MagicMock()
+        exit_cb = MagicMock()
+        child_entry_cb = MagicMock()
+        second_state = state_machine.find_transition(
+            State("initial_state"), Event("event")).destination_state
+        second_state.on_entry(entry_cb)
+        second_state.on_exit(exit_cb)
+        second_state.child_sm.initial_state.on_entry(child_entry_cb)
+        instance = Blueprint(state_machine).create()
+        instance.start("data")
+        instance.trigger_event(Event("event"), "data")
+        entry_cb.assert_called_once_with("data")
+        child_entry_cb.assert_called_once_with("data")
+        exit_cb.assert_not_called()
+        instance.trigger_event(Event("error"), "data")
+        exit_cb.assert_called_once_with("data")
+        assert instance.current_state.name == "ErrorExitState"
+        assert instance.exited
+        exit_sm_cb.assert_called_once_with(instance.current_state, "data")
+
+    def test_condition_and_action(self, create_fsm):
+        state_machine = create_fsm()
+        transition = state_machine.find_transition(State("initial_state"),
+                                                   Event("event"))
+        condition = MagicMock(return_value=False)
+        action = MagicMock()
+        transition.add_condition(condition)
+        transition.add_action(action)
+        instance = Blueprint(state_machine).create()
+        instance.start("data")
+        assert not instance.trigger_event(Event("event"), "data")
+        assert instance.current_state.name == "initial_state"
+        action.assert_not_called()
+        condition.return_value = True
+        assert instance.trigger_event(Event("event"), "data")
+        action.assert_called_once_with("data")
+
+    def test_event_by_name(self, create_fsm):
+        instance = Blueprint(create_fsm()).create()
+        instance.start("data")
+        assert instance.trigger_event("event", "data")
+        assert instance.trigger_event("child_event", "data",
+                                      propagate=True)
+        assert [state.name for state in instance.active_states] == \
+            ["second_state", "child_second_state"]
+
+    def test_invalid_event(self, create_fsm):
+        instance = Blueprint(create_fsm()).create()
+        with pytest.raises(ValueError):
+            instance.trigger_event(Event("event"))
+        instance.start("data")
+        assert not instance.trigger_event(Event("error"), "data")
+        assert instance.is_running()
+
+    def test_stop(self, create_fsm):
+        instance = Blueprint(create_fsm()).create()
+        with pytest.raises(ValueError):
+            instance.stop("data")
+        instance.start("data")
+        instance.stop("data")
+        assert not instance.is_running()
+        assert instance.exited
+
+    def test_snapshot_restore(self, create_fsm):
+        entry_cb = MagicMock()
+        state_machine = create_fsm()
+        state_machine.find_transition(
+            State("initial_state"),
+            Event("event")).destination_state.on_entry(entry_cb)
+        blueprint = Blueprint(state_machine)
+        instances = blueprint.create_many(3)
+        for instance in instances:
+            instance.start("data")
+        instances[1].trigger_event(Event("event"), "data")
+        instances[2].trigger_event(Event("event"), "data")
+        instances[2].trigger_event(Event("child_event"), "data",
+                                   propagate=True)
+        assert instances[2].snapshot() == bytes([2, 4, 4])
+        buffer = snapshot_many(instances)
+        entry_cb.reset_mock()
+        restored = blueprint.create_many(3)
+        restore_many(restored, buffer)
+        entry_cb.assert_not_called()
+        assert [instance.active_states for instance in restored] == \
+            [instance.active_states for instance in instances]
+        assert all(instance.is_running() for instance in restored)
+        with pytest.raises(ValueError):
+            restored[0].restore(bytes([2, 2, 2]))
+
+    def test_event_bubbling(self, create_fsm):
+        instance = Blueprint(create_fsm()).create()
+        instance.start("data")
+        instance.trigger_event(Event("event"), "data")
+        assert instance.trigger_event(Event("error"), "data", propagate=True)
+        assert instance.current_state.name == "ErrorExitState"
@@ -0,0 +1,149 @@
+from hfsm import State, StateMachine, Event, AsyncState, \
+    AsyncStateMachine, CoalescingPolicy, TimingWheel, specialize
+from unittest.mock import MagicMock
+import asyncio
+import pytest
+
+
+class TestCoalescing:
+
+    @pytest.fixture
+    def create_fsm(self, fsm_builder):
+        def create(machine_type=StateMachine, state_type=State):
+            state_machine = fsm_builder(
+                [("initial_state", None, "sample", "null"),
+                 ("initial_state", None, "other", "null")],
+                machine_type=machine_type, state_type=state_type)
+            callbacks = MagicMock(), MagicMock()
+            for name, callback in zip(("sample", "other"), callbacks):
+                state_machine.find_transition(
+                    state_machine.initial_state,
+                    Event(name)).add_action(callback)
+            return (state_machine,) + callbacks
+        return create
+
+    def test_policy(self, create_fsm):
+        with pytest.raises(ValueError):
+            CoalescingPolicy(window=-1.0)
+        state_machine, _, _ = create_fsm()
+        policy = state_machine.set_coalescing("sample", window=0.5)
+        assert state_machine.coalescing == {Event("sample"): policy}
+        assert policy.as_dict() == {"merge": True, "window": 0.5,
+                                    "merged": 0, "dropped": 0}
+        state_machine.remove_coalescing(Event("sample"))
+        assert state_machine.coalescing == {}
+
+    def test_merge_consecutive_in_batch(self, create_fsm):
+        state_machine, sample_cb, other_cb = create_fsm()
+        policy = state_machine.set_coalescing(Event("sample"))
+        state_machine.start("data")
+        state_machine.dispatch_many([("sample", 1), ("sample", 2),
+                                     ("other", 3), (Event("sample"), 4),
+                                     ("sample", 5)])
+        assert [item.args[0] for item in sample_cb.call_args_list] == [2, 5]
+        other_cb.assert_called_once_with(3)
+        assert policy.merged == 2
+        assert policy.dropped == 0
+
+    def test_merge_queued_events(self, create_fsm):
+        state_machine, sample_cb, other_cb = create_fsm()
+        policy = state_machine.set_coalescing(Event("sample"))
+
+        def burst(data):
+            for value in range(3):
+                state_machine.trigger_event(Event("sample"), value)
+            state_machine.trigger_event(Event("sample"), "propagated",
+                                        propagate=True)
+
+        other_cb.side_effect = burst
+        state_machine.start("data")
+        state_machine.trigger_event(Event("other"), "data")
+        assert [item.args[0] for item in sample_cb.call_args_list] == \
+            [2, "propagated"]
+        assert policy.merged == 2
+
+    def test_debounce_window(self, create_fsm):
+        state_machine, sample_cb, other_cb = create_fsm()
+        clock = MagicMock(side_effect=[0.0, 0.5, 1.0, 1.2, 3.0])
+        policy = state_machine.set_coalescing(Event("sample"), merge=False,
+                                              window=1.0, clock=clock)
+        state_machine.start("data")
+        for value in range(4):
+            state_machine.trigger_event(Event("sample"), value)
+            state_machine.trigger_event(Event("other"), value)
+        assert [item.args[0] for item in sample_cb.call_args_list] == [0, 2]
+        assert other_cb.call_count == 4
+        assert policy.dropped == 1
+        assert policy.merged == 0
+        assert policy.pending
+        state_machine.flush_coalesced()
+        assert [item.args[0] for item in sample_cb.call_args_list] == \
+            [0, 2, 3]
+        assert not policy.pending
+        state_machine.flush_coalesced(Event("sample"))
+        assert sample_cb.call_count == 3
+
+    def test_trailing_edge_on_timing_wheel(self, create_fsm):
+        state_machine, sample_cb, _ = create_fsm()
+        wheel = TimingWheel(resolution=0.1)
+        state_machine.set_timing_wheel(wheel)
+        clock = MagicMock(side_effect=[0.0, 0.2, 0.2, 0.4, 1.0])
+        policy = state_machine.set_coalescing(Event("sample"), merge=False,
+                                              window=1.0, clock=clock)
+        state_machine.start("data")
+        for value in range(3):
+            state_machine.trigger_event(Event("sample"), value)
+        sample_cb.assert_called_once_with(0)
+        assert len(wheel) == 1
+        wheel.advance(0.7)
+        assert sample_cb.call_count == 1
+        wheel.advance(0.8)
+        assert [item.args[0] for item in sample_cb.call_args_list] == \
+            [0, 2]
+        assert policy.dropped == 1
+        assert not policy.pending
+        assert len(wheel) == 0
+
+    def test_specialized_machine(self, create_fsm):
+        state_machine, sample_cb, _ = create_fsm()
+        specialize(state_machine)
+        state_machine.set_coalescing(
+            Event("sample"), window=1.0,
+            clock=MagicMock(side_effect=[0.0, 0.5]))
+        state_machine.start("data")
+        state_machine.trigger_event(Event("sample"), 1)
+        state_machine.trigger_event(Event("sample"), 2)
+        sample_cb.assert_called_once_with(1)
+
+    def test_async_merge(self, create_fsm):
+        state_machine, sample_cb, _ = create_fsm(AsyncStateMachine,
+                                                 AsyncState)
+        policy = state_machine.set_coalescing(Event("sample"))
+
+        async def run():
+            await state_machine.start("data")
+            await state_machine.dispatch_many([("sample", 1),
+                                               ("sample", 2)])
+
+        asyncio.run(run())
+        sample_cb.assert_called_once_with(2)
+        assert policy.merged == 1
+
+    def test_async_trailing_edge(self, create_fsm):
+        state_machine, sample_cb, _ = create_fsm(AsyncStateMachine,
+                                                 AsyncState)
+        wheel = TimingWheel(resolution=1)
+        state_machine.set_timing_wheel(wheel)
+        state_machine.set_coalescing(
+            Event("sample"), merge=False, window=1.0,
+            clock=MagicMock(side_effect=[0.0, 0.5, 0.5, 2.0]))
+
+        async def run():
+            await state_machine.start("data")
+            await state_machine.trigger_event(Event("sample"), 1)
+            await state_machine.trigger_event(Event("sample"), 2)
+            wheel.advance(1)
+            await asyncio.sleep(0)
+
+        asyncio.run(run())
+        assert [item.args[0] for item in sample_cb.call_args_list] == [1, 2]
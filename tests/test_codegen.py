@@ -0,0 +1,105 @@
+from hfsm import State, StateMachine, Event, AsyncStateMachine, \
+    specialize, generate_source
+from hfsm import codegen
+from tests import test_state_machine
+from unittest.mock import MagicMock
+import pytest
+
+
+class GeneratedStateMachine(StateMachine):
+
+    def start(self, data):
+        if not self.frozen and self.parent_sm is None:
+            specialize(self)
+        super().start(data)
+
+
+class TestGeneratedStateMachine(test_state_machine.TestStateMachine):
+
+    @pytest.fixture(autouse=True)
+    def generated_state_machine(self, monkeypatch):
+        monkeypatch.setattr(test_state_machine, "StateMachine",
+                            GeneratedStateMachine)
+
+
+class TestCodegen:
+
+    @pytest.fixture
+    def create_fsm(self, fsm_builder):
+        return lambda name="sm": fsm_builder(
+            [("initial_state", "second_state", "event"),
+             ("second_state", "initial_state", "event")], name)
+
+    def test_specialize(self, create_fsm):
+        state_machine = create_fsm()
+        entry_cb = MagicMock()
+        state_machine.initial_state.on_entry(entry_cb)
+        specialize(state_machine)
+        assert state_machine.frozen
+        assert "trigger_event" in vars(state_machine)
+        state_machine.start("data")
+        state_machine.trigger_event(Event("event"), "data")
+        assert state_machine.current_state.name == "second_state"
+        state_machine.trigger_event("event", "data")
+        assert state_machine.current_state.name == "initial_state"
+        assert entry_cb.call_count == 2
+
+    def test_callbacks_frozen(self, create_fsm):
+        state_machine = create_fsm()
+        specialize(state_machine)
+        transition = state_machine.find_transition(State("initial_state"),
+                                                   Event("event"))
+        with pytest.raises(ValueError):
+            transition.add_condition(lambda data: False)
+        with pytest.raises(ValueError):
+            state_machine.initial_state.on_exit(MagicMock())
+        state_machine.start("data")
+        state_machine.trigger_event(Event("event"), "data")
+        assert state_machine.current_state.name == "second_state"
+
+    def test_factory_cached_by_shape(self, create_fsm):
+        first = create_fsm("first")
+        second = create_fsm("second")
+        second.find_transition(State("initial_state"),
+                               Event("event")).add_action(MagicMock())
+        specialize(first)
+        count = len(codegen._factories)
+        specialize(create_fsm("third"))
+        assert len(codegen._factories) == count
+        specialize(second)
+        assert len(codegen._factories) == count + 1
+
+    def test_generate_source(self, create_fsm):
+        source = generate_source(create_fsm())
+        assert "def factory(machine, hfsm, values):" in source
+        assert source.count("def handler(data):") == 1
+        compile(source, "<test>", "exec")
+
+    def test_overridden_state_methods(self):
+        class CountingState(State):
+            __slots__ = ("starts",)
+
+            def __init__(self, name):
+                super().__init__(name)
+                self.starts = 0
+
+            def start(self, data):
+                self.starts += 1
+                super().start(data)
+
+        state_machine = StateMachine("sm")
+        initial_state = CountingState("initial_state")
+        event = Event("event")
+        state_machine.add_state(initial_state, initial_state=True)
+        state_machine.add_event(event)
+        state_machine.add_self_transition(initial_state, event)
+        specialize(state_machine)
+        state_machine.start("data")
+        state_machine.trigger_event(event, "data")
+        assert initial_state.starts == 2
+
+    def test_async_not_supported(self):
+        with pytest.raises(TypeError):
+            specialize(AsyncStateMachine("sm"))
+        with pytest.raises(TypeError):
+            specialize("sm")
@@ -1,4 +1,12 @@
 from hfsm import Event
+import pickle
+
+
+class PayloadEvent(Event):
+
+    def __init__(self, name, payload=None):
+        super().__init__(name)
+        self.payload = payload
 
 
 class TestEvent:
@@ -11,3 +19,35 @@ class TestEvent:
         event1 = Event("event")
         event2 = Event("event")
         assert event1 == event2
+
+    def test_hash(self):
+        event1 = Event("event")
+        event2 = Event("event")
+        assert hash(event1) == hash(event2)
+        assert {event1: 1}[event2] == 1
+
+    def test_interned(self):
+        assert Event("event") is Event("event")
+        assert Event("event") is not Event("other")
+
+    def test_pickle(self):
+        event = Event("event")
+        assert pickle.loads(pickle.dumps(event)) is event
+
+    def test_subclass_with_arguments(self):
+        event = PayloadEvent("event", {"key": 1})
+        assert event.payload == {"key": 1}
+        assert event == Event("event")
+        assert PayloadEvent("event", 2) is not event
+        assert PayloadEvent("event") is PayloadEvent("event")
+        copy = pickle.loads(pickle.dumps(PayloadEvent("event", 3)))
+        assert isinstance(copy, PayloadEvent)
+        assert copy.payload == 3
+
+    def test_interned_subclass_keeps_state(self):
+        event = PayloadEvent("tagged")
+        event.payload = []
+        event.payload.append(1)
+        assert PayloadEvent("tagged") is event
+        assert PayloadEvent("tagged").payload == [1]
+        assert pickle.loads(pickle.dumps(event)).payload == [1]
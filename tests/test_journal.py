@@ -0,0 +1,177 @@
+from hfsm import State, StateMachine, Event, AsyncState, \
+    AsyncStateMachine, TransitionJournal, read_journal, specialize
+from hfsm.__main__ import main
+import asyncio
+import json
+import pytest
+
+
+class TestJournal:
+
+    @pytest.fixture
+    def create_fsm(self, fsm_builder):
+        def create(machine_type=StateMachine, state_type=State):
+            return fsm_builder(
+                [("initial_state", "second_state", "event"),
+                 ("second_state", "initial_state", "event")],
+                machine_type=machine_type, state_type=state_type)
+        return create
+
+    @staticmethod
+    def names(entries):
+        return [(entry["machine"], entry["source"], entry["destination"],
+                 entry["event"]) for entry in entries]
+
+    def test_constructor(self):
+        with pytest.raises(ValueError):
+            TransitionJournal(0)
+
+    def test_ring_keeps_last_transitions(self, create_fsm):
+        journal = TransitionJournal(3)
+        state_machine = create_fsm()
+        state_machine.set_journal(journal)
+        state_machine.start("data")
+        for _ in range(4):
+            state_machine.trigger_event(Event("event"), "data")
+        assert journal.count == 4
+        assert len(journal) == 3
+        entries = journal.entries()
+        assert [entry[:4] for entry in entries] == \
+            [(0, 2, 1, 0), (0, 1, 2, 0), (0, 2, 1, 0)]
+        assert entries[0][4] <= entries[1][4] <= entries[2][4]
+        assert self.names(journal.decoded())[-1] == \
+            ("sm", "second_state", "initial_state", "event")
+
+    def test_hierarchy(self, create_fsm):
+        journal = TransitionJournal()
+        state_machine = StateMachine("parent")
+        parent_state = State("parent_state", create_fsm())
+        state_machine.add_state(parent_state, initial_state=True)
+        state_machine.set_journal(journal)
+        assert parent_state.child_sm.journal is journal
+        state_machine.set_journal(journal)
+        state_machine.start("data")
+        state_machine.trigger_event(Event("event"), "data", propagate=True)
+        assert self.names(journal.decoded()) == \
+            [("sm", "initial_state", "second_state", "event")]
+        state_machine.set_journal(None)
+        assert parent_state.child_sm.journal is None
+        state_machine.trigger_event(Event("event"), "data", propagate=True)
+        assert journal.count == 1
+
+    def test_memory_mapped_file(self, create_fsm, tmp_path, capsys):
+        path = str(tmp_path / "journal.bin")
+        journal = TransitionJournal(8, path)
+        state_machine = create_fsm()
+        state_machine.set_journal(journal)
+        state_machine.start("data")
+        state_machine.trigger_event(Event("event"), "data")
+        journal.close()
+        assert self.names(read_journal(path)) == \
+            [("sm", "initial_state", "second_state", "event")]
+
+        journal = TransitionJournal(8, path)
+        assert journal.count == 1
+        specialize(state_machine)
+        state_machine.set_journal(journal)
+        state_machine.trigger_event(Event("event"), "data")
+        journal.flush()
+        assert len(read_journal(path)) == 2
+        journal.close()
+
+        assert main(["journal", path, "--last", "1"]) == 0
+        assert capsys.readouterr().out.endswith(
+            " sm: second_state -> initial_state on event\n")
+        assert main(["journal", path, "--json"]) == 0
+        lines = capsys.readouterr().out.splitlines()
+        assert json.loads(lines[0])["destination"] == "second_state"
+
+        assert TransitionJournal(4, path).count == 0
+        (tmp_path / "other.bin").write_bytes(b"garbage" * 10)
+        assert main(["journal", str(tmp_path / "other.bin")]) == 1
+
+    @pytest.fixture
+    def create_named_fsm(self, fsm_builder):
+        def create(name):
+            state_machine = fsm_builder(
+                [(f"{name[0]}a", f"{name[0]}b", f"{name}_event")], name)
+            state_machine.start("data")
+            return state_machine
+        return create
+
+    def test_names_survive_reopen(self, create_named_fsm, tmp_path):
+        path = str(tmp_path / "journal.bin")
+        journal = TransitionJournal(8, path)
+        orders = create_named_fsm("orders")
+        orders.set_journal(journal)
+        orders.trigger_event(Event("orders_event"), "data")
+
+        journal = TransitionJournal(8, path)
+        payments = create_named_fsm("payments")
+        payments.set_journal(journal)
+        payments.trigger_event(Event("payments_event"), "data")
+        assert payments.journal._names[1]["name"] == "payments"
+        expected = [("orders", "oa", "ob", "orders_event"),
+                    ("payments", "pa", "pb", "payments_event")]
+        assert self.names(journal.decoded()) == expected
+        assert self.names(read_journal(path)) == expected
+        journal.close()
+
+    def test_names_written_incrementally(self, create_named_fsm, tmp_path):
+        path = str(tmp_path / "journal.bin")
+        journal = TransitionJournal(8, path)
+        for name in ("first", "second", "third"):
+            create_named_fsm(name).set_journal(journal)
+        state_machine = StateMachine("late")
+        state_machine.set_journal(journal)
+        state_machine.add_state(State("late_state"), initial_state=True)
+        journal.flush()
+        with open(f"{path}.names") as fh:
+            lines = [json.loads(line) for line in fh]
+        assert [line["id"] for line in lines] == [0, 1, 2, 3, 3]
+        assert lines[-1]["states"] == ["NormalExitState", "late_state"]
+        journal.close()
+
+        journal = TransitionJournal(4, path)
+        assert journal.count == 0
+        assert journal._names == {}
+        journal.close()
+        with open(f"{path}.names") as fh:
+            assert fh.read() == ""
+
+    def test_names_refreshed_only_when_changed(self, create_named_fsm,
+                                               monkeypatch):
+        from hfsm import journal as journal_module
+        journal = TransitionJournal(8)
+        machines = [create_named_fsm(f"m{index}")
+                    for index in range(3)]
+        for state_machine in machines:
+            state_machine.set_journal(journal)
+        machines[2].compile()
+        assert [machine._journal_id for machine in machines] == [0, 1, 2]
+        calls = []
+        machine_names = journal_module._machine_names
+        monkeypatch.setattr(journal_module, "_machine_names",
+                            lambda machine: calls.append(machine) or
+                            machine_names(machine))
+        journal.flush()
+        assert calls == []
+        assert [entry[0] for entry in journal._attached] == [0, 1]
+        machines[1].add_state(State("late_state"))
+        journal.flush()
+        journal.flush()
+        assert calls == [machines[1]]
+        assert journal._names[1]["states"][-1] == "late_state"
+
+    def test_async(self, create_fsm):
+        journal = TransitionJournal()
+        state_machine = create_fsm(AsyncStateMachine, AsyncState)
+        state_machine.set_journal(journal)
+
+        async def run():
+            await state_machine.start("data")
+            await state_machine.trigger_event(Event("event"), "data")
+
+        asyncio.run(run())
+        assert self.names(journal.decoded()) == \
+            [("sm", "initial_state", "second_state", "event")]
@@ -0,0 +1,171 @@
+from hfsm import State, Event, AsyncState, AsyncStateMachine, \
+    compile_definition, definition_hash, load, load_artifact, load_file
+from unittest.mock import MagicMock
+import asyncio
+import json
+import os
+import pytest
+
+
+class TestLoader:
+
+    @staticmethod
+    def create_definition():
+        return {
+            "name": "sm",
+            "initial": "initial_state",
+            "states": [
+                "initial_state",
+                {"name": "second_state", "on_entry": ["entry"],
+                 "machine": {
+                     "name": "child_sm",
+                     "initial": "child_initial_state",
+                     "states": ["child_initial_state",
+                                "child_second_state"],
+                     "events": ["child_event"],
+                     "transitions": [
+                         {"source": "child_initial_state",
+                          "destination": "child_second_state",
+                          "event": "child_event"}]}},
+                "third_state",
+                {"exit": "Error"},
+            ],
+            "events": ["event", "error"],
+            "transitions": [
+                {"source": "initial_state", "destination": "third_state",
+                 "event": "event", "default": True},
+                {"source": "initial_state", "destination": "second_state",
+                 "event": "event", "condition": "ready", "action": "action"},
+                {"source": "second_state", "destination": "ErrorExitState",
+                 "event": "error"},
+                {"source": "third_state", "event": "event", "type": "null"},
+            ],
+            "on_exit": "finished",
+        }
+
+    @staticmethod
+    def create_registry():
+        return {"entry": MagicMock(), "ready": MagicMock(return_value=True),
+                "action": MagicMock(), "finished": MagicMock()}
+
+    def test_load(self):
+        registry = self.create_registry()
+        state_machine = load(self.create_definition(), registry)
+        assert state_machine.frozen
+        assert state_machine.find_transitions(
+            State("initial_state"), Event("event"))[1].is_default
+        state_machine.start("data")
+        state_machine.trigger_event(Event("event"), "data")
+        assert state_machine.current_state == State("second_state")
+        registry["action"].assert_called_once_with("data")
+        registry["entry"].assert_called_once_with("data")
+        child_sm = state_machine.current_state.child_sm
+        assert child_sm.parent_sm is state_machine
+        state_machine.trigger_event(Event("child_event"), "data",
+                                    propagate=True)
+        assert child_sm.current_state == State("child_second_state")
+        state_machine.trigger_event(Event("error"), "data")
+        registry["finished"].assert_called_once_with(
+            state_machine.current_state, "data")
+
+    def test_default_branch(self):
+        registry = self.create_registry()
+        registry["ready"].return_value = False
+        state_machine = load(self.create_definition(), registry)
+        state_machine.start("data")
+        state_machine.trigger_event(Event("event"), "data")
+        assert state_machine.current_state == State("third_state")
+
+    def test_errors_reported_together(self):
+        definition = self.create_definition()
+        definition["initial"] = "missing"
+        definition["events"].append("event")
+        definition["states"].append("third_state")
+        definition["transitions"].append(
+            {"source": "nowhere", "destination": "third_state",
+             "event": "unknown"})
+        with pytest.raises(ValueError) as error:
+            compile_definition(definition)
+        message = str(error.value)
+        assert "unknown initial state 'missing'" in message
+        assert "duplicate event 'event'" in message
+        assert "duplicate state 'third_state'" in message
+        assert "unknown state 'nowhere', event 'unknown'" in message
+
+    def test_malformed_entries_reported(self):
+        definition = self.create_definition()
+        definition["initial"] = ["initial_state"]
+        definition["events"].append({"name": "event"})
+        definition["states"].append({"name": "child", "machine": "sub"})
+        definition["transitions"].append("initial_state -> second_state")
+        definition["transitions"].append(
+            {"source": "initial_state", "destination": "third_state",
+             "event": {"name": "event"}, "priority": "high"})
+        definition["transitions"].append(
+            {"source": ["initial_state"], "destination": "third_state",
+             "event": "event"})
+        with pytest.raises(ValueError) as error:
+            compile_definition(definition)
+        message = str(error.value)
+        events = len(self.create_definition()["events"])
+        transitions = len(self.create_definition()["transitions"])
+        assert "unknown initial state '['initial_state']'" in message
+        assert f"event {events} must be a name" in message
+        assert "machine of state 'child' must be a mapping" in message
+        assert f"transition {transitions} must be a mapping" in message
+        assert f"transition {transitions + 1} has a priority" in message
+        assert "unknown state '['initial_state']'" in message
+        with pytest.raises(ValueError, match="must be a mapping"):
+            compile_definition(["not", "a", "machine"])
+
+    def test_unknown_callbacks(self):
+        registry = self.create_registry()
+        del registry["entry"]
+        del registry["finished"]
+        with pytest.raises(ValueError, match="entry, finished"):
+            load(self.create_definition(), registry)
+
+    def test_artifact_is_json(self):
+        definition = self.create_definition()
+        artifact = compile_definition(definition)
+        assert artifact["hash"] == definition_hash(definition)
+        artifact = json.loads(json.dumps(artifact))
+        state_machine = load_artifact(artifact, self.create_registry())
+        assert state_machine.table.states[0] == State("NormalExitState")
+        with pytest.raises(ValueError):
+            load_artifact(dict(artifact, version=0), self.create_registry())
+
+    def test_cache(self, tmp_path):
+        definition = self.create_definition()
+        cache_dir = str(tmp_path / "cache")
+        load(definition, self.create_registry(), cache_dir)
+        path = os.path.join(cache_dir,
+                            f"hfsm-{definition_hash(definition)}.json")
+        assert os.listdir(cache_dir) == [os.path.basename(path)]
+        with open(path, "r", encoding="utf-8") as fh:
+            artifact = json.load(fh)
+        artifact["machine"]["initial"] = 3
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump(artifact, fh)
+        state_machine = load(definition, self.create_registry(), cache_dir)
+        assert state_machine.initial_state == State("third_state")
+
+    def test_load_file(self, tmp_path):
+        path = tmp_path / "sm.json"
+        path.write_text(json.dumps(self.create_definition()))
+        state_machine = load_file(str(path), self.create_registry())
+        assert state_machine.name == "sm"
+
+    def test_async_machine(self):
+        definition = self.create_definition()
+        del definition["states"][1]["machine"]
+        state_machine = load(definition, self.create_registry(),
+                             machine_type=AsyncStateMachine,
+                             state_type=AsyncState)
+
+        async def run():
+            await state_machine.start("data")
+            await state_machine.trigger_event(Event("event"), "data")
+
+        asyncio.run(run())
+        assert state_machine.current_state == State("second_state")
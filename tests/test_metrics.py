@@ -0,0 +1,114 @@
+from hfsm import State, Event, Histogram, AsyncState, AsyncStateMachine
+from unittest.mock import MagicMock
+import asyncio
+import pytest
+
+
+class TestMetrics:
+
+    @pytest.fixture
+    def create_fsm(self, fsm_builder):
+        return lambda: fsm_builder(
+            [("initial_state", "second_state", "event"),
+             ("second_state", "initial_state", "back"),
+             ("second_state", "ErrorExitState", "error")])
+
+    def test_histogram(self):
+        histogram = Histogram((0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value)
+        assert histogram.counts == (2, 1, 1)
+        assert histogram.count == 4
+        assert histogram.sum == pytest.approx(2.65)
+        with pytest.raises(ValueError):
+            Histogram((1.0, 0.1))
+
+    def test_disabled_by_default(self, create_fsm):
+        state_machine = create_fsm()
+        assert state_machine.metrics is None
+        metrics = state_machine.enable_metrics()
+        assert state_machine.metrics is metrics
+        state_machine.disable_metrics()
+        assert state_machine.metrics is None
+        with pytest.raises(ValueError):
+            state_machine.enable_metrics(sample_every=0)
+
+    def test_counts_and_latency(self, create_fsm):
+        state_machine = create_fsm()
+        action = MagicMock()
+        state_machine.find_transition(State("initial_state"),
+                                      Event("event")).add_action(action)
+        metrics = state_machine.enable_metrics()
+        state_machine.start("data")
+        for _ in range(3):
+            state_machine.trigger_event(Event("event"), "data")
+            state_machine.trigger_event(Event("back"), "data")
+        state_machine.trigger_event(Event("event"), "data")
+        state_machine.trigger_event(Event("error"), "data")
+        assert action.call_count == 4
+        result = metrics.as_dict()
+        counts = {(item["source"], item["event"]): item["count"]
+                  for item in result["transitions"]}
+        assert counts == {("initial_state", "event"): 4,
+                          ("second_state", "back"): 3,
+                          ("second_state", "error"): 1}
+        assert result["dwell_seconds"]["initial_state"]["count"] == 4
+        assert result["dwell_seconds"]["second_state"]["count"] == 4
+        assert result["entry_seconds"]["second_state"]["count"] == 4
+        assert result["exit_seconds"]["initial_state"]["count"] == 4
+        assert result["action_seconds"][0]["count"] == 4
+
+    def test_sampling(self, create_fsm):
+        state_machine = create_fsm()
+        metrics = state_machine.enable_metrics(sample_every=4)
+        state_machine.start("data")
+        for _ in range(4):
+            state_machine.trigger_event(Event("event"), "data")
+            state_machine.trigger_event(Event("back"), "data")
+        result = metrics.as_dict()
+        assert sum(item["count"] for item in result["transitions"]) == 8
+        assert result["entry_seconds"]["second_state"]["count"] == 2
+        assert "initial_state" not in result["entry_seconds"]
+        assert result["dwell_seconds"]["second_state"]["count"] == 4
+
+    def test_stop_records_dwell(self, create_fsm):
+        state_machine = create_fsm()
+        metrics = state_machine.enable_metrics()
+        state_machine.start("data")
+        state_machine.stop("data")
+        assert metrics.as_dict()["dwell_seconds"]["initial_state"][
+            "count"] == 1
+
+    def test_prometheus(self, create_fsm):
+        state_machine = create_fsm()
+        metrics = state_machine.enable_metrics(latency_buckets=(1.0,))
+        state_machine.start("data")
+        state_machine.trigger_event(Event("event"), "data")
+        text = metrics.to_prometheus()
+        assert '# TYPE hfsm_transitions_total counter' in text
+        assert 'hfsm_transitions_total{machine="sm",source="initial_state",' \
+               'event="event",destination="second_state"} 1' in text
+        assert 'hfsm_entry_duration_seconds_bucket{machine="sm",' \
+               'state="second_state",le="+Inf"} 1' in text
+        assert 'hfsm_entry_duration_seconds_count{machine="sm",' \
+               'state="second_state"} 1' in text
+
+    def test_async_counts(self):
+        state_machine = AsyncStateMachine("sm")
+        initial_state = AsyncState("initial_state")
+        second_state = AsyncState("second_state")
+        event = Event("event")
+        state_machine.add_state(initial_state, initial_state=True)
+        state_machine.add_state(second_state)
+        state_machine.add_event(event)
+        state_machine.add_transition(initial_state, second_state, event)
+        metrics = state_machine.enable_metrics()
+
+        async def run():
+            await state_machine.start("data")
+            await state_machine.trigger_event(event, "data")
+
+        asyncio.run(run())
+        result = metrics.as_dict()
+        assert result["transitions"][0]["count"] == 1
+        assert result["dwell_seconds"]["initial_state"]["count"] == 1
@@ -0,0 +1,113 @@
+from hfsm import State, StateMachine, Event, Population
+from unittest.mock import MagicMock
+import pytest
+
+np = pytest.importorskip("numpy")
+
+
+class TestPopulation:
+
+    @pytest.fixture
+    def create_fsm(self, fsm_builder):
+        return lambda: fsm_builder(
+            [("initial_state", "second_state", "event"),
+             ("second_state", "ErrorExitState", "error")])
+
+    def test_hierarchical_machine_rejected(self, create_fsm):
+        state_machine = create_fsm()
+        child_sm = StateMachine("child_sm")
+        child_sm.add_state(State("child_initial_state"), initial_state=True)
+        state_machine.add_state(State("parent_state", child_sm))
+        with pytest.raises(ValueError):
+            Population(state_machine, 10)
+
+    def test_regions_rejected(self, create_fsm):
+        state_machine = create_fsm()
+        region = StateMachine("region")
+        region.add_state(State("region_state"), initial_state=True)
+        parallel_state = State("parallel_state")
+        parallel_state.add_region(region)
+        state_machine.add_state(parallel_state)
+        with pytest.raises(ValueError):
+            Population(state_machine, 10)
+
+    def test_trigger_event_batch(self, create_fsm):
+        population = Population(create_fsm(), 10)
+        with pytest.raises(ValueError):
+            population.trigger_event_batch(Event("event"))
+        population.start()
+        fired = population.trigger_event_batch(Event("event"), [1, 3, 5])
+        assert sorted(fired.tolist()) == [1, 3, 5]
+        assert population.state_of(3).name == "second_state"
+        assert population.state_of(2).name == "initial_state"
+        fired = population.trigger_event_batch(Event("error"))
+        assert sorted(fired.tolist()) == [1, 3, 5]
+        assert population.counts() == {"initial_state": 7,
+                                       "ErrorExitState": 3}
+        assert not population.states.flags.writeable
+
+    def test_callbacks_only_for_changed_instances(self, create_fsm):
+        state_machine = create_fsm()
+        exit_sm_cb = MagicMock()
+        state_machine.on_exit(exit_sm_cb)
+        transition = state_machine.find_transition(State("initial_state"),
+                                                   Event("event"))
+        action = MagicMock()
+        entry_cb = MagicMock()
+        transition.add_action(action)
+        transition.destination_state.on_entry(entry_cb)
+        population = Population(state_machine, 5)
+        population.start()
+        population.trigger_event_batch(Event("event"), [0, 1], data="tick")
+        population.trigger_event_batch(Event("event"), [0, 1, 2],
+                                       instance_data=["a", "b", "c"])
+        assert action.call_count == 3
+        entry_cb.assert_called_with("c")
+        population.trigger_event_batch(Event("error"), [0])
+        exit_sm_cb.assert_called_once()
+
+    def test_per_instance_condition(self, create_fsm):
+        state_machine = create_fsm()
+        transition = state_machine.find_transition(State("initial_state"),
+                                                   Event("event"))
+        transition.add_condition(lambda data: data % 2 == 0)
+        population = Population(state_machine, 4)
+        population.start()
+        fired = population.trigger_event_batch(Event("event"),
+                                               instance_data=[0, 1, 2, 3])
+        assert fired.tolist() == [0, 2]
+
+    def test_vectorized_condition(self, create_fsm):
+        state_machine = create_fsm()
+        transition = state_machine.find_transition(State("initial_state"),
+                                                   Event("event"))
+        condition = MagicMock(return_value=False)
+        transition.add_condition(condition)
+        population = Population(state_machine, 6)
+        population.set_vectorized_condition(
+            transition, lambda instance_ids, data: instance_ids >= data)
+        population.start()
+        fired = population.trigger_event_batch(Event("event"), data=4)
+        assert fired.tolist() == [4, 5]
+        condition.assert_not_called()
+
+    def test_guard_chain(self, create_fsm):
+        state_machine = create_fsm()
+        state_machine.add_state(State("third_state"))
+        fallback = state_machine.add_transition(
+            State("initial_state"), State("third_state"), Event("event"),
+            default=True)
+        state_machine.find_transition(
+            State("initial_state"), Event("event")).add_condition(
+            lambda data: data > 0)
+        on_fallback = MagicMock()
+        fallback.add_action(on_fallback)
+        population = Population(state_machine, 4)
+        population.start()
+        fired = population.trigger_event_batch(
+            Event("event"), instance_data=[1, -1, 2, -2])
+        assert sorted(fired.tolist()) == [0, 1, 2, 3]
+        assert population.counts() == {"second_state": 2,
+                                       "third_state": 2}
+        assert population.state_of(1).name == "third_state"
+        assert on_fallback.call_count == 2
@@ -0,0 +1,116 @@
+from hfsm import State, StateMachine, Event, AsyncState, AsyncStateMachine
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+import asyncio
+import threading
+import pytest
+
+
+class TestRegions:
+
+    @pytest.fixture
+    def create_region(self, fsm_builder):
+        def create(name, event_name, machine_type=StateMachine,
+                   state_type=State):
+            return fsm_builder(
+                [(f"{name}_idle", f"{name}_busy", event_name),
+                 (f"{name}_busy", f"{name}_idle", event_name)],
+                name, machine_type, state_type)
+        return create
+
+    @pytest.fixture
+    def create_fsm(self, fsm_builder, create_region):
+        def create():
+            state_machine = fsm_builder(
+                [("initial_state", "parallel_state", "event"),
+                 ("parallel_state", "initial_state", "event")])
+            parallel_state = state_machine.find_transition(
+                state_machine.initial_state,
+                Event("event")).destination_state
+            for name in ("left", "right"):
+                parallel_state.add_region(create_region(name, "shared"))
+            parallel_state.add_region(create_region("other", "own"))
+            return state_machine, parallel_state
+        return create
+
+    def test_add_region(self):
+        state = State("state")
+        with pytest.raises(TypeError):
+            state.add_region("region")
+        with pytest.raises(ValueError):
+            state.set_region_executor(None)
+        state.add_region(StateMachine("region"))
+        with pytest.raises(ValueError):
+            state.set_child_sm(StateMachine("child_sm"))
+        child_state = State("child_state", StateMachine("child_sm"))
+        with pytest.raises(ValueError):
+            child_state.add_region(StateMachine("region"))
+
+    def test_regions_start_and_stop_with_state(self, create_fsm):
+        state_machine, parallel_state = create_fsm()
+        left, right, other = parallel_state.regions
+        assert left.parent_sm is state_machine
+        state_machine.start("data")
+        assert left.current_state is None
+        state_machine.trigger_event(Event("event"), "data")
+        assert [region.current_state.name for region in
+                parallel_state.regions] == \
+            ["left_idle", "right_idle", "other_idle"]
+        assert state_machine.active_leaf is state_machine
+        state_machine.trigger_event(Event("event"), "data")
+        assert all(not region.is_running()
+                   for region in parallel_state.regions)
+
+    def test_event_dispatched_to_accepting_regions(self, create_fsm):
+        state_machine, parallel_state = create_fsm()
+        left, right, other = parallel_state.regions
+        other.find_transition(State("other_idle"), Event("own")).add_action(
+            MagicMock())
+        state_machine.start("data")
+        state_machine.trigger_event(Event("event"), "data")
+        other._handle_event = MagicMock(wraps=other._handle_event)
+        state_machine.trigger_event(Event("shared"), "data", propagate=True)
+        assert left.current_state.name == "left_busy"
+        assert right.current_state.name == "right_busy"
+        assert other.current_state.name == "other_idle"
+        other._handle_event.assert_not_called()
+        assert parallel_state._regions.accepting(Event("unknown")) == ()
+        state_machine.trigger_event(Event("event"), "data", propagate=True)
+        assert state_machine.current_state.name == "initial_state"
+
+    def test_executor(self, create_fsm):
+        state_machine, parallel_state = create_fsm()
+        threads = set()
+        for region in parallel_state.regions:
+            region.initial_state.on_entry(
+                lambda data: threads.add(threading.get_ident()))
+        with ThreadPoolExecutor(4) as executor:
+            parallel_state.set_region_executor(executor)
+            state_machine.compile()
+            state_machine.start("data")
+            state_machine.trigger_event(Event("event"), "data")
+            state_machine.trigger_event(Event("shared"), "data",
+                                        propagate=True)
+        assert threading.get_ident() not in threads
+        assert [region.current_state.name for region in
+                parallel_state.regions] == \
+            ["left_busy", "right_busy", "other_idle"]
+
+    def test_async_regions(self, create_region):
+        state_machine = AsyncStateMachine("sm")
+        parallel_state = AsyncState("parallel_state")
+        state_machine.add_state(parallel_state, initial_state=True)
+        with pytest.raises(TypeError):
+            parallel_state.add_region(StateMachine("region"))
+        for name in ("left", "right"):
+            parallel_state.add_region(create_region(
+                name, "shared", AsyncStateMachine, AsyncState))
+
+        async def run():
+            await state_machine.start("data")
+            await state_machine.trigger_event(Event("shared"), "data",
+                                              propagate=True)
+
+        asyncio.run(run())
+        assert [region.current_state.name for region in
+                parallel_state.regions] == ["left_busy", "right_busy"]
@@ -0,0 +1,112 @@
+from hfsm import Blueprint, load, read_records, parse_record, paced, \
+    replay_records
+from hfsm.__main__ import main
+from unittest.mock import MagicMock
+import gzip
+import json
+import pytest
+
+
+class TestReplay:
+
+    @staticmethod
+    def create_definition():
+        return {
+            "name": "sm",
+            "initial": "idle",
+            "states": ["idle", {"name": "busy", "machine": {
+                "name": "child_sm",
+                "initial": "child_idle",
+                "states": ["child_idle", "child_busy"],
+                "events": ["step"],
+                "transitions": [{"source": "child_idle",
+                                 "destination": "child_busy",
+                                 "event": "step"}]}}],
+            "events": ["go", "back"],
+            "transitions": [
+                {"source": "idle", "destination": "busy", "event": "go"},
+                {"source": "busy", "destination": "idle", "event": "back"}],
+        }
+
+    def create_fsm(self):
+        state_machine = load(self.create_definition(), {})
+        state_machine.start("data")
+        return state_machine
+
+    @staticmethod
+    def write_log(path, lines):
+        opener = gzip.open if str(path).endswith(".gz") else open
+        with opener(path, "wt", encoding="utf-8") as fh:
+            for line in lines:
+                fh.write(json.dumps(line) + "\n")
+            fh.write("\n")
+        return str(path)
+
+    def test_read_records(self, tmp_path):
+        lines = [{"timestamp": 1, "event": "go", "data": {"x": 1}},
+                 [2.5, "back"],
+                 [3, "go", None, "a"]]
+        for name in ("log.jsonl", "log.jsonl.gz"):
+            path = self.write_log(tmp_path / name, lines)
+            assert list(read_records(path)) == [
+                (1.0, "go", {"x": 1}, None), (2.5, "back", None, None),
+                (3.0, "go", None, "a")]
+        with pytest.raises(ValueError):
+            parse_record('[1]')
+        with pytest.raises(ValueError):
+            parse_record('"go"')
+
+    def test_replay_as_fast_as_possible(self):
+        state_machines = [self.create_fsm(), self.create_fsm()]
+        records = ((float(i), name, None, None) for i, name in
+                   enumerate(["go", "back", "go", "step"] * 3))
+        report = replay_records(records, state_machines, propagate=True,
+                                batch_size=5)
+        assert report.records == 12
+        assert report.deliveries == 24
+        assert report.states == {"busy/child_busy": 2}
+        assert report.as_dict()["throughput"] == report.throughput
+        assert str(report).splitlines()[1].endswith(" 2 busy/child_busy")
+        with pytest.raises(ValueError):
+            replay_records([], state_machines, batch_size=0)
+
+    def test_replay_routed(self):
+        state_machines = {"a": self.create_fsm(), "b": self.create_fsm()}
+        blueprint = Blueprint(load(self.create_definition(), {}))
+        instance = blueprint.create()
+        instance.start("data")
+        state_machines["c"] = instance
+        records = [(0.0, "go", None, None), (1.0, "back", None, "a"),
+                   (2.0, "step", None, "b")]
+        report = replay_records(iter(records), state_machines,
+                                propagate=True)
+        assert report.deliveries == 5
+        assert report.states == {"idle": 1, "busy/child_busy": 1,
+                                 "busy/child_idle": 1}
+        with pytest.raises(ValueError):
+            replay_records([(0.0, "go", None, "d")], state_machines)
+
+    def test_replay_real_time_scaled(self):
+        state_machine = self.create_fsm()
+        clock = MagicMock(return_value=10.0)
+        sleep = MagicMock()
+        records = [(100.0, "go", None, None), (101.0, "back", None, None),
+                   (103.0, "go", None, None)]
+        report = replay_records(records, state_machine, speed=2.0,
+                                clock=clock, sleep=sleep)
+        assert [item.args[0] for item in sleep.call_args_list] == [0.5, 1.5]
+        assert report.states == {"busy/child_idle": 1}
+        with pytest.raises(ValueError):
+            list(paced(records, 0))
+
+    def test_command_line(self, tmp_path, capsys):
+        definition = tmp_path / "definition.json"
+        definition.write_text(json.dumps(self.create_definition()))
+        log = self.write_log(tmp_path / "log.jsonl",
+                             [[0, "go"], [1, "step", None, "1"]])
+        assert main(["replay", log, str(definition), "--instances", "2",
+                     "--propagate", "--json"]) == 0
+        report = json.loads(capsys.readouterr().out)
+        assert report["records"] == 2
+        assert report["states"] == {"busy/child_idle": 1,
+                                    "busy/child_busy": 1}
@@ -0,0 +1,167 @@
+from hfsm import State, Event, Scheduler, OverflowPolicy
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+import queue
+import threading
+import pytest
+
+
+class TestScheduler:
+
+    @pytest.fixture
+    def create_fsm(self, fsm_builder):
+        def create(name, calls=None):
+            state_machine = fsm_builder(
+                [("initial_state", "second_state", "event"),
+                 ("second_state", "initial_state", "back")], name)
+            if calls is not None:
+                for state, event in (("initial_state", "event"),
+                                     ("second_state", "back")):
+                    state_machine.find_transition(
+                        State(state), Event(event)).add_action(calls.append)
+            state_machine.start("data")
+            return state_machine
+        return create
+
+    def test_events_processed_in_order(self, create_fsm):
+        calls = []
+        state_machine = create_fsm("sm", calls)
+        with Scheduler(max_workers=4) as scheduler:
+            for i in range(1000):
+                event = Event("event") if i % 2 == 0 else Event("back")
+                scheduler.post(state_machine, event, i)
+            assert scheduler.join(timeout=10)
+        assert calls == list(range(1000))
+
+    def test_machine_never_runs_on_two_threads(self, create_fsm):
+        active = {}
+        overlaps = []
+        lock = threading.Lock()
+
+        def action(name):
+            with lock:
+                if active.get(name):
+                    overlaps.append(name)
+                active[name] = True
+            with lock:
+                active[name] = False
+
+        machines = [create_fsm(f"sm{i}") for i in range(8)]
+        for machine in machines:
+            machine.find_transition(State("initial_state"),
+                                    Event("event")).add_action(action)
+            machine.find_transition(State("second_state"),
+                                    Event("back")).add_action(action)
+
+        def producer(machine):
+            for i in range(200):
+                event = Event("event") if i % 2 == 0 else Event("back")
+                scheduler.post(machine, event, machine.name)
+
+        with Scheduler(max_workers=8, batch_size=4) as scheduler:
+            threads = [threading.Thread(target=producer, args=(machine,))
+                       for machine in machines for _ in range(2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert scheduler.join(timeout=10)
+        assert not overlaps
+        assert scheduler.pending == 0
+
+    def test_drop_newest(self, create_fsm):
+        executor = ThreadPoolExecutor(1)
+        blocker = threading.Event()
+        executor.submit(blocker.wait)
+        scheduler = Scheduler(executor=executor, mailbox_size=2,
+                              overflow_policy=OverflowPolicy.DROP_NEWEST)
+        calls = []
+        state_machine = create_fsm("sm", calls)
+        assert scheduler.post(state_machine, Event("event"), 0)
+        assert scheduler.post(state_machine, Event("back"), 1)
+        assert not scheduler.post(state_machine, Event("event"), 2)
+        assert scheduler.mailbox(state_machine).dropped == 1
+        blocker.set()
+        assert scheduler.join(timeout=10)
+        executor.shutdown()
+        assert calls == [0, 1]
+
+    def test_drop_oldest(self, create_fsm):
+        executor = ThreadPoolExecutor(1)
+        blocker = threading.Event()
+        executor.submit(blocker.wait)
+        scheduler = Scheduler(executor=executor, mailbox_size=1,
+                              overflow_policy=OverflowPolicy.DROP_OLDEST)
+        calls = []
+        state_machine = create_fsm("sm", calls)
+        assert scheduler.post(state_machine, Event("back"), 0)
+        assert scheduler.post(state_machine, Event("event"), 1)
+        blocker.set()
+        assert scheduler.join(timeout=10)
+        executor.shutdown()
+        assert calls == [1]
+
+    def test_raise_and_block_timeout(self, create_fsm):
+        executor = ThreadPoolExecutor(1)
+        blocker = threading.Event()
+        executor.submit(blocker.wait)
+        scheduler = Scheduler(executor=executor, mailbox_size=1,
+                              overflow_policy=OverflowPolicy.RAISE)
+        raising = create_fsm("raising")
+        blocking = create_fsm("blocking")
+        scheduler.register(blocking, overflow_policy=OverflowPolicy.BLOCK)
+        scheduler.post(raising, Event("event"))
+        with pytest.raises(queue.Full):
+            scheduler.post(raising, Event("back"))
+        scheduler.post(blocking, Event("event"))
+        with pytest.raises(queue.Full):
+            scheduler.post(blocking, Event("back"), timeout=0.01)
+        blocker.set()
+        assert scheduler.join(timeout=10)
+        executor.shutdown()
+        assert raising.current_state.name == "second_state"
+
+    def test_error_handler(self, create_fsm):
+        error_handler = MagicMock()
+        state_machine = create_fsm("sm")
+        state_machine.find_transition(State("initial_state"),
+                                      Event("event")).add_action(
+            MagicMock(side_effect=RuntimeError))
+        with Scheduler(max_workers=1, error_handler=error_handler) as \
+                scheduler:
+            scheduler.post(state_machine, Event("event"))
+            assert scheduler.join(timeout=10)
+        error_handler.assert_called_once()
+        assert error_handler.call_args[0][0] is state_machine
+
+    def test_error_handler_raises(self, create_fsm):
+        calls = []
+        state_machine = create_fsm("sm", calls)
+        state_machine.find_transition(State("initial_state"),
+                                      Event("event")).add_action(
+            MagicMock(side_effect=RuntimeError))
+        error_handler = MagicMock(side_effect=ValueError)
+        with Scheduler(max_workers=1, error_handler=error_handler) as \
+                scheduler:
+            scheduler.post(state_machine, Event("event"))
+            assert scheduler.join(timeout=10)
+            scheduler.post(state_machine, Event("back"), "back")
+            assert scheduler.join(timeout=10)
+        error_handler.assert_called_once()
+        assert calls == ["back"]
+
+    def test_base_exception_does_not_stall_mailbox(self, create_fsm):
+        class Abort(BaseException):
+            pass
+
+        calls = []
+        state_machine = create_fsm("sm", calls)
+        state_machine.find_transition(State("initial_state"),
+                                      Event("event")).add_action(
+            MagicMock(side_effect=Abort))
+        with Scheduler(max_workers=1) as scheduler:
+            scheduler.post(state_machine, Event("event"))
+            scheduler.post(state_machine, Event("back"), "back")
+            assert scheduler.join(timeout=10)
+            assert scheduler.pending == 0
+        assert calls == ["back"]
@@ -0,0 +1,90 @@
+from hfsm import State, StateMachine, Event, ShardedRuntime
+import pytest
+
+
+def fail_on_bad(data):
+    if data == "bad":
+        raise RuntimeError("bad data")
+
+
+class TestShardedRuntime:
+
+    @pytest.fixture
+    def create_fsm(self, fsm_builder):
+        return lambda: fsm_builder(
+            [("initial_state", "second_state", "event"),
+             ("second_state", "initial_state", "back")])
+
+    @pytest.fixture
+    def create_hierarchical_fsm(self, fsm_builder):
+        def create():
+            child_sm = fsm_builder(
+                [("child_initial_state", "child_second_state",
+                  "child_event")], "child_sm")
+            return fsm_builder(states=["parent_state"],
+                               children={"parent_state": child_sm})
+        return create
+
+    def test_invalid_arguments(self, create_fsm):
+        with pytest.raises(ValueError):
+            ShardedRuntime(create_fsm(), 0)
+        with pytest.raises(ValueError):
+            ShardedRuntime(StateMachine("sm"), 2)
+        with pytest.raises(ValueError):
+            ShardedRuntime(create_fsm(), 2).dispatch([])
+
+    def test_dispatch(self, create_fsm):
+        records = [(key, Event("event"), None) for key in range(100)]
+        records += [(key, Event("back"), None) for key in range(0, 100, 2)]
+        records += [(key, Event("back"), None) for key in range(0, 100, 2)]
+        with ShardedRuntime(create_fsm(), 3, batch_size=16) as runtime:
+            results = runtime.dispatch(records)
+            states = runtime.states()
+            assert runtime.states([1, 2, 1000]) == {1: "second_state",
+                                                    2: "initial_state"}
+            assert sum(result.events for result in
+                       runtime.dispatch([])) == 0
+        assert [result.shard for result in results] == [0, 1, 2]
+        assert sum(result.events for result in results) == 200
+        assert sum(result.transitions for result in results) == 150
+        assert sum(result.instances for result in results) == 100
+        assert all(result.instances for result in results)
+        assert states == {key: "second_state" if key % 2 else
+                          "initial_state" for key in range(100)}
+
+    def test_partition(self, create_fsm):
+        records = [(key, Event("event"), None) for key in range(10)]
+        with ShardedRuntime(create_fsm(), 2,
+                            partition=lambda key: 0) as runtime:
+            results = runtime.dispatch(records)
+        assert results[0].events == 10
+        assert results[1].events == 0
+
+    def test_spawn_context(self, create_fsm):
+        with ShardedRuntime(create_fsm(), 2, context="spawn") as runtime:
+            runtime.dispatch([("a", Event("event"), None)])
+            assert runtime.states(["a"]) == {"a": "second_state"}
+
+    def test_callback_error_keeps_shard(self, create_fsm):
+        state_machine = create_fsm()
+        state_machine.find_transition(
+            State("initial_state"), Event("event")).add_action(fail_on_bad)
+        records = [("a", Event("event"), "bad"), ("b", Event("event"), None),
+                   ("c", Event("event"), "bad")]
+        with ShardedRuntime(state_machine, 1) as runtime:
+            result, = runtime.dispatch(records)
+            assert runtime.states() == {"a": "initial_state",
+                                        "b": "second_state",
+                                        "c": "initial_state"}
+            assert runtime.dispatch([])[0].errors == 0
+        assert result.events == 3
+        assert result.transitions == 1
+        assert result.errors == 2
+        assert result.error == "RuntimeError: bad data"
+
+    def test_propagate(self, create_hierarchical_fsm):
+        records = [("a", Event("child_event"), None)]
+        with ShardedRuntime(create_hierarchical_fsm(), 1) as runtime:
+            assert runtime.dispatch(records)[0].transitions == 0
+            assert runtime.dispatch(records, propagate=True)[0] \
+                .transitions == 1
@@ -22,6 +22,12 @@ class TestState:
         state2 = State("state")
         assert state1 == state2
 
+    def test_hash(self):
+        state1 = State("state")
+        state2 = State("state")
+        assert hash(state1) == hash(state2)
+        assert {state1: 1}[state2] == 1
+
     def test_set_child_sm(self):
         child_state_machine = StateMachine("state_machine")
         state = State("state")
@@ -53,6 +59,30 @@ class TestState:
         state.stop("data")
         callback.assert_called_once_with("data")
 
+    def test_compact(self):
+        state = State("state")
+        assert not hasattr(state, "__dict__")
+        assert state.entry_callbacks == ()
+        assert state.exit_callbacks == ()
+        callback = MagicMock()
+        state.on_entry(callback)
+        assert state.entry_callbacks == (callback,)
+
+    def test_subclass(self):
+        class IdleState(State):
+
+            def __init__(self, name):
+                super().__init__(name)
+                self.visits = 0
+                self.on_entry(self.entry_callback)
+
+            def entry_callback(self, data):
+                self.visits += 1
+
+        state = IdleState("idle")
+        state.start("data")
+        assert state.visits == 1
+
 
 class TestExitState:
 
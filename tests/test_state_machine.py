@@ -1,4 +1,5 @@
-from hfsm import State, StateMachine, ExitState, Event
+from hfsm import State, StateMachine, ExitState, Event, snapshot_many, \
+    restore_many, set_tracer
 from unittest.mock import MagicMock
 import pytest
 
@@ -40,6 +41,60 @@ class TestStateMachine:
         with pytest.raises(ValueError):
             state_machine.add_state(initial_state)
 
+    def test_add_states_events_transitions(self):
+        state_machine = StateMachine("sm")
+        states = [State(f"state{index}") for index in range(3)]
+        events = [Event("event"), Event("back")]
+        state_machine.add_states(states, initial_state=states[0])
+        state_machine.add_events(events)
+        transitions = state_machine.add_transitions(
+            [(states[0], states[1], events[0]),
+             (states[0], states[2], events[0], 10),
+             (states[1], states[0], events[1], 0, True)])
+        assert state_machine.initial_state == states[0]
+        assert state_machine.find_transitions(states[0], events[0]) == \
+            (transitions[1], transitions[0])
+        assert transitions[2].is_default
+        state_machine.start("data")
+        state_machine.trigger_event(events[0], "data")
+        assert state_machine.current_state == states[2]
+
+    def test_bulk_errors_reported_together(self):
+        state_machine = StateMachine("sm")
+        state_machine.add_state(State("state0"), initial_state=True)
+        with pytest.raises(ValueError) as error:
+            state_machine.add_states([State("state0"), State("state1"),
+                                      State("state1")], State("missing"))
+        assert str(error.value) == \
+            "cannot add states: duplicate state 'state0'; duplicate " \
+            "state 'state1'; unknown initial state 'missing'"
+        state_machine.add_state(State("state1"))
+        with pytest.raises(ValueError, match="duplicate event 'event'"):
+            state_machine.add_events([Event("event"), Event("event")])
+        state_machine.add_events([Event("event")])
+        with pytest.raises(ValueError) as error:
+            state_machine.add_transitions(
+                [(State("state0"), State("state1"), Event("event")),
+                 (State("state0"), State("state0"), Event("event")),
+                 (State("state2"), State("state2"), Event("other"))])
+        assert str(error.value) == \
+            "cannot add transitions: transition 2 refers to unknown " \
+            "state 'state2', event 'other'"
+        assert state_machine.find_transitions(State("state0"),
+                                              Event("event")) == ()
+        transition = state_machine.add_transition(
+            State("state1"), State("state0"), Event("event"))
+        with pytest.raises(ValueError, match="transition 1 refers"):
+            state_machine.add_transitions(
+                [(State("state1"), State("state1"), Event("event"), 5),
+                 (State("state1"), State("state2"), Event("event")),
+                 (State("state0"), State("state1"), Event("event"))])
+        assert state_machine.find_transitions(State("state1"),
+                                              Event("event")) == (transition,)
+        assert state_machine.find_transitions(State("state0"),
+                                              Event("event")) == ()
+        assert state_machine._transitions == [transition]
+
     def test_transition_with_invalid_event(self):
         state_machine = StateMachine("sm")
         initial_state = State("initial_state")
@@ -114,6 +169,108 @@ class TestStateMachine:
         exit_cb.assert_called_once_with("data")
         entry_cb.assert_called_once_with("data")
 
+    def test_event_trigger_by_name_and_id(self):
+        state_machine = StateMachine("sm")
+        initial_state = State("initial_state")
+        second_state = State("second_state")
+        event = Event("event")
+        back_event = Event("back")
+        state_machine.add_state(initial_state, initial_state=True)
+        state_machine.add_state(second_state)
+        state_machine.add_event(event, event_id=1)
+        state_machine.add_event(back_event)
+        with pytest.raises(ValueError):
+            state_machine.add_event(back_event, event_id=1)
+        state_machine.add_transition(initial_state, second_state, event)
+        state_machine.add_transition(second_state, initial_state,
+                                     back_event)
+        assert state_machine.get_event(1) is event
+        assert state_machine.get_event("back") is back_event
+        state_machine.start("data")
+        state_machine.trigger_event(1, "data")
+        assert state_machine.current_state == second_state
+        state_machine.trigger_event("back", "data")
+        assert state_machine.current_state == initial_state
+        state_machine.dispatch_many([(1, "data"), ("back", "data"),
+                                     ("event", "data")])
+        assert state_machine.current_state == second_state
+        state_machine.trigger_event("unknown", "data")
+        assert state_machine.current_state == second_state
+        with pytest.raises(ValueError):
+            state_machine.trigger_event(2, "data")
+
+    def test_unknown_event_id_from_callback(self):
+        state_machine = StateMachine("sm")
+        initial_state = State("initial_state")
+        second_state = State("second_state")
+        event = Event("event")
+        next_event = Event("next")
+        state_machine.add_state(initial_state, initial_state=True)
+        state_machine.add_state(second_state)
+        state_machine.add_event(event, event_id=1)
+        state_machine.add_event(next_event)
+        state_machine.add_transition(initial_state, second_state, event)
+        state_machine.add_self_transition(second_state, next_event)
+        next_cb = MagicMock()
+        state_machine.find_transition(second_state, next_event) \
+            .add_action(next_cb)
+        errors = []
+
+        def trigger(data):
+            state_machine.trigger_event(next_event, data)
+            for evt in (2, [(2, data)]):
+                try:
+                    if isinstance(evt, list):
+                        state_machine.dispatch_many(evt)
+                    else:
+                        state_machine.trigger_event(evt, data)
+                except ValueError as error:
+                    errors.append(error)
+            state_machine.trigger_event("next", data)
+
+        state_machine.find_transition(initial_state, event) \
+            .add_action(trigger)
+        state_machine.start("data")
+        state_machine.trigger_event(1, "data")
+        assert len(errors) == 2
+        assert next_cb.call_count == 2
+
+    def test_event_trigger_many_transitions(self):
+        state_machine = StateMachine("sm")
+        states = [State(f"state{i}") for i in range(100)]
+        events = [Event(f"event{i}") for i in range(100)]
+        state_machine.add_state(states[0], initial_state=True)
+        for state in states[1:]:
+            state_machine.add_state(state)
+        for event in events:
+            state_machine.add_event(event)
+        for i in range(100):
+            for j in range(100):
+                state_machine.add_transition(states[i],
+                                             states[(i + j) % 100],
+                                             events[j])
+        state_machine.start("data")
+        state_machine.trigger_event(Event("event7"), "data")
+        assert state_machine.current_state == states[7]
+        state_machine.trigger_event(Event("event5"), "data")
+        assert state_machine.current_state == states[12]
+
+    def test_event_trigger_first_transition_wins(self):
+        state_machine = StateMachine("sm")
+        initial_state = State("initial_state")
+        second_state = State("second_state")
+        third_state = State("third_state")
+        event = Event("event")
+        state_machine.add_state(initial_state, initial_state=True)
+        state_machine.add_state(second_state)
+        state_machine.add_state(third_state)
+        state_machine.add_event(event)
+        state_machine.add_transition(initial_state, second_state, event)
+        state_machine.add_transition(initial_state, third_state, event)
+        state_machine.start("data")
+        state_machine.trigger_event(event, "data")
+        assert state_machine.current_state == second_state
+
     def test_event_trigger_before_starting(self):
         state_machine = StateMachine("sm")
         exit_cb = MagicMock()
@@ -244,3 +401,457 @@ class TestStateMachine:
         state_machine.add_state(initial_state)
         with pytest.raises(ValueError):
             state_machine.stop("data")
+
+    def test_compile(self):
+        state_machine = StateMachine("sm")
+        initial_state = State("initial_state")
+        second_state = State("second_state")
+        event = Event("event")
+        state_machine.add_state(initial_state, initial_state=True)
+        state_machine.add_state(second_state)
+        state_machine.add_event(event)
+        state_machine.add_transition(initial_state, second_state, event)
+        table = state_machine.compile()
+        assert state_machine.frozen
+        assert state_machine.table is table
+        assert state_machine.compile() is table
+        initial_id = table.state_id(initial_state)
+        second_id = table.state_id(second_state)
+        event_id = table.event_id(event)
+        assert table.states[second_id] == second_state
+        assert table.events[event_id] == event
+        assert table.next_state(initial_id, event_id) == second_id
+        assert table.next_state(second_id, event_id) == -1
+        assert table.transition(second_id, event_id) is None
+        assert table.is_exit(table.state_id(state_machine.exit_state))
+        assert len(table.next_states) == len(table)
+
+    def test_compile_freezes_definition(self):
+        state_machine = StateMachine("sm")
+        initial_state = State("initial_state")
+        event = Event("event")
+        state_machine.add_state(initial_state, initial_state=True)
+        state_machine.add_event(event)
+        transition = state_machine.add_self_transition(initial_state, event)
+        state_machine.compile()
+        with pytest.raises(ValueError):
+            state_machine.add_state(State("second_state"))
+        with pytest.raises(ValueError):
+            state_machine.add_event(Event("other"))
+        with pytest.raises(ValueError):
+            state_machine.add_transition(initial_state, initial_state, event)
+        with pytest.raises(ValueError):
+            state_machine.add_self_transition(initial_state, event)
+        with pytest.raises(ValueError):
+            state_machine.add_null_transition(initial_state, event)
+        with pytest.raises(ValueError):
+            state_machine.on_exit(MagicMock())
+        with pytest.raises(ValueError):
+            initial_state.set_child_sm(self.create_child_fsm())
+        with pytest.raises(ValueError):
+            initial_state.on_entry(MagicMock())
+        with pytest.raises(ValueError):
+            initial_state.on_exit(MagicMock())
+        with pytest.raises(ValueError):
+            transition.add_condition(MagicMock())
+        with pytest.raises(ValueError):
+            transition.add_action(MagicMock())
+        assert transition.condition is None and transition.action is None
+
+    def test_compiled_event_trigger(self):
+        exit_sm_cb = MagicMock()
+        state_machine = StateMachine("sm")
+        state_machine.on_exit(exit_sm_cb)
+        initial_state = State("initial_state")
+        exit_state_error = ExitState("Error")
+        child_sm = self.create_child_fsm()
+        initial_state.set_child_sm(child_sm)
+        event = Event("event")
+        error_event = Event("error")
+        state_machine.add_state(initial_state, initial_state=True)
+        state_machine.add_state(exit_state_error)
+        state_machine.add_event(event)
+        state_machine.add_event(error_event)
+        state_machine.add_transition(initial_state, exit_state_error,
+                                     error_event)
+        state_machine.compile()
+        assert child_sm.frozen
+        state_machine.start("data")
+        state_machine.trigger_event(event, "data")
+        assert state_machine.current_state == initial_state
+        state_machine.trigger_event(event, "data", propagate=True)
+        assert child_sm.current_state.name == "child_second_state"
+        state_machine.trigger_event(error_event, "data")
+        assert state_machine.current_state == exit_state_error
+        exit_sm_cb.assert_called_once_with(exit_state_error, "data")
+
+    def test_event_trigger_condition_false(self):
+        state_machine = StateMachine("sm")
+        initial_state = State("initial_state")
+        second_state = State("second_state")
+        event = Event("event")
+        state_machine.add_state(initial_state, initial_state=True)
+        state_machine.add_state(second_state)
+        state_machine.add_event(event)
+        transition = state_machine.add_transition(initial_state,
+                                                  second_state, event)
+        transition.add_condition(MagicMock(return_value=False))
+        state_machine.start("data")
+        state_machine.trigger_event(event, "data")
+        assert state_machine.current_state == initial_state
+
+    @staticmethod
+    def create_guarded_fsm():
+        state_machine = StateMachine("sm")
+        initial_state = State("initial_state")
+        state_machine.add_state(initial_state, initial_state=True)
+        for name in ("low", "high", "fallback"):
+            state_machine.add_state(State(name))
+        event = Event("event")
+        state_machine.add_event(event)
+        return state_machine
+
+    def test_guard_chain_fallthrough(self):
+        state_machine = self.create_guarded_fsm()
+        initial_state, event = State("initial_state"), Event("event")
+        first = state_machine.add_transition(initial_state, State("low"),
+                                             event)
+        second = state_machine.add_transition(initial_state, State("high"),
+                                              event)
+        first.add_condition(lambda data: data == "low")
+        second.add_condition(lambda data: data == "high")
+        assert state_machine.find_transitions(initial_state, event) == \
+            (first, second)
+        state_machine.start("data")
+        state_machine.trigger_event(event, "high")
+        assert state_machine.current_state == State("high")
+
+    def test_guard_chain_priority_and_default(self):
+        state_machine = self.create_guarded_fsm()
+        initial_state, event = State("initial_state"), Event("event")
+        fallback = state_machine.add_transition(
+            initial_state, State("fallback"), event, default=True)
+        low = state_machine.add_transition(initial_state, State("low"),
+                                           event)
+        high = state_machine.add_transition(initial_state, State("high"),
+                                            event, priority=10)
+        high.add_condition(lambda data: data > 10)
+        low.add_condition(lambda data: data > 0)
+        assert state_machine.find_transitions(initial_state, event) == \
+            (high, low, fallback)
+        assert state_machine.find_transition(initial_state, event) is high
+        assert fallback.is_default and high.priority == 10
+        state_machine.compile()
+        for data, expected in ((20, "high"), (5, "low"), (-1, "fallback")):
+            state_machine.start(data)
+            state_machine.trigger_event(event, data)
+            assert state_machine.current_state == State(expected)
+        table = state_machine.table
+        state_id = table.state_id(initial_state)
+        event_id = table.event_id(event)
+        assert table.transitions(state_id, event_id) == \
+            (high, low, fallback)
+        assert table.next_state(state_id, event_id) == \
+            table.state_id(State("high"))
+
+    def test_run_to_completion(self):
+        calls = []
+        state_machine = StateMachine("sm")
+        initial_state = State("initial_state")
+        second_state = State("second_state")
+        third_state = State("third_state")
+        event = Event("event")
+        next_event = Event("next")
+        state_machine.add_state(initial_state, initial_state=True)
+        state_machine.add_state(second_state)
+        state_machine.add_state(third_state)
+        state_machine.add_event(event)
+        state_machine.add_event(next_event)
+        state_machine.add_transition(initial_state, second_state, event)
+        state_machine.add_transition(second_state, third_state, next_event)
+
+        def on_second_entry(data):
+            calls.append("enter second")
+            state_machine.trigger_event(next_event, data)
+            calls.append("enter second done")
+            assert state_machine.current_state == second_state
+
+        second_state.on_entry(on_second_entry)
+        second_state.on_exit(lambda data: calls.append("exit second"))
+        third_state.on_entry(lambda data: calls.append("enter third"))
+        state_machine.start("data")
+        state_machine.trigger_event(event, "data")
+        assert calls == ["enter second", "enter second done",
+                         "exit second", "enter third"]
+        assert state_machine.current_state == third_state
+
+    def test_trigger_during_start(self):
+        calls = []
+        state_machine = StateMachine("sm")
+        a_state = State("a")
+        b_state = State("b")
+        event = Event("event")
+        state_machine.add_state(a_state, initial_state=True)
+        state_machine.add_state(b_state)
+        state_machine.add_event(event)
+        state_machine.add_transition(a_state, b_state, event)
+
+        def on_a_entry(data):
+            calls.append("a-entry1")
+            state_machine.trigger_event(event, data)
+
+        a_state.on_entry(on_a_entry)
+        a_state.on_entry(lambda data: calls.append("a-entry2"))
+        a_state.on_exit(lambda data: calls.append("a-exit"))
+        b_state.on_entry(lambda data: calls.append("b-entry"))
+        state_machine.start("data")
+        assert calls == ["a-entry1", "a-entry2", "a-exit", "b-entry"]
+        assert state_machine.current_state == b_state
+
+    def test_trigger_during_start_with_child_sm(self):
+        child_sm = StateMachine("child_sm")
+        child_sm.add_state(State("child_state"), initial_state=True)
+        state_machine = StateMachine("sm")
+        parent_state = State("parent_state", child_sm)
+        second_state = State("second_state")
+        event = Event("event")
+        state_machine.add_state(parent_state, initial_state=True)
+        state_machine.add_state(second_state)
+        state_machine.add_event(event)
+        state_machine.add_transition(parent_state, second_state, event)
+        parent_state.on_entry(
+            lambda data: state_machine.trigger_event(event, data))
+        state_machine.start("data")
+        assert state_machine.current_state == second_state
+        assert child_sm.current_state == child_sm.exit_state
+
+    def test_trigger_during_stop(self):
+        state_machine = StateMachine("sm")
+        initial_state = State("initial_state")
+        event = Event("event")
+        entry_cb = MagicMock()
+        state_machine.add_state(initial_state, initial_state=True)
+        state_machine.add_event(event)
+        state_machine.add_self_transition(initial_state, event)
+        state_machine.find_transition(initial_state, event) \
+            .add_action(entry_cb)
+        initial_state.on_exit(
+            lambda data: state_machine.trigger_event(event, data))
+        state_machine.start("data")
+        state_machine.stop("data")
+        entry_cb.assert_not_called()
+        assert not state_machine.is_running()
+
+    def test_dispatch_many(self):
+        state_machine = StateMachine("sm")
+        initial_state = State("initial_state")
+        second_state = State("second_state")
+        event = Event("event")
+        back_event = Event("back")
+        entry_cb = MagicMock()
+        second_state.on_entry(entry_cb)
+        state_machine.add_state(initial_state, initial_state=True)
+        state_machine.add_state(second_state)
+        state_machine.add_event(event)
+        state_machine.add_event(back_event)
+        state_machine.add_transition(initial_state, second_state, event)
+        state_machine.add_transition(second_state, initial_state, back_event)
+        with pytest.raises(ValueError):
+            state_machine.dispatch_many([(event, "data")])
+        state_machine.start("data")
+        state_machine.dispatch_many(
+            (evt, i) for i, evt in enumerate([event, back_event] * 50))
+        assert state_machine.current_state == initial_state
+        assert entry_cb.call_count == 50
+        entry_cb.assert_called_with(98)
+
+    def test_dispatch_many_with_callback_error(self):
+        state_machine = StateMachine("sm")
+        initial_state = State("initial_state")
+        second_state = State("second_state")
+        event = Event("event")
+        back_event = Event("back")
+        state_machine.add_state(initial_state, initial_state=True)
+        state_machine.add_state(second_state)
+        state_machine.add_event(event)
+        state_machine.add_event(back_event)
+        transition = state_machine.add_transition(initial_state,
+                                                  second_state, event)
+        state_machine.add_transition(second_state, initial_state, back_event)
+        transition.add_action(MagicMock(side_effect=[RuntimeError, None]))
+        state_machine.start("data")
+        with pytest.raises(RuntimeError):
+            state_machine.dispatch_many([(event, "data"),
+                                         (back_event, "data")])
+        state_machine.trigger_event(event, "data")
+        assert state_machine.current_state == second_state
+
+    def create_hierarchical_fsm(self):
+        state_machine = StateMachine("sm")
+        initial_state = State("initial_state")
+        second_state = State("second_state", self.create_child_fsm())
+        event = Event("event")
+        state_machine.add_state(initial_state, initial_state=True)
+        state_machine.add_state(second_state)
+        state_machine.add_event(event)
+        state_machine.add_transition(initial_state, second_state, event)
+        return state_machine
+
+    def test_snapshot_restore(self):
+        state_machine = self.create_hierarchical_fsm()
+        state_machine.start("data")
+        state_machine.trigger_event(Event("event"), "data")
+        state_machine.trigger_event(Event("event"), "data", propagate=True)
+        snapshot = state_machine.snapshot()
+        assert snapshot == bytes([2, 4, 4])
+
+        restored = self.create_hierarchical_fsm()
+        entry_cb = MagicMock()
+        child_sm = restored.find_transition(
+            State("initial_state"), Event("event")).destination_state.child_sm
+        child_sm.find_transition(
+            State("child_initial_state"),
+            Event("event")).destination_state.on_entry(entry_cb)
+        restored.restore(snapshot)
+        entry_cb.assert_not_called()
+        assert restored.current_state.name == "second_state"
+        assert child_sm.current_state.name == "child_second_state"
+        assert restored.is_running()
+
+    def test_snapshot_not_started(self):
+        state_machine = self.create_hierarchical_fsm()
+        assert state_machine.snapshot() == bytes([0])
+        state_machine.start("data")
+        state_machine.restore(bytes([0]))
+        assert state_machine.current_state is None
+
+    def test_restore_compiled(self):
+        state_machine = self.create_hierarchical_fsm()
+        state_machine.compile()
+        state_machine.restore(bytes([2, 4, 2]))
+        state_machine.trigger_event(Event("event"), "data", propagate=True)
+        assert state_machine.current_state.child_sm.current_state.name == \
+            "child_second_state"
+
+    def test_restore_invalid_snapshot(self):
+        state_machine = self.create_hierarchical_fsm()
+        with pytest.raises(ValueError):
+            state_machine.restore(bytes([1, 40]))
+        with pytest.raises(ValueError):
+            state_machine.restore(bytes([3, 2, 2, 2]))
+        with pytest.raises(ValueError):
+            state_machine.restore(bytes([2, 2]))
+        with pytest.raises(ValueError):
+            state_machine.restore(bytes([0, 0]))
+
+    def test_snapshot_regions_rejected(self):
+        state_machine = self.create_hierarchical_fsm()
+        region = StateMachine("region")
+        region.add_state(State("region_state"), initial_state=True)
+        parallel_state = State("parallel_state")
+        parallel_state.add_region(region)
+        state_machine.add_state(parallel_state)
+        state_machine.add_event(Event("split"))
+        state_machine.add_transition(State("initial_state"), parallel_state,
+                                     Event("split"))
+        state_machine.start("data")
+        snapshot = state_machine.snapshot()
+        state_machine.trigger_event(Event("split"), "data")
+        with pytest.raises(ValueError):
+            state_machine.snapshot()
+        with pytest.raises(ValueError):
+            state_machine.restore(bytes([1, 6]))
+        state_machine.restore(snapshot)
+        assert state_machine.current_state.name == "initial_state"
+
+    def test_snapshot_many(self):
+        machines = [self.create_hierarchical_fsm() for _ in range(3)]
+        for machine in machines:
+            machine.start("data")
+        machines[1].trigger_event(Event("event"), "data")
+        machines[2].stop("data")
+        buffer = snapshot_many(machines)
+        restored = [self.create_hierarchical_fsm() for _ in range(3)]
+        restore_many(restored, buffer)
+        assert [machine.current_state.name for machine in restored] == \
+            ["initial_state", "second_state", "NormalExitState"]
+        assert not restored[2].is_running()
+        with pytest.raises(ValueError):
+            restore_many(restored[:2], buffer)
+
+    @staticmethod
+    def create_deep_fsm(depth):
+        machines = []
+        for level in range(depth):
+            state_machine = StateMachine(f"sm{level}")
+            initial_state = State(f"initial_state{level}")
+            second_state = State(f"second_state{level}")
+            event = Event(f"event{level}")
+            state_machine.add_state(initial_state, initial_state=True)
+            state_machine.add_state(second_state)
+            state_machine.add_event(event)
+            state_machine.add_transition(initial_state, second_state, event)
+            state_machine.add_transition(second_state, initial_state, event)
+            if machines:
+                initial_state.set_child_sm(machines[-1])
+            machines.append(state_machine)
+        return machines
+
+    def test_active_leaf(self):
+        machines = self.create_deep_fsm(5)
+        root, leaf = machines[-1], machines[0]
+        assert root.active_leaf is root
+        assert leaf.parent_sm is machines[1]
+        assert root.parent_sm is None
+        root.start("data")
+        assert root.active_leaf is leaf
+        assert machines[2].active_leaf is leaf
+        root.trigger_event(Event("event2"), "data", propagate=True)
+        assert machines[2].current_state.name == "second_state2"
+        assert root.active_leaf is machines[2]
+        machines[2].trigger_event(Event("event2"), "data")
+        assert root.active_leaf is leaf
+        root.trigger_event(Event("event4"), "data")
+        assert root.active_leaf is root
+        root.restore(bytes([3, 2, 2, 4]))
+        assert root.active_leaf is machines[2]
+        root.stop("data")
+        assert root.active_leaf is root
+
+    def test_event_bubbling(self):
+        machines = self.create_deep_fsm(3)
+        root = machines[-1]
+        root.start("data")
+        root.trigger_event(Event("event0"), "data", propagate=True)
+        assert machines[0].current_state.name == "second_state0"
+        root.trigger_event(Event("event2"), "data", propagate=True)
+        assert root.current_state.name == "second_state2"
+        assert machines[0].current_state.name == "NormalExitState"
+        root.trigger_event(Event("event2"), "data", propagate=True)
+        assert machines[0].current_state.name == "initial_state0"
+
+    def test_event_bubbling_condition_false(self):
+        machines = self.create_deep_fsm(2)
+        child_sm, root = machines
+        child_sm.add_event(Event("event1"))
+        transition = child_sm.add_transition(State("initial_state0"),
+                                             State("second_state0"),
+                                             Event("event1"))
+        transition.add_condition(MagicMock(return_value=False))
+        root.start("data")
+        root.trigger_event(Event("event1"), "data", propagate=True)
+        assert child_sm.current_state.name == "NormalExitState"
+        assert root.current_state.name == "second_state1"
+
+    def test_event_bubbling_unhandled(self):
+        tracer = MagicMock()
+        set_tracer(tracer)
+        try:
+            machines = self.create_deep_fsm(3)
+            root = machines[-1]
+            root.start("data")
+            root.trigger_event(Event("unknown"), "data", propagate=True)
+        finally:
+            set_tracer(None)
+        tracer.on_unhandled.assert_called_once_with(
+            machines[0], machines[0].current_state, Event("unknown"))
@@ -0,0 +1,235 @@
+from hfsm import State, StateMachine, Event, TimingWheel, AsyncState, \
+    AsyncStateMachine
+from unittest.mock import MagicMock
+import asyncio
+import random
+import pytest
+
+
+class TestTimingWheel:
+
+    def test_invalid_arguments(self):
+        with pytest.raises(ValueError):
+            TimingWheel(resolution=0)
+        with pytest.raises(ValueError):
+            TimingWheel(slots=6)
+        with pytest.raises(ValueError):
+            TimingWheel(levels=0)
+
+    def test_fires_in_order_across_levels(self):
+        wheel = TimingWheel(resolution=1, slots=4, levels=2)
+        fired = []
+        delays = [1, 3, 4, 5, 17, 40, 100]
+        for delay in delays:
+            wheel.schedule(delay, fired.append, delay)
+        assert len(wheel) == len(delays)
+        for now in range(1, 120):
+            wheel.advance(now)
+            assert fired == [delay for delay in delays if delay <= now]
+        assert len(wheel) == 0
+
+    def test_random_deadlines(self):
+        generator = random.Random(0)
+        wheel = TimingWheel(resolution=0.5, slots=8, levels=3)
+        fired = []
+        deadlines = [generator.randint(1, 1000) / 2 for _ in range(500)]
+        for deadline in deadlines:
+            wheel.schedule_at(deadline, fired.append, deadline)
+        now = 0.0
+        while now < 600:
+            now += generator.randint(1, 40) / 4
+            wheel.advance(now)
+            assert sorted(fired) == sorted(
+                deadline for deadline in deadlines if deadline <= now)
+
+    def test_cancel(self):
+        wheel = TimingWheel(resolution=1, slots=4, levels=2)
+        callback = MagicMock()
+        timer = wheel.schedule(10, callback)
+        assert timer.active
+        assert timer.deadline == 10
+        timer.cancel()
+        timer.cancel()
+        assert not timer.active
+        assert len(wheel) == 0
+        wheel.advance(20)
+        callback.assert_not_called()
+
+    def test_cancel_from_callback(self):
+        wheel = TimingWheel(resolution=1)
+        callback = MagicMock()
+        timers = []
+        wheel.schedule(1, lambda: timers[0].cancel())
+        timers.append(wheel.schedule(1, callback))
+        assert wheel.advance(1) == 1
+        callback.assert_not_called()
+        assert len(wheel) == 0
+
+    def test_failing_callback_keeps_timers(self):
+        wheel = TimingWheel(resolution=1)
+        callback = MagicMock()
+        wheel.schedule(1, MagicMock(side_effect=RuntimeError))
+        wheel.schedule(1, callback)
+        with pytest.raises(RuntimeError):
+            wheel.advance(1)
+        assert wheel.advance(1) == 1
+        callback.assert_called_once_with()
+
+    def test_drive(self):
+        wheel = TimingWheel(resolution=0.001, now=0.0)
+        callback = MagicMock()
+        wheel.schedule(0.01, callback)
+        clock = iter(step * 0.005 for step in range(100))
+
+        async def run():
+            driver = asyncio.ensure_future(wheel.drive(lambda: next(clock)))
+            while not callback.called:
+                await asyncio.sleep(0.001)
+            driver.cancel()
+
+        asyncio.run(run())
+        callback.assert_called_once_with()
+
+    def test_drive_starts_at_clock(self):
+        wheel = TimingWheel(resolution=1)
+        callback = MagicMock()
+        wheel.schedule(30, callback)
+        clock = MagicMock(return_value=10000.0)
+
+        async def run():
+            driver = asyncio.ensure_future(wheel.drive(clock))
+            await asyncio.sleep(0.01)
+            assert not callback.called
+            clock.return_value = 10030.0
+            while not callback.called:
+                await asyncio.sleep(0.01)
+            driver.cancel()
+
+        asyncio.run(run())
+        assert wheel.now == 10030.0
+
+
+class TestTimeoutTransition:
+
+    @pytest.fixture
+    def create_fsm(self, fsm_builder):
+        def create(wheel):
+            state_machine = fsm_builder(
+                [("initial_state", "second_state", "event"),
+                 ("initial_state", None, "refresh", "self")])
+            initial_state = state_machine.initial_state
+            state_machine.add_timeout_transition(
+                initial_state, state_machine.find_transition(
+                    initial_state, Event("event")).destination_state, 5)
+            state_machine.set_timing_wheel(wheel)
+            return state_machine
+        return create
+
+    def test_timeout_fires(self, create_fsm):
+        wheel = TimingWheel(resolution=1)
+        state_machine = create_fsm(wheel)
+        with pytest.raises(ValueError):
+            state_machine.add_timeout_transition(State("initial_state"),
+                                                 State("second_state"), 0)
+        entry_cb = MagicMock()
+        state_machine.find_transition(
+            State("initial_state"),
+            Event("after 5s in initial_state")).add_action(entry_cb)
+        state_machine.start("data")
+        wheel.advance(4)
+        assert state_machine.current_state == State("initial_state")
+        wheel.advance(5)
+        assert state_machine.current_state == State("second_state")
+        entry_cb.assert_called_once_with("data")
+        assert len(wheel) == 0
+
+    def test_timeout_cancelled_on_exit(self, create_fsm):
+        wheel = TimingWheel(resolution=1)
+        state_machine = create_fsm(wheel)
+        state_machine.start("data")
+        assert len(wheel) == 1
+        state_machine.trigger_event(Event("event"), "data")
+        assert len(wheel) == 0
+
+    def test_timeout_restarted_by_self_transition(self, create_fsm):
+        wheel = TimingWheel(resolution=1)
+        state_machine = create_fsm(wheel)
+        state_machine.start("data")
+        wheel.advance(3)
+        state_machine.trigger_event(Event("refresh"), "data")
+        wheel.advance(7)
+        assert state_machine.current_state == State("initial_state")
+        wheel.advance(8)
+        assert state_machine.current_state == State("second_state")
+
+    def test_timing_wheel_required(self, create_fsm):
+        state_machine = create_fsm(None)
+        with pytest.raises(ValueError):
+            state_machine.start("data")
+
+    def test_restore_rearms_timeouts(self, create_fsm):
+        wheel = TimingWheel(resolution=1)
+        state_machine = create_fsm(wheel)
+        state_machine.start("data")
+        snapshot = state_machine.snapshot()
+        state_machine.trigger_event(Event("event"), "data")
+        assert len(wheel) == 0
+        state_machine.restore(snapshot)
+        assert len(wheel) == 1
+        wheel.advance(5)
+        assert state_machine.current_state == State("second_state")
+
+    def test_restore_cancels_old_timeouts(self, create_fsm):
+        wheel = TimingWheel(resolution=1)
+        state_machine = create_fsm(wheel)
+        state_machine.start("data")
+        snapshot = state_machine.snapshot()
+        state_machine.restore(snapshot)
+        assert len(wheel) == 1
+        state_machine.trigger_event(Event("event"), "data")
+        second = state_machine.snapshot()
+        state_machine.restore(snapshot)
+        state_machine.restore(second)
+        assert len(wheel) == 0
+        wheel.advance(10)
+        assert state_machine.current_state == State("second_state")
+
+    def test_child_timeout(self, create_fsm):
+        wheel = TimingWheel(resolution=1)
+        child_sm = StateMachine("child_sm")
+        child_initial_state = State("child_initial_state")
+        child_second_state = State("child_second_state")
+        child_sm.add_state(child_initial_state, initial_state=True)
+        child_sm.add_state(child_second_state)
+        child_sm.add_timeout_transition(child_initial_state,
+                                        child_second_state, 2)
+        state_machine = create_fsm(wheel)
+        parent_state = State("parent_state", child_sm)
+        state_machine.add_state(parent_state)
+        state_machine.add_event(Event("enter"))
+        state_machine.add_transition(State("second_state"), parent_state,
+                                     Event("enter"))
+        state_machine.start("data")
+        state_machine.trigger_event(Event("event"), "data")
+        state_machine.trigger_event(Event("enter"), "data")
+        assert child_sm.timing_wheel is wheel
+        wheel.advance(10)
+        assert child_sm.current_state == child_second_state
+
+    def test_async_timeout(self):
+        wheel = TimingWheel(resolution=1)
+        state_machine = AsyncStateMachine("sm")
+        initial_state = AsyncState("initial_state")
+        second_state = AsyncState("second_state")
+        state_machine.add_state(initial_state, initial_state=True)
+        state_machine.add_state(second_state)
+        state_machine.add_timeout_transition(initial_state, second_state, 1)
+        state_machine.set_timing_wheel(wheel)
+
+        async def run():
+            await state_machine.start("data")
+            wheel.advance(1)
+            await asyncio.sleep(0)
+
+        asyncio.run(run())
+        assert state_machine.current_state == second_state
@@ -0,0 +1,75 @@
+from hfsm import State, Event, Tracer, LoggingTracer, \
+    Blueprint, set_tracer, get_tracer
+from unittest.mock import MagicMock
+import logging
+import pytest
+
+
+class TestTracer:
+
+    @pytest.fixture(autouse=True)
+    def reset_tracer(self):
+        yield
+        set_tracer(None)
+
+    @pytest.fixture
+    def create_fsm(self, fsm_builder):
+        return lambda: fsm_builder(
+            [("initial_state", "second_state", "event"),
+             ("second_state", None, "null", "null")])
+
+    def test_no_tracer_by_default(self):
+        assert get_tracer() is None
+
+    def test_set_tracer(self):
+        tracer = Tracer()
+        set_tracer(tracer)
+        assert get_tracer() is tracer
+
+    def test_tracer_hooks(self, create_fsm):
+        tracer = MagicMock(spec=Tracer)
+        set_tracer(tracer)
+        state_machine = create_fsm()
+        state_machine.start("data")
+        tracer.on_entry.assert_called_once_with(State("initial_state"),
+                                                "data")
+        state_machine.trigger_event(Event("event"), "data")
+        transition = state_machine.find_transition(State("initial_state"),
+                                                   Event("event"))
+        tracer.on_transition.assert_called_once_with(transition, "data")
+        tracer.on_exit.assert_called_once_with(State("initial_state"),
+                                               "data")
+        tracer.on_entry.assert_called_with(State("second_state"), "data")
+        state_machine.trigger_event(Event("event"), "data")
+        tracer.on_unhandled.assert_called_once_with(
+            state_machine, State("second_state"), Event("event"))
+
+    def test_tracer_hooks_blueprint(self, create_fsm):
+        tracer = MagicMock(spec=Tracer)
+        set_tracer(tracer)
+        instance = Blueprint(create_fsm()).create()
+        instance.start("data")
+        instance.trigger_event(Event("event"), "data")
+        assert tracer.on_transition.call_count == 1
+        instance.trigger_event(Event("event"), "data")
+        tracer.on_unhandled.assert_called_once_with(
+            instance, State("second_state"), Event("event"))
+
+    def test_logging_tracer(self, create_fsm, caplog):
+        set_tracer(LoggingTracer())
+        state_machine = create_fsm()
+        with caplog.at_level(logging.DEBUG):
+            state_machine.start("data")
+            state_machine.trigger_event(Event("event"), "data")
+            state_machine.trigger_event(Event("null"), "data")
+            state_machine.trigger_event(Event("event"), "data")
+        messages = [record.getMessage() for record in caplog.records]
+        assert messages == [
+            "Entering initial_state",
+            "NormalTransition from State=initial_state to "
+            "State=second_state caused by Event=event",
+            "Exiting initial_state",
+            "Entering second_state",
+            "NullTransition State=second_state",
+            "Event Event=event is not valid in state State=second_state",
+        ]
@@ -13,6 +13,7 @@ class TestTransition:
         assert transition.event == event
         assert transition.source_state == source_state
         assert transition.destination_state == destination_state
+        assert not hasattr(transition, "__dict__")
 
     def test_self_transition_constructor(self):
         source_state = State("source")
@@ -39,7 +40,7 @@ class TestTransition:
         destination_state.on_entry(entry_callback)
         event = Event("event")
         transition = NormalTransition(source_state, destination_state, event)
-        transition("data")
+        assert transition("data")
         entry_callback.assert_called_once_with("data")
         exit_callback.assert_called_once_with("data")
 
@@ -70,7 +71,7 @@ class TestTransition:
         transition = NormalTransition(source_state, destination_state, event)
         condition_callback = MagicMock(return_value=False)
         transition.add_condition(condition_callback)
-        transition("data")
+        assert not transition("data")
         entry_callback.assert_not_called()
         exit_callback.assert_not_called()
         condition_callback.assert_called_once_with("data")
@@ -195,3 +196,16 @@ class TestTransition:
         transition("data")
         condition_callback.assert_called_once_with("data")
         action_callback.assert_called_once_with("data")
+
+    def test_execute_skips_condition(self):
+        entry_callback = MagicMock()
+        source_state = State("source")
+        destination_state = State("destination")
+        destination_state.on_entry(entry_callback)
+        event = Event("event")
+        transition = NormalTransition(source_state, destination_state, event)
+        condition_callback = MagicMock(return_value=False)
+        transition.add_condition(condition_callback)
+        transition.execute("data")
+        condition_callback.assert_not_called()
+        entry_callback.assert_called_once_with("data")